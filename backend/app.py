@@ -8,8 +8,15 @@ from routes.users_routes import users_bp
 from routes.survival_routes import survival_bp
 from routes.auth_routes import auth_bp
 from routes.historical_analytics_routes import historical_analytics_bp
+from routes.metrics_routes import metrics_bp
+from routes.admin_routes import admin_bp
 from db import close_db
-from scheduler import setup_scheduler
+import metrics
+import request_context
+import tracing
+import profiling
+import memory_accounting
+from scheduler import setup_scheduler, shutdown_scheduler
 import atexit
 from create_indexes import create_indexes
 
@@ -75,6 +82,23 @@ def create_app():
     app.register_blueprint(analytics_bp)
     app.register_blueprint(survival_bp)
     app.register_blueprint(historical_analytics_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(admin_bp, url_prefix='/admin')
+    
+    # Give every request an id and attribute its queries to the endpoint
+    request_context.init_app(app)
+    
+    # Trace the stages of every request, export the sampled and the slow ones
+    tracing.init_app(app)
+    
+    # Record request latencies for /metrics
+    metrics.init_app(app)
+    
+    # Profile single requests on demand for admins
+    profiling.init_app(app)
+    
+    # Record per request memory and recycle workers above MEMORY_BUDGET_MB
+    memory_accounting.init_app(app)
     
     # Register teardown function for database connections
     app.teardown_appcontext(close_db)
@@ -90,10 +114,11 @@ def create_app():
 app = create_app()
 
 # Initialize the scheduler when the app starts
+# Every worker starts one, but only the leader lease holder runs the jobs
 scheduler = setup_scheduler(app)
 
-# Make sure to shut down the scheduler when the app closes
-atexit.register(lambda: scheduler.shutdown())
+# Make sure to shut down the scheduler (and release the leader lease) when the app closes
+atexit.register(lambda: shutdown_scheduler(scheduler))
 
 if __name__ == '__main__':
     # Create database indexes if they don't exist
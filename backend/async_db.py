@@ -0,0 +1,134 @@
+"""
+Concurrent MongoDB queries for fan-out endpoints.
+Analytics and the daily snapshot run dozens of independent counts. gather_queries
+sends them all at once through pymongo's AsyncMongoClient and waits for the
+results, so a request costs about the slowest query instead of the sum of all.
+
+    totals, churned = gather_queries([
+        Query("users", "count_documents", {}),
+        Query("users", "count_documents", {"Churn": "Yes"}),
+    ])
+
+The async client lives on one background event loop per process and any thread
+submits to it, so it works from the normal sync views and jobs, and
+gather_queries_async works from async code (Flask async views need
+flask[async]) whatever loop it runs on. A per-request loop, as Flask async views
+use, would throw away the client's connection pool on every request.
+The context of the caller (request id, source, trace) is carried over, so the
+queries still show up in /metrics, the slow query log and the traces.
+
+MONGO_ASYNC_QUERIES=false, or a pymongo without AsyncMongoClient, runs the same
+queries one after another on the sync client from db.get_db.
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+import threading
+import pymongo
+from db import get_db, mongo_uri, mongo_db_name, mongo_command_metrics, slow_query_log, tracing_listener
+
+MONGO_ASYNC_QUERIES = os.environ.get("MONGO_ASYNC_QUERIES", "true").lower() == "true"
+# Upper bound of one gather_queries call, the client's own timeouts usually fire first
+QUERY_TIMEOUT = float(os.environ.get("MONGO_ASYNC_TIMEOUT_SECONDS", 60))
+
+# Methods that return a cursor, their results are read into a list
+CURSOR_METHODS = {"find", "aggregate", "list_indexes"}
+
+class Query:
+    """One collection method call, e.g. Query("users", "distinct", "Contract")"""
+
+    def __init__(self, collection, method, *args, **kwargs):
+        self.collection = collection
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self, db):
+        result = getattr(db[self.collection], self.method)(*self.args, **self.kwargs)
+        return list(result) if self.method in CURSOR_METHODS else result
+
+    async def run_async(self, db):
+        result = getattr(db[self.collection], self.method)(*self.args, **self.kwargs)
+        if self.method in CURSOR_METHODS:
+            # find returns the cursor directly, aggregate a coroutine of it
+            cursor = await result if asyncio.iscoroutine(result) else result
+            return await cursor.to_list()
+        return await result
+
+class BackgroundLoop:
+    """An event loop in a daemon thread that owns the AsyncMongoClient"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.pid = os.getpid()
+        self.client = None
+        self.thread = threading.Thread(target=self.loop.run_forever, name="mongo-async", daemon=True)
+        self.thread.start()
+
+    def submit(self, coroutine):
+        """Schedule a coroutine in the caller's context, returns a concurrent future"""
+        context = contextvars.copy_context()
+        future = asyncio.run_coroutine_threadsafe(self._in_context(coroutine, context), self.loop)
+        return future
+
+    async def _in_context(self, coroutine, context):
+        # Run as a task of the caller's context, so the command listeners see its request id and trace
+        return await asyncio.get_running_loop().create_task(coroutine, context=context)
+
+    def stop(self):
+        """Close the client and stop the loop and its thread, the loop of the process lives until exit"""
+        if self.client is not None:
+            asyncio.run_coroutine_threadsafe(self.client.close(), self.loop).result(QUERY_TIMEOUT)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(QUERY_TIMEOUT)
+        self.loop.close()
+
+    def database(self):
+        # Only called on the loop thread, the client binds to the loop that first uses it
+        if self.client is None:
+            self.client = pymongo.AsyncMongoClient(
+                mongo_uri, event_listeners=[mongo_command_metrics, slow_query_log, tracing_listener])
+        return self.client[mongo_db_name]
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def background_loop():
+    """The loop of this process, a forked worker starts its own"""
+    global _loop
+    if _loop is None or _loop.pid != os.getpid():
+        with _loop_lock:
+            if _loop is None or _loop.pid != os.getpid():
+                _loop = BackgroundLoop()
+    return _loop
+
+def async_available():
+    return MONGO_ASYNC_QUERIES and hasattr(pymongo, "AsyncMongoClient")
+
+async def _gather(loop, queries):
+    db = loop.database()
+    return await asyncio.gather(*(query.run_async(db) for query in queries))
+
+def gather_queries(queries):
+    """Run independent queries concurrently, returns their results in order"""
+    queries = list(queries)
+    if not async_available():
+        db = get_db()
+        return [query.run(db) for query in queries]
+    loop = background_loop()
+    future = loop.submit(_gather(loop, queries))
+    try:
+        return future.result(QUERY_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+async def gather_queries_async(queries):
+    """gather_queries for async callers on any event loop"""
+    queries = list(queries)
+    if not async_available():
+        db = get_db()
+        return [query.run(db) for query in queries]
+    loop = background_loop()
+    return await asyncio.wait_for(asyncio.wrap_future(loop.submit(_gather(loop, queries))), QUERY_TIMEOUT)
@@ -0,0 +1,268 @@
+"""
+Benchmarks for the hot paths of the backend.
+Seeds a dedicated database on a local mongod with synthetic customers (see
+synthetic_customers) at each size (10k, 100k and 1M by default) and times
+prepare_survival_data, /analytics, Kaplan-Meier and Cox fitting, single and
+batched pipeline.predict_proba, get_users paging and the historical CSV export.
+
+Results are written as JSON. With --baseline they are compared to a stored run
+and the script exits with 1 when a benchmark got slower than the tolerance.
+
+Usage:
+    python benchmarks/bench_hot_paths.py [--sizes 10000,100000] [--repeat 5]
+                                         [--output results.json]
+                                         [--baseline baseline.json] [--tolerance 0.2]
+                                         [--save-baseline baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Make the backend modules importable when run as python benchmarks/<name>.py
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+SNAPSHOT_DAYS = 89
+PREDICT_BATCH_SIZE = 1000
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the backend hot paths against a local mongod")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="comma separated customer counts")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="churn_benchmark", help="dropped and reseeded for every size")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", default="", help="comma separated benchmark names to run")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown of the median before it counts as a regression")
+    parser.add_argument("--save-baseline", help="also write the results to this baseline file")
+    parser.add_argument("--keep-data", action="store_true", help="don't drop the benchmark database at the end")
+    return parser.parse_args()
+
+def seed_database(app, db, size, seed):
+    """Drop the benchmark database and load customers and historical snapshots"""
+    import scheduler
+    from index_advisor import ensure_indexes
+    from synthetic_customers import CustomerModel, iter_customers
+
+    db.client.drop_database(db.name)
+    model = CustomerModel.from_csv()
+    for batch in iter_customers(model, size, batch_size=50000, seed=seed):
+        db.users.insert_many(batch.to_dict('records'), ordered=False)
+    ensure_indexes(db)
+
+    # Capture one real snapshot and copy it back in time for the CSV export
+    scheduler.flask_app = app
+    scheduler.capture_daily_analytics()
+    today = db.historical_analytics.find_one(sort=[("timestamp", -1)])
+    db.historical_analytics.insert_many([
+        {"timestamp": today["timestamp"] - timedelta(days=day), "data": today["data"]}
+        for day in range(1, SNAPSHOT_DAYS + 1)
+    ])
+
+def build_app():
+    """A Flask app with the blueprints but without the scheduler app.py starts"""
+    from flask import Flask
+    from db import close_db
+    from routes.analytics_routes import analytics_bp
+    from routes.customer_routes import customer_bp
+    from routes.historical_analytics_routes import historical_analytics_bp
+    from routes.survival_routes import survival_bp
+    from routes.users_routes import users_bp
+
+    app = Flask(__name__)
+    for blueprint in (analytics_bp, customer_bp, historical_analytics_bp, survival_bp, users_bp):
+        app.register_blueprint(blueprint)
+    app.teardown_appcontext(close_db)
+    return app
+
+def build_benchmarks(app):
+    """name -> function running one iteration, or None when it can't run here"""
+    from lifelines import KaplanMeierFitter, CoxPHFitter
+    import pandas as pd
+    from routes.customer_routes import pipeline, MODEL_FEATURES
+    from routes.survival_routes import prepare_survival_data, COX_FEATURES
+    from routes.users_routes import get_users
+
+    client = app.test_client()
+    state = {}
+
+    def survival_frame():
+        # Fitting benchmarks exclude the load, it has its own benchmark
+        if "df" not in state:
+            with app.app_context():
+                state["df"] = prepare_survival_data()
+        return state["df"]
+
+    def model_frame(rows):
+        key = f"model_rows_{rows}"
+        if key not in state:
+            with app.app_context():
+                from db import get_db
+                users = list(get_db().users.find({}, {"_id": 0}).limit(rows))
+            state[key] = pd.DataFrame([{k: user.get(k, 0) for k in MODEL_FEATURES} for user in users])
+        return state[key]
+
+    def run_prepare_survival_data():
+        with app.app_context():
+            prepare_survival_data()
+
+    def run_analytics():
+        response = client.get('/analytics')
+        assert response.status_code == 200, response.status_code
+
+    def run_kaplan_meier():
+        df = survival_frame()
+        KaplanMeierFitter().fit(df['tenure'], df['event'])
+
+    def run_cox_fit():
+        df = survival_frame()
+        CoxPHFitter().fit(df[COX_FEATURES + ['tenure', 'event']], duration_col='tenure', event_col='event')
+
+    def run_predict_single():
+        pipeline.predict_proba(model_frame(1))
+
+    def run_predict_batch():
+        pipeline.predict_proba(model_frame(PREDICT_BATCH_SIZE))
+
+    def run_get_users_page():
+        # Call the view directly, the role check would need a seeded admin and a token
+        with app.test_request_context('/users?page=10&per_page=50&segment=high-value'):
+            response = get_users.__wrapped__(current_user={"username": "benchmark", "role": "admin"})
+            assert response.status_code == 200, response.status_code
+
+    def run_historical_csv_export():
+        response = client.get('/historical-analytics/csv?gzip=false')
+        assert response.status_code == 200, response.status_code
+        for _ in response.response:
+            pass
+
+    return {
+        "prepare_survival_data": run_prepare_survival_data,
+        "analytics": run_analytics,
+        "kaplan_meier_fit": run_kaplan_meier,
+        "cox_fit": run_cox_fit,
+        "predict_proba_single": run_predict_single if pipeline is not None else None,
+        "predict_proba_batch": run_predict_batch if pipeline is not None else None,
+        "get_users_page": run_get_users_page,
+        "historical_csv_export": run_historical_csv_export,
+    }
+
+def time_benchmark(func, repeat):
+    """One untimed warm-up run, then repeat timed runs"""
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "mean": statistics.mean(timings),
+        "runs": repeat
+    }
+
+def compare(results, baseline, tolerance):
+    """Returns the benchmarks whose median is slower than the baseline by more than tolerance"""
+    regressions = []
+    for key, result in results["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(key)
+        if not previous or "median" not in result or "median" not in previous:
+            continue
+        ratio = result["median"] / previous["median"] if previous["median"] else 0
+        result["baseline_median"] = previous["median"]
+        result["ratio"] = round(ratio, 3)
+        if ratio > 1 + tolerance:
+            regressions.append(f"{key}: {previous['median']:.4f}s -> {result['median']:.4f}s ({ratio:.2f}x)")
+    return regressions
+
+def main():
+    args = parse_args()
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    only = {name for name in args.only.split(",") if name}
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    save_baseline = os.path.abspath(args.save_baseline) if args.save_baseline else None
+
+    # db.py reads these at import time, so set them before any backend module is imported
+    os.environ["MONGO_URI"] = args.mongo_uri
+    os.environ["MONGO_DB_NAME"] = args.database
+    os.chdir(BACKEND_DIR)  # the prediction pipeline is loaded from the working directory
+
+    import pandas as pd
+    import lifelines
+    import pymongo
+    from db import get_db
+
+    app = build_app()
+
+    results = {
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "versions": {"pandas": pd.__version__, "lifelines": lifelines.__version__, "pymongo": pymongo.__version__},
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "benchmarks": {}
+    }
+
+    with app.app_context():
+        db = get_db()
+        results["mongodb"] = db.client.server_info().get("version")
+        for size in sizes:
+            print(f"Seeding {size} customers...")
+            seed_database(app, db, size, args.seed)
+            # Every size gets a fresh benchmark set, cached frames belong to the previous data
+            benchmarks = build_benchmarks(app)
+
+            for name, func in benchmarks.items():
+                if only and name not in only:
+                    continue
+                key = f"{name}@{size}"
+                if func is None:
+                    print(f"  {key}: skipped (no prediction model)")
+                    results["benchmarks"][key] = {"skipped": True}
+                    continue
+                result = time_benchmark(func, args.repeat)
+                results["benchmarks"][key] = result
+                print(f"  {key}: median {result['median']:.4f}s, min {result['min']:.4f}s")
+
+        if not args.keep_data:
+            db.client.drop_database(db.name)
+
+    exit_code = 0
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            exit_code = 1
+        else:
+            print("No regressions against the baseline")
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"Results written to {output}")
+
+    if save_baseline:
+        with open(save_baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {save_baseline}")
+
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+HTTP load generator for the gunicorn deployment.
+Replays a weighted mix of the dashboard endpoints from concurrent clients for a
+fixed duration and reports latency percentiles (p50/p95/p99), a latency
+histogram, throughput and error rates per route.
+
+Run it against a server that is already up, or let it start one:
+    python benchmarks/load_test.py --start-server --server-workers 4 \\
+        --concurrency 20 --duration 60 --username admin --password secret
+
+The mix is given as route=weight pairs, e.g. --mix users=5,analytics=3,csv_export=1.
+Routes: login, users, customer, analytics, survival_curve, survival_prediction, csv_export.
+Routes that need a token are skipped when no login is given.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import requests
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+DEFAULT_MIX = "login=1,users=5,customer=5,analytics=4,survival_curve=2,survival_prediction=1,csv_export=1"
+
+# Upper bounds of the latency histogram buckets in milliseconds, the last bucket is open
+HISTOGRAM_BOUNDS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+SAMPLE_CUSTOMER = {
+    "gender": "Female", "SeniorCitizen": 0, "Partner": "Yes", "Dependents": "No",
+    "MonthlyCharges": 70.35, "Contract": "Month-to-month", "PaperlessBilling": "Yes",
+    "PaymentMethod": "Electronic check", "InternetService": "Fiber optic"
+}
+
+def parse_mix(value):
+    mix = {}
+    for pair in value.split(","):
+        if not pair.strip():
+            continue
+        name, _, weight = pair.partition("=")
+        name = name.strip()
+        if name not in ROUTES:
+            raise ValueError(f"Unknown route '{name}', choose from {', '.join(ROUTES)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+# Every route gets (session, base_url, context, rng) and returns the response
+def request_login(session, base_url, context, rng):
+    return session.post(f"{base_url}/auth/login", json=context["credentials"], timeout=context["timeout"])
+
+def request_users(session, base_url, context, rng):
+    params = {"page": rng.randint(1, context["user_pages"]), "per_page": 50}
+    segment = rng.choice([None, "high-value", "long-term", "new", "active"])
+    if segment:
+        params["segment"] = segment
+    return session.get(f"{base_url}/users", params=params, headers=context["auth_headers"], timeout=context["timeout"])
+
+def request_customer(session, base_url, context, rng):
+    customer_id = rng.choice(context["customer_ids"])
+    return session.get(f"{base_url}/customer/{customer_id}", timeout=context["timeout"])
+
+def request_analytics(session, base_url, context, rng):
+    year = rng.choice([None] + context["years"])
+    params = {"year": year} if year else {}
+    return session.get(f"{base_url}/analytics", params=params, timeout=context["timeout"])
+
+def request_survival_curve(session, base_url, context, rng):
+    return session.get(f"{base_url}/survival-curve", timeout=context["timeout"])
+
+def request_survival_prediction(session, base_url, context, rng):
+    return session.post(f"{base_url}/survival-prediction", json=SAMPLE_CUSTOMER, timeout=context["timeout"])
+
+def request_csv_export(session, base_url, context, rng):
+    # Read the whole body, the export streams and the latency should cover all of it
+    response = session.get(f"{base_url}/historical-analytics/csv", timeout=context["timeout"], stream=True)
+    for _ in response.iter_content(chunk_size=65536):
+        pass
+    return response
+
+ROUTES = {
+    "login": request_login,
+    "users": request_users,
+    "customer": request_customer,
+    "analytics": request_analytics,
+    "survival_curve": request_survival_curve,
+    "survival_prediction": request_survival_prediction,
+    "csv_export": request_csv_export,
+}
+
+class RouteStats:
+    """Latencies and outcomes of one route, kept per client thread and merged at the end"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.status_codes = {}
+
+    def record(self, latency, status, ok):
+        self.latencies.append(latency)
+        self.status_codes[status] = self.status_codes.get(status, 0) + 1
+        if not ok:
+            self.errors += 1
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        self.errors += other.errors
+        for status, count in other.status_codes.items():
+            self.status_codes[status] = self.status_codes.get(status, 0) + count
+
+    def summary(self, elapsed):
+        count = len(self.latencies)
+        if not count:
+            return {"requests": 0}
+        latencies_ms = np.array(self.latencies) * 1000
+        p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+        histogram = np.bincount(np.searchsorted(HISTOGRAM_BOUNDS_MS, latencies_ms),
+                                minlength=len(HISTOGRAM_BOUNDS_MS) + 1)
+        labels = [f"<={bound}ms" for bound in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}ms"]
+        return {
+            "requests": count,
+            "throughput": round(count / elapsed, 2),
+            "errors": self.errors,
+            "error_rate": round(self.errors / count, 4),
+            "status_codes": {str(status): n for status, n in sorted(self.status_codes.items(), key=lambda item: str(item[0]))},
+            "latency_ms": {
+                "p50": round(p50, 2), "p95": round(p95, 2), "p99": round(p99, 2),
+                "mean": round(latencies_ms.mean(), 2), "max": round(latencies_ms.max(), 2)
+            },
+            "histogram": dict(zip(labels, histogram.tolist()))
+        }
+
+def run_client(number, args, context, mix, warmup_end, deadline, results):
+    rng = random.Random(args.seed + number)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    stats = {name: RouteStats() for name in names}
+    session = requests.Session()
+
+    while time.time() < deadline:
+        name = rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            response = ROUTES[name](session, args.base_url, context, rng)
+            status, ok = response.status_code, response.status_code < 400
+        except requests.RequestException as e:
+            status, ok = type(e).__name__, False
+        latency = time.perf_counter() - start
+
+        # Requests of the warm-up period are not counted
+        if time.time() >= warmup_end:
+            stats[name].record(latency, status, ok)
+        if args.think_time:
+            time.sleep(rng.uniform(0, 2 * args.think_time))
+
+    session.close()
+    results.append(stats)
+
+def prepare_context(args, mix):
+    """Log in once and collect customer IDs, drop routes that can't run"""
+    context = {"timeout": args.timeout, "auth_headers": {}, "customer_ids": [], "user_pages": 1,
+               "years": [str(year) for year in range(datetime.now().year - 4, datetime.now().year + 1)],
+               "credentials": {"username": args.username, "password": args.password}}
+
+    if args.username and args.password:
+        response = requests.post(f"{args.base_url}/auth/login", json=context["credentials"], timeout=args.timeout)
+        if response.status_code != 200:
+            raise ValueError(f"Login as {args.username} failed with status {response.status_code}")
+        context["auth_headers"] = {"Authorization": f"Bearer {response.json()['token']}"}
+
+        response = requests.get(f"{args.base_url}/users", params={"per_page": 500},
+                                headers=context["auth_headers"], timeout=args.timeout)
+        response.raise_for_status()
+        body = response.json()
+        context["customer_ids"] = [user["customerID"] for user in body["users"]]
+        context["user_pages"] = max(1, body["pagination"]["total"] // 50)
+    else:
+        for name in ("login", "users", "customer"):
+            if mix.pop(name, None) is not None:
+                print(f"Skipping {name}: needs --username and --password")
+
+    if "customer" in mix and not context["customer_ids"]:
+        mix.pop("customer")
+        print("Skipping customer: no customers in the database")
+    if not mix:
+        raise ValueError("No routes left to run")
+    return context
+
+def start_server(args):
+    """Start gunicorn app:app and wait until it answers"""
+    command = ["gunicorn", "app:app", "--bind", f"127.0.0.1:{args.port}",
+               "--workers", str(args.server_workers), "--timeout", str(int(args.timeout) + 30)]
+    print(f"Starting {' '.join(command)}")
+    server = subprocess.Popen(command, cwd=BACKEND_DIR)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {server.returncode}")
+        try:
+            requests.get(f"{args.base_url}/auth/verify-token", timeout=1)
+            return server
+        except requests.RequestException:
+            time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("gunicorn did not start within 60 seconds")
+
+def print_report(report):
+    header = f"{'route':<20}{'requests':>10}{'req/s':>9}{'errors':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, summary in list(report["routes"].items()) + [("total", report["total"])]:
+        if not summary["requests"]:
+            print(f"{name:<20}{0:>10}")
+            continue
+        latency = summary["latency_ms"]
+        print(f"{name:<20}{summary['requests']:>10}{summary['throughput']:>9.1f}"
+              f"{summary['error_rate']:>8.1%} {latency['p50']:>10.1f}{latency['p95']:>10.1f}"
+              f"{latency['p99']:>10.1f}{latency['max']:>10.1f}")
+
+def run(args):
+    mix = parse_mix(args.mix)
+    server = start_server(args) if args.start_server else None
+    try:
+        context = prepare_context(args, mix)
+        print(f"Running {args.concurrency} clients for {args.duration}s (+{args.warmup}s warm-up): "
+              f"{', '.join(f'{name}={weight:g}' for name, weight in mix.items())}")
+
+        results = []
+        warmup_end = time.time() + args.warmup
+        deadline = warmup_end + args.duration
+        threads = [
+            threading.Thread(target=run_client, args=(number, args, context, mix, warmup_end, deadline, results))
+            for number in range(args.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - warmup_end
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+
+    merged = {name: RouteStats() for name in mix}
+    total = RouteStats()
+    for stats in results:
+        for name, route_stats in stats.items():
+            merged[name].merge(route_stats)
+            total.merge(route_stats)
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "base_url": args.base_url,
+        "concurrency": args.concurrency,
+        "duration": round(elapsed, 2),
+        "mix": mix,
+        "routes": {name: stats.summary(elapsed) for name, stats in merged.items()},
+        "total": total.summary(elapsed)
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the backend endpoints")
+    parser.add_argument("--base-url", help="server to test (default http://127.0.0.1:PORT)")
+    parser.add_argument("--start-server", action="store_true", help="start gunicorn app:app for the run")
+    parser.add_argument("--port", type=int, default=8000, help="port of the started server")
+    parser.add_argument("--server-workers", type=int, default=4, help="gunicorn workers of the started server")
+    parser.add_argument("--concurrency", type=int, default=10, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds before measuring starts")
+    parser.add_argument("--think-time", type=float, default=0, help="mean pause between requests of a client")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="route=weight pairs")
+    parser.add_argument("--username", default=os.environ.get("LOAD_TEST_USERNAME"))
+    parser.add_argument("--password", default=os.environ.get("LOAD_TEST_PASSWORD"))
+    parser.add_argument("--timeout", type=float, default=60, help="request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_test_results.json")
+    args = parser.parse_args()
+    args.base_url = (args.base_url or f"http://127.0.0.1:{args.port}").rstrip("/")
+
+    try:
+        report = run(args)
+    except Exception as e:
+        print(f"Load test failed: {e}")
+        sys.exit(1)
+    if not report["total"]["requests"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
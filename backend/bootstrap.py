@@ -0,0 +1,176 @@
+"""
+Bootstrap confidence intervals of the Cox risk factors.
+/risk-factors reports the asymptotic intervals of a single fit, which assume
+the model is right and the sample is large. The bootstrap refits the model on
+BOOTSTRAP_RESAMPLES resamples of the customers (drawn with replacement) across
+a pool of processes and takes percentile intervals of the hazard ratios.
+
+Every resample has its own seed spawned from BOOTSTRAP_SEED, so a run gives the
+same intervals whatever the number of processes. Results are stored in
+risk_factor_bootstrap per data version (see data_version): the first request
+for a data version claims it and computes it in a background thread, later ones
+(in any worker) read the stored intervals. A claim left by a worker that died
+is taken over after BOOTSTRAP_TIMEOUT_SECONDS, a failed run is retried after
+FAILED_RETRY_SECONDS.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from db import get_db
+from survival_model import fit_scorer
+
+logger = logging.getLogger(__name__)
+
+BOOTSTRAP_RESAMPLES = int(os.environ.get("SURVIVAL_BOOTSTRAP_RESAMPLES", 200))
+BOOTSTRAP_SEED = int(os.environ.get("SURVIVAL_BOOTSTRAP_SEED", 0))
+BOOTSTRAP_WORKERS = int(os.environ.get("SURVIVAL_BOOTSTRAP_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+BOOTSTRAP_TIMEOUT_SECONDS = float(os.environ.get("SURVIVAL_BOOTSTRAP_TIMEOUT_SECONDS", 3600))
+BOOTSTRAP_CONFIDENCE = 0.95
+# Fewer successful refits than this share of the resamples and the run is failed
+MIN_SUCCESSFUL_SHARE = 0.9
+# A failed run is tried again after this long
+FAILED_RETRY_SECONDS = 600
+
+# Set in every pool process once, instead of sending the customers with every chunk
+_frame = None
+_features = None
+
+def _init_worker(frame, features):
+    global _frame, _features
+    _frame, _features = frame, features
+
+def fit_resamples(seeds, initial_coefficients=None, frame=None, features=None):
+    """Coefficients of one refit per seed, None where the fit failed"""
+    frame = _frame if frame is None else frame
+    features = _features if features is None else features
+    results = []
+    for seed in seeds:
+        rows = np.random.default_rng(seed).integers(0, len(frame), len(frame))
+        try:
+            scorer = fit_scorer(frame.iloc[rows], features, initial_coefficients)
+            results.append(scorer.coefficients.tolist())
+        except Exception as e:
+            # A resample without events in a rare category does not converge
+            logger.warning(f"Bootstrap refit failed: {e}")
+            results.append(None)
+    return results
+
+def resample_seeds(seed, resamples):
+    return np.random.SeedSequence(seed).spawn(resamples)
+
+def bootstrap_coefficients(frame, features, resamples=BOOTSTRAP_RESAMPLES, seed=BOOTSTRAP_SEED,
+                           workers=BOOTSTRAP_WORKERS, initial_coefficients=None):
+    """Coefficients of the successful refits, one row per resample"""
+    features = list(features)
+    frame = frame[features + ['tenure', 'event']].reset_index(drop=True)
+    seeds = resample_seeds(seed, resamples)
+    if workers <= 1:
+        results = fit_resamples(seeds, initial_coefficients, frame, features)
+    else:
+        # A few chunks per process keeps them all busy until the end
+        chunks = [list(chunk) for chunk in np.array_split(np.array(seeds, dtype=object), workers * 4) if len(chunk)]
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(workers, initializer=_init_worker, initargs=(frame, features)) as pool:
+            pending = pool.starmap_async(fit_resamples, [(chunk, initial_coefficients) for chunk in chunks])
+            results = [row for chunk in pending.get(BOOTSTRAP_TIMEOUT_SECONDS) for row in chunk]
+    coefficients = [row for row in results if row is not None]
+    return np.array(coefficients, dtype=float).reshape(-1, len(features))
+
+def percentile_intervals(coefficients, confidence=BOOTSTRAP_CONFIDENCE):
+    """Lower and upper percentile bounds of every coefficient and its bootstrap standard error"""
+    tail = (1 - confidence) / 2 * 100
+    lower, upper = np.percentile(coefficients, [tail, 100 - tail], axis=0)
+    return lower, upper, coefficients.std(axis=0, ddof=1)
+
+def run_id(data_version):
+    # One document per run, so the _id index turns away a second claim
+    return f"{data_version}:{BOOTSTRAP_SEED}:{BOOTSTRAP_RESAMPLES}"
+
+def run_key(data_version):
+    return {"data_version": data_version, "seed": BOOTSTRAP_SEED, "resamples": BOOTSTRAP_RESAMPLES}
+
+def load_bootstrap(db, data_version):
+    return db.risk_factor_bootstrap.find_one({"_id": run_id(data_version)}, {"_id": 0})
+
+def claim_bootstrap(db, data_version):
+    """True when this process should compute the data version, False when it is done or running elsewhere"""
+    now = datetime.now()
+    try:
+        previous = db.risk_factor_bootstrap.find_one_and_update(
+            {"_id": run_id(data_version), "$or": [
+                {"status": "failed", "started_at": {"$lt": now - timedelta(seconds=FAILED_RETRY_SECONDS)}},
+                {"status": "running", "started_at": {"$lt": now - timedelta(seconds=BOOTSTRAP_TIMEOUT_SECONDS)}}
+            ]},
+            {"$set": {"status": "running", "started_at": now}},
+            return_document=ReturnDocument.BEFORE)
+        if previous is not None:
+            return True
+        db.risk_factor_bootstrap.insert_one({"_id": run_id(data_version), **run_key(data_version),
+                                             "status": "running", "started_at": now})
+        return True
+    except DuplicateKeyError:
+        return False
+
+def compute_bootstrap(db, df, data_version, features, initial_coefficients=None):
+    """Refit on the resamples and store the intervals of the data version"""
+    features = list(features)
+    key = {"_id": run_id(data_version)}
+    try:
+        start_time = time.perf_counter()
+        coefficients = bootstrap_coefficients(df, features, initial_coefficients=initial_coefficients)
+        if len(coefficients) < MIN_SUCCESSFUL_SHARE * BOOTSTRAP_RESAMPLES:
+            raise RuntimeError(f"Only {len(coefficients)} of {BOOTSTRAP_RESAMPLES} refits converged")
+        lower, upper, std_error = percentile_intervals(coefficients)
+    except Exception as e:
+        logger.error(f"Bootstrap of the risk factors failed: {e}")
+        db.risk_factor_bootstrap.update_one(key, {"$set": {"status": "failed", "error": str(e)}})
+        return None
+
+    result = {
+        "status": "done",
+        "computed_at": datetime.now(),
+        "seconds": round(time.perf_counter() - start_time, 3),
+        "successful_resamples": int(len(coefficients)),
+        "confidence": BOOTSTRAP_CONFIDENCE,
+        "factors": {
+            feature: {
+                "lower_ci": float(np.exp(lower[index])),
+                "upper_ci": float(np.exp(upper[index])),
+                "std_error": float(std_error[index])
+            }
+            for index, feature in enumerate(features)
+        }
+    }
+    db.risk_factor_bootstrap.update_one(key, {"$set": result})
+    logger.info(f"Bootstrapped the risk factors of data version {data_version} in {result['seconds']}s")
+    return result
+
+_running = set()
+_running_lock = threading.Lock()
+
+def start_bootstrap(app, load_data, data_version, features, initial_coefficients=None):
+    """Compute the data version in a background thread unless it is done or running elsewhere"""
+    with _running_lock:
+        if data_version in _running:
+            return
+        _running.add(data_version)
+
+    def run():
+        try:
+            with app.app_context():
+                db = get_db()
+                if claim_bootstrap(db, data_version):
+                    compute_bootstrap(db, load_data(), data_version, features, initial_coefficients)
+        except Exception as e:
+            logger.error(f"Bootstrap of the risk factors failed: {e}")
+        finally:
+            with _running_lock:
+                _running.discard(data_version)
+
+    threading.Thread(target=run, name="risk-factor-bootstrap", daemon=True).start()
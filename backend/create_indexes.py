@@ -2,8 +2,11 @@ import pymongo
 import os
 from dotenv import load_dotenv
 import time
-# This script optimizes database performance by creating mongoDB indexes (7 different indexes)
+from index_advisor import ensure_indexes
+# This script optimizes database performance by creating mongoDB indexes
 # Improve query performance for frequently accessed fields
+# The indexes themselves are declared in index_advisor.REQUIRED_INDEXES, the scheduler
+# leader also creates them at startup, so running this by hand is optional
 
 # Load environment variables
 load_dotenv()
@@ -19,55 +22,16 @@ def create_indexes():
     
     # Connect to MongoDB
     client = pymongo.MongoClient(mongo_uri)
-    db = client.churn_database
-    users_collection = db.users
+    db = client[os.environ.get("MONGO_DB_NAME", "churn_database")]
     
-    # Create indexes for frequently queried fields
-    index_results = []
+    # Create the declared indexes that don't exist yet
+    created = ensure_indexes(db)
     
-    # Primary key index
-    index_results.append(
-        users_collection.create_index([("customerID", pymongo.ASCENDING)], unique=True)
-    )
-    
-    # Churn status index - frequently used for filtering
-    index_results.append(
-        users_collection.create_index([("Churn", pymongo.ASCENDING)])
-    )
-    
-    # MonthlyCharges index - used for high value customer segmentation
-    index_results.append(
-        users_collection.create_index([("MonthlyCharges", pymongo.ASCENDING)])
-    )
-    
-    # Tenure index - used for customer tenure segmentation
-    index_results.append(
-        users_collection.create_index([("tenure", pymongo.ASCENDING)])
-    )
-    
-    # Index for mid term segment queries (both tenure and MonthlyCharges)
-    index_results.append(
-        users_collection.create_index([
-            ("tenure", pymongo.ASCENDING),
-            ("MonthlyCharges", pymongo.ASCENDING)
-        ])
-    )
-    
-    # Index for payment method queries
-    index_results.append(
-        users_collection.create_index([("PaymentMethod", pymongo.ASCENDING)])
-    )
-    
-    # Index for contract type queries
-    index_results.append(
-        users_collection.create_index([("Contract", pymongo.ASCENDING)])
-    )
-    
-    print(f"Created {len(index_results)} indexes in {time.time() - start_time:.2f} seconds")
+    print(f"Created {len(created)} indexes in {time.time() - start_time:.2f} seconds")
     
     # List all indexes to check if they were created
     print("\nCurrent indexes:")
-    for index in users_collection.list_indexes():
+    for index in db.users.list_indexes():
         print(f"  - {index['name']}: {index['key']}")
     
     client.close()
@@ -0,0 +1,162 @@
+"""
+Declared schema for customer documents in the users collection.
+The same field definitions drive the API validation of incoming customer JSON
+and the MongoDB $jsonSchema validator, so numeric fields are always stored as
+numbers and aggregations can $sum them directly.
+"""
+import re
+from datetime import datetime
+
+YES_NO = ['Yes', 'No']
+INTERNET_ADDON = ['Yes', 'No', 'No internet service']
+
+# field name -> definition; type is one of string, int or double
+CUSTOMER_FIELDS = {
+    'customerID': {'type': 'string'},
+    'gender': {'type': 'string', 'enum': ['Male', 'Female']},
+    'SeniorCitizen': {'type': 'int', 'enum': [0, 1]},
+    'Partner': {'type': 'string', 'enum': YES_NO},
+    'Dependents': {'type': 'string', 'enum': YES_NO},
+    'tenure': {'type': 'int', 'minimum': 0},
+    'PhoneService': {'type': 'string', 'enum': YES_NO},
+    'MultipleLines': {'type': 'string', 'enum': ['Yes', 'No', 'No phone service']},
+    'InternetService': {'type': 'string', 'enum': ['DSL', 'Fiber optic', 'No']},
+    'OnlineSecurity': {'type': 'string', 'enum': INTERNET_ADDON},
+    'OnlineBackup': {'type': 'string', 'enum': INTERNET_ADDON},
+    'DeviceProtection': {'type': 'string', 'enum': INTERNET_ADDON},
+    'TechSupport': {'type': 'string', 'enum': INTERNET_ADDON},
+    'StreamingTV': {'type': 'string', 'enum': INTERNET_ADDON},
+    'StreamingMovies': {'type': 'string', 'enum': INTERNET_ADDON},
+    'Contract': {'type': 'string', 'enum': ['Month-to-month', 'One year', 'Two year']},
+    'PaperlessBilling': {'type': 'string', 'enum': YES_NO},
+    'PaymentMethod': {'type': 'string', 'enum': [
+        'Electronic check', 'Mailed check', 'Bank transfer (automatic)', 'Credit card (automatic)'
+    ]},
+    'MonthlyCharges': {'type': 'double', 'minimum': 0},
+    'TotalCharges': {'type': 'double', 'minimum': 0},
+    'Churn': {'type': 'string', 'enum': YES_NO},
+    'join_date': {'type': 'string', 'pattern': r'^\d{4}-\d{2}-\d{2}$'},
+    'joinDate': {'type': 'string', 'pattern': r'^\d{4}-\d{2}-\d{2}$'},
+}
+
+# Fields every stored customer must have
+REQUIRED_FIELDS = ['customerID', 'tenure', 'MonthlyCharges', 'TotalCharges', 'Churn']
+
+INT_FIELDS = [name for name, field in CUSTOMER_FIELDS.items() if field['type'] == 'int']
+DOUBLE_FIELDS = [name for name, field in CUSTOMER_FIELDS.items() if field['type'] == 'double']
+
+BSON_TYPES = {
+    'string': 'string',
+    'int': ['int', 'long'],
+    'double': 'double'
+}
+
+class CustomerValidationError(ValueError):
+    def __init__(self, errors):
+        super().__init__("Invalid customer data")
+        self.errors = errors
+
+def coerce_value(name, value):
+    """Convert a JSON value to the declared type of the field, raises ValueError when it can't"""
+    field_type = CUSTOMER_FIELDS[name]['type']
+
+    if isinstance(value, bool):
+        raise ValueError("must not be a boolean")
+
+    if field_type == 'string':
+        if not isinstance(value, str):
+            raise ValueError("must be a string")
+        return value
+
+    if isinstance(value, str):
+        value = value.strip()
+        if value == '' and field_type == 'double':
+            # Blank charges (e.g. TotalCharges of a brand new customer) mean 0
+            return 0.0
+
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("must be a number")
+
+    if field_type == 'int':
+        if not number.is_integer():
+            raise ValueError("must be a whole number")
+        return int(number)
+    return number
+
+def validate_customer(data, partial=False):
+    """
+    Validate and coerce customer JSON coming from the API.
+    partial=True validates an update, where only the given fields are checked.
+    Returns the cleaned document or raises CustomerValidationError with per field messages.
+    """
+    if not isinstance(data, dict):
+        raise CustomerValidationError({'_': 'Customer data must be a JSON object'})
+
+    errors = {}
+    cleaned = {}
+    for name, value in data.items():
+        field = CUSTOMER_FIELDS.get(name)
+        if field is None:
+            errors[name] = 'Unknown field'
+            continue
+
+        try:
+            value = coerce_value(name, value)
+        except ValueError as e:
+            errors[name] = f"{name} {e}"
+            continue
+
+        if 'enum' in field and value not in field['enum']:
+            errors[name] = f"{name} must be one of {field['enum']}"
+        elif 'minimum' in field and value < field['minimum']:
+            errors[name] = f"{name} must be at least {field['minimum']}"
+        elif 'pattern' in field and not re.match(field['pattern'], value):
+            errors[name] = f"{name} must use the YYYY-MM-DD format"
+        elif 'pattern' in field:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+                cleaned[name] = value
+            except ValueError:
+                errors[name] = f"{name} is not a valid date"
+        else:
+            cleaned[name] = value
+
+    if not partial:
+        for name in REQUIRED_FIELDS:
+            if name not in cleaned and name not in errors:
+                errors[name] = f"{name} is required"
+
+    if errors:
+        raise CustomerValidationError(errors)
+    return cleaned
+
+def customer_json_schema():
+    """Build the MongoDB $jsonSchema validator from the declared fields"""
+    properties = {}
+    for name, field in CUSTOMER_FIELDS.items():
+        definition = {'bsonType': BSON_TYPES[field['type']]}
+        for key in ('enum', 'minimum', 'pattern'):
+            if key in field:
+                definition[key] = field[key]
+        properties[name] = definition
+
+    return {
+        '$jsonSchema': {
+            'bsonType': 'object',
+            'required': REQUIRED_FIELDS,
+            'properties': properties
+        }
+    }
+
+def apply_customer_validator(db, validation_level='strict'):
+    """Install (or update) the $jsonSchema validator on the users collection"""
+    if 'users' not in db.list_collection_names():
+        db.create_collection('users')
+    db.command({
+        'collMod': 'users',
+        'validator': customer_json_schema(),
+        'validationLevel': validation_level,
+        'validationAction': 'error'
+    })
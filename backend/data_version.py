@@ -0,0 +1,22 @@
+"""
+Data version of the customers.
+Every write that changes customers increments a counter in the data_versions
+collection. Results derived from the customers (the published Cox model, the
+bootstrap intervals) record the version they were computed from, so it is
+cheap to tell how far the data has moved since.
+"""
+from pymongo import ReturnDocument
+
+DATA_VERSIONS_COLLECTION = "data_versions"
+
+def bump_data_version(db, changes=1, name="users"):
+    """Count changes to a collection, returns the new version"""
+    if changes <= 0:
+        return current_data_version(db, name)
+    document = db[DATA_VERSIONS_COLLECTION].find_one_and_update(
+        {"_id": name}, {"$inc": {"version": changes}}, upsert=True, return_document=ReturnDocument.AFTER)
+    return document["version"]
+
+def current_data_version(db, name="users"):
+    document = db[DATA_VERSIONS_COLLECTION].find_one({"_id": name})
+    return document["version"] if document else 0
@@ -1,7 +1,11 @@
 import os
+import threading
 import pymongo
 from dotenv import load_dotenv
-from flask import g
+from flask import g, current_app
+from metrics import MongoCommandMetrics
+from slow_query_log import SlowQueryLog
+from tracing import TracingCommandListener
 # This file managaes database connectivity using mongoDB
 
 # Load environment variables
@@ -13,11 +17,37 @@ mongo_uri = os.environ.get("MONGO_URI")
 if not mongo_uri:
     raise ValueError("No MONGO_URI environment variable set.")
 
+# Database name, overridable so benchmarks and experiments don't touch the real data
+mongo_db_name = os.environ.get("MONGO_DB_NAME", "churn_database")
+
+_client_lock = threading.Lock()
+
+# Times every command for /metrics
+mongo_command_metrics = MongoCommandMetrics()
+
+# Records slow commands with the route that issued them
+slow_query_log = SlowQueryLog()
+
+# Adds every command of a traced request as a span
+tracing_listener = TracingCommandListener()
+
+# Function to get the MongoClient shared by every request and job of the app
+# MongoClient is thread safe and pools its connections, so one per app is enough
+def get_client():
+    client = current_app.extensions.get('mongo_client')
+    if client is None:
+        with _client_lock:
+            client = current_app.extensions.get('mongo_client')
+            if client is None:
+                client = pymongo.MongoClient(mongo_uri, event_listeners=[mongo_command_metrics, slow_query_log, tracing_listener])
+                current_app.extensions['mongo_client'] = client
+                slow_query_log.start(getattr(client, mongo_db_name))
+    return client
+
 # Function to get the MongoDB connection
 def get_db():
     if 'db' not in g:
-        client = pymongo.MongoClient(mongo_uri)
-        g.db = client.churn_database 
+        g.db = getattr(get_client(), mongo_db_name)
     return g.db
 
 # Function to close the MongoDB connection
@@ -0,0 +1,213 @@
+"""
+Retention tiers for the historical analytics snapshots.
+Raw daily snapshots expire through a TTL index, while every closed day is folded
+into weekly and monthly rollup documents (count, sum, min and max of each metric)
+so long range trends can still be served after the raw documents are gone.
+A metric missing from some snapshots has its own count (n), its mean is sum / n.
+"""
+import os
+import logging
+from datetime import datetime, timedelta
+import pymongo
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# How long raw daily snapshots are kept before the TTL monitor removes them
+RAW_RETENTION_DAYS = int(os.environ.get("HISTORICAL_RAW_RETENTION_DAYS", 90))
+
+# Ranges longer than this are served from the monthly instead of the weekly tier
+WEEKLY_TIER_MAX_DAYS = 730
+
+ROLLUP_PERIODS = ('week', 'month')
+
+def ensure_historical_indexes(db):
+    """Create the TTL index on raw snapshots and the rollup key index (idempotent)"""
+    historical_collection = db.historical_analytics
+    ttl_seconds = RAW_RETENTION_DAYS * 24 * 60 * 60
+
+    existing = None
+    for index in historical_collection.list_indexes():
+        if list(index['key'].items()) == [('timestamp', 1)]:
+            existing = index
+            break
+
+    if existing is None:
+        historical_collection.create_index([("timestamp", pymongo.ASCENDING)], expireAfterSeconds=ttl_seconds)
+    elif existing.get('expireAfterSeconds') != ttl_seconds:
+        try:
+            # Turn the plain timestamp index into a TTL index (or change its expiry) in place
+            db.command('collMod', 'historical_analytics', index={
+                'keyPattern': {'timestamp': 1},
+                'expireAfterSeconds': ttl_seconds
+            })
+        except OperationFailure:
+            # Older servers cannot convert a plain index, so rebuild it
+            historical_collection.drop_index(existing['name'])
+            historical_collection.create_index([("timestamp", pymongo.ASCENDING)], expireAfterSeconds=ttl_seconds)
+
+    db.historical_rollups.create_index(
+        [("period", pymongo.ASCENDING), ("period_start", pymongo.ASCENDING)],
+        unique=True
+    )
+
+def store_daily_snapshot(db, day, data):
+    """
+    Write the snapshot of a day, keyed on the day through _id so two leaders that
+    overlap during a lease handover update the same document instead of adding one.
+    Returns True when the document was created.
+    """
+    snapshot_id = day.strftime('%Y-%m-%d')
+    update = {"$set": {"timestamp": day, "data": data}}
+    try:
+        result = db.historical_analytics.update_one({"_id": snapshot_id}, update, upsert=True)
+        return result.upserted_id is not None
+    except DuplicateKeyError:
+        # The other leader inserted it between our lookup and insert, update theirs
+        db.historical_analytics.update_one({"_id": snapshot_id}, update)
+        return False
+
+def get_period_bounds(day, period):
+    """Return the [start, end) datetimes of the week (Monday based) or month containing day"""
+    day = day.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'week':
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=7)
+    if period == 'month':
+        start = day.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1)
+        return start, end
+    raise ValueError(f"Unknown rollup period: {period}")
+
+def flatten_metrics(data, prefix=''):
+    """Flatten a snapshot's nested data into {dotted.path: number}"""
+    metrics = {}
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten_metrics(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[path] = value
+    return metrics
+
+def fold_snapshot(db, snapshot):
+    """
+    Add one closed day's snapshot to its weekly and monthly rollups.
+    The day is remembered on each rollup so folding the same day twice is a no-op.
+    """
+    day = snapshot['timestamp'].replace(hour=0, minute=0, second=0, microsecond=0)
+    metrics = flatten_metrics(snapshot.get('data', {}))
+
+    for period in ROLLUP_PERIODS:
+        period_start, period_end = get_period_bounds(day, period)
+        update = {
+            "$inc": {"count": 1},
+            "$min": {},
+            "$max": {},
+            "$push": {"days": day},
+            "$setOnInsert": {"period_end": period_end}
+        }
+        for path, value in metrics.items():
+            update["$inc"][f"n.{path}"] = 1
+            update["$inc"][f"sum.{path}"] = value
+            update["$min"][f"min.{path}"] = value
+            update["$max"][f"max.{path}"] = value
+        if not metrics:
+            del update["$min"], update["$max"]
+
+        try:
+            db.historical_rollups.update_one(
+                {"period": period, "period_start": period_start, "days": {"$ne": day}},
+                update,
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # The rollup already exists and already contains this day
+            pass
+
+def roll_up_closed_days(db, today_start, match=None):
+    """Fold every snapshot before today that has not been rolled up yet, match narrows them down"""
+    historical_collection = db.historical_analytics
+    query = {"timestamp": {"$lt": today_start}, "rolled_up": {"$ne": True}}
+    if match:
+        query = {"$and": [query, match]}
+    pending = historical_collection.find(query, {"timestamp": 1, "data": 1}).sort("timestamp", 1)
+
+    folded = 0
+    for snapshot in pending:
+        fold_snapshot(db, snapshot)
+        historical_collection.update_one({"_id": snapshot["_id"]}, {"$set": {"rolled_up": True}})
+        folded += 1
+
+    if folded:
+        logger.info(f"Rolled up {folded} closed daily snapshots")
+    return folded
+
+def choose_tier(start, end, now=None):
+    """
+    Pick the cheapest tier that covers the range.
+    Raw snapshots only exist for the retention window, older or longer ranges use rollups.
+    """
+    if start is None:
+        return 'raw'
+
+    now = now or datetime.now()
+    end = end or now
+    span_days = (end - start).days
+    if start >= now - timedelta(days=RAW_RETENTION_DAYS) and span_days <= RAW_RETENTION_DAYS:
+        return 'raw'
+    if span_days <= WEEKLY_TIER_MAX_DAYS:
+        return 'week'
+    return 'month'
+
+def projected_paths(metrics):
+    """
+    The metric paths to project, without the ones a requested parent already covers:
+    MongoDB rejects a projection of both revenue and revenue.monthly as a path collision.
+    """
+    paths = sorted(set(metrics))
+    return [path for path in paths
+            if not any(path.startswith(f"{parent}.") for parent in paths)]
+
+def find_rollups(db, period, start, end, metrics):
+    """
+    Read rollups of one period overlapping [start, end) and return the period starts
+    plus mean, min and max arrays for each metric.
+    """
+    query = {"period": period}
+    if start:
+        query["period_end"] = {"$gt": start}
+    if end:
+        query["period_start"] = {"$lt": end}
+
+    projection = {"_id": 0, "period_start": 1, "count": 1}
+    for metric in projected_paths(metrics):
+        for field in ('n', 'sum', 'min', 'max'):
+            projection[f"{field}.{metric}"] = 1
+
+    timestamps = []
+    mean = {metric: [] for metric in metrics}
+    minimum = {metric: [] for metric in metrics}
+    maximum = {metric: [] for metric in metrics}
+    for rollup in db.historical_rollups.find(query, projection).sort("period_start", 1):
+        timestamps.append(rollup['period_start'])
+        for metric in metrics:
+            total = get_dotted_value(rollup.get('sum', {}), metric)
+            # Rollups written before the per metric counts fall back to the snapshot count
+            count = get_dotted_value(rollup.get('n', {}), metric) or rollup.get('count') or 0
+            # A parent path of several metrics has no single mean
+            numeric = isinstance(total, (int, float))
+            mean[metric].append(total / count if numeric and count else None)
+            minimum[metric].append(get_dotted_value(rollup.get('min', {}), metric))
+            maximum[metric].append(get_dotted_value(rollup.get('max', {}), metric))
+
+    return timestamps, mean, minimum, maximum
+
+def get_dotted_value(document, path):
+    """Follow a dotted path through nested dictionaries, None when any part is missing"""
+    value = document
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
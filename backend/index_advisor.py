@@ -0,0 +1,228 @@
+"""
+Index advisor for the query shapes this backend issues.
+QUERY_SHAPES lists every filter/sort the blueprints and the scheduler send to
+MongoDB, with representative values. The advisor explains each shape to find
+collection scans, reads $indexStats to find unused indexes, and creates the
+declared indexes idempotently. build_report returns a stable JSON structure
+that can be stored and diffed between releases (see scripts/index_report.py).
+"""
+import logging
+from datetime import datetime
+import pymongo
+from pymongo.errors import OperationFailure
+from historical_rollups import ensure_historical_indexes
+
+logger = logging.getLogger(__name__)
+
+ASC = pymongo.ASCENDING
+
+# Indexes every environment should have, per collection
+# The historical_analytics TTL index and the rollup index are managed by historical_rollups
+REQUIRED_INDEXES = {
+    "users": [
+        # Primary key index
+        {"keys": [("customerID", ASC)], "unique": True},
+        # Churn status - filtering and the churned counts
+        {"keys": [("Churn", ASC)]},
+        # High value segment
+        {"keys": [("MonthlyCharges", ASC)]},
+        # Tenure segments, tenure groups and the mid term segment
+        {"keys": [("tenure", ASC), ("MonthlyCharges", ASC)]},
+        {"keys": [("tenure", ASC), ("Churn", ASC)]},
+        # Churn by payment method / contract, the compound key lets both counts use the index only
+        {"keys": [("PaymentMethod", ASC), ("Churn", ASC)]},
+        {"keys": [("Contract", ASC), ("Churn", ASC)]},
+        # Analytics year filter
+        {"keys": [("join_date", ASC)]},
+        {"keys": [("joinDate", ASC)]},
+    ],
+    "admin_users": [
+        {"keys": [("username", ASC)], "unique": True},
+    ],
+    "scheduler_job_runs": [
+        # Keep 30 days of job run history
+        {"keys": [("started_at", ASC)], "expireAfterSeconds": 30 * 24 * 60 * 60},
+        {"keys": [("job_id", ASC), ("started_at", ASC)]},
+    ],
+    "request_profiles": [
+        # Keep request profiles for 7 days
+        {"keys": [("created_at", ASC)], "expireAfterSeconds": 7 * 24 * 60 * 60},
+        {"keys": [("endpoint", ASC), ("created_at", ASC)]},
+    ],
+    "survival_models": [
+        # Pruning of old refits (the published one is kept)
+        {"keys": [("created_at", ASC)]},
+    ],
+    "survival_curves": [
+        # One document per day, kept for a year to compare how survival shifted
+        {"keys": [("timestamp", ASC)], "unique": True, "expireAfterSeconds": 365 * 24 * 60 * 60},
+    ],
+    "risk_factor_bootstrap": [
+        # The claim between workers is the _id of the run (see bootstrap.run_id)
+        {"keys": [("started_at", ASC)], "expireAfterSeconds": 30 * 24 * 60 * 60},
+    ],
+    "portfolio_clv": [
+        # Keep 90 days of portfolio runs, the latest one is served
+        {"keys": [("computed_at", ASC)], "expireAfterSeconds": 90 * 24 * 60 * 60},
+    ],
+}
+
+SAMPLE_DAY = datetime(2024, 1, 1)
+
+# source -> query shape, values are representative only
+QUERY_SHAPES = [
+    {"source": "auth_bp.login", "collection": "admin_users", "filter": {"username": "admin1"}},
+    {"source": "customer_bp.get_customer_details", "collection": "users", "filter": {"customerID": "0000-SAMPLE"}},
+    {"source": "users_bp.get_users", "collection": "users", "filter": {"MonthlyCharges": {"$gt": 75}}},
+    {"source": "users_bp.get_users", "collection": "users", "filter": {"tenure": {"$gt": 24}}},
+    {"source": "users_bp.get_users", "collection": "users", "filter": {"tenure": {"$lt": 3}}},
+    {"source": "users_bp.get_users", "collection": "users", "filter": {"Churn": "No"}},
+    {"source": "analytics_bp.get_churn_analytics", "collection": "users", "filter": {"Churn": "Yes"}},
+    {"source": "analytics_bp.get_churn_analytics", "collection": "users",
+     "filter": {"PaymentMethod": "Electronic check", "Churn": "Yes"}},
+    {"source": "analytics_bp.get_churn_analytics", "collection": "users",
+     "filter": {"Contract": "Month-to-month", "Churn": "Yes"}},
+    {"source": "analytics_bp.get_churn_analytics", "collection": "users",
+     "filter": {"tenure": {"$gt": 12, "$lte": 24}, "Churn": "Yes"}},
+    {"source": "analytics_bp.get_churn_analytics", "collection": "users",
+     "filter": {"$or": [{"join_date": {"$gte": "2024-01-01", "$lte": "2024-12-31"}},
+                        {"joinDate": {"$gte": "2024-01-01", "$lte": "2024-12-31"}}]}},
+    {"source": "scheduler.capture_daily_analytics", "collection": "users",
+     "filter": {"tenure": {"$gte": 3, "$lte": 24}, "MonthlyCharges": {"$lte": 75}}},
+    {"source": "historical_analytics_bp.get_historical_analytics", "collection": "historical_analytics",
+     "filter": {"timestamp": {"$gte": SAMPLE_DAY, "$lt": datetime(2024, 2, 1)}}, "sort": [("timestamp", -1)]},
+    {"source": "historical_analytics_bp.get_historical_series", "collection": "historical_rollups",
+     "filter": {"period": "week", "period_end": {"$gt": SAMPLE_DAY}, "period_start": {"$lt": datetime(2025, 1, 1)}},
+     "sort": [("period_start", 1)]},
+    {"source": "survival_bp.get_survival_curve", "collection": "survival_curves", "filter": {},
+     "sort": [("timestamp", -1)]},
+    {"source": "survival_bp.get_portfolio_clv", "collection": "portfolio_clv", "filter": {},
+     "sort": [("computed_at", -1)]},
+    {"source": "historical_rollups.roll_up_closed_days", "collection": "historical_analytics",
+     "filter": {"timestamp": {"$lt": SAMPLE_DAY}, "rolled_up": {"$ne": True}}, "sort": [("timestamp", 1)]},
+]
+
+def index_name(keys):
+    """Default MongoDB name of an index with these keys, e.g. tenure_1_Churn_1"""
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+def ensure_indexes(db, create=True):
+    """
+    Create the declared indexes that are missing (idempotent).
+    With create=False nothing is changed and the missing indexes are only returned.
+    Returns the list of (collection, index name) that were missing.
+    """
+    missing = []
+    for collection_name, specs in REQUIRED_INDEXES.items():
+        existing = {index["name"] for index in db[collection_name].list_indexes()}
+        for spec in specs:
+            name = index_name(spec["keys"])
+            if name in existing:
+                continue
+            missing.append((collection_name, name))
+            if not create:
+                continue
+            try:
+                options = {key: spec[key] for key in ("unique", "expireAfterSeconds") if key in spec}
+                db[collection_name].create_index(spec["keys"], **options)
+                logger.info(f"Created index {collection_name}.{name}")
+            except OperationFailure as e:
+                # e.g. a unique index over duplicate data, report it instead of failing startup
+                logger.warning(f"Could not create index {collection_name}.{name}: {e}")
+
+    if create:
+        ensure_historical_indexes(db)
+    elif missing:
+        logger.info(f"Missing indexes: {', '.join(f'{c}.{n}' for c, n in missing)}")
+    return missing
+
+def summarize_plan(stage):
+    """Flatten a winning plan into stage names and the indexes it uses"""
+    stages = []
+    indexes = []
+    while stage:
+        stages.append(stage.get("stage"))
+        if "indexName" in stage:
+            indexes.append(stage["indexName"])
+        children = stage.get("inputStages") or ([stage["inputStage"]] if "inputStage" in stage else [])
+        for child in children[1:]:
+            child_stages, child_indexes = summarize_plan(child)
+            stages.extend(child_stages)
+            indexes.extend(child_indexes)
+        stage = children[0] if children else None
+    return stages, indexes
+
+def explain_shape(db, shape):
+    cursor = db[shape["collection"]].find(shape["filter"])
+    if shape.get("sort"):
+        cursor = cursor.sort(shape["sort"])
+    explain = cursor.explain()
+
+    planner = explain.get("queryPlanner", {})
+    winning_plan = planner.get("winningPlan", {})
+    # Newer servers wrap the classic plan in queryPlan
+    winning_plan = winning_plan.get("queryPlan", winning_plan)
+    stages, indexes = summarize_plan(winning_plan)
+
+    result = {
+        "source": shape["source"],
+        "collection": shape["collection"],
+        "filter_keys": sorted(_filter_keys(shape["filter"])),
+        "stages": stages,
+        "indexes": indexes,
+        "collection_scan": "COLLSCAN" in stages,
+        "in_memory_sort": "SORT" in stages
+    }
+    stats = explain.get("executionStats")
+    if stats:
+        result["docs_examined"] = stats.get("totalDocsExamined")
+        result["returned"] = stats.get("nReturned")
+    return result
+
+def _filter_keys(query):
+    keys = set()
+    for key, value in query.items():
+        if key in ("$or", "$and", "$nor"):
+            for clause in value:
+                keys.update(_filter_keys(clause))
+        elif not key.startswith("$"):
+            keys.add(key)
+    return keys
+
+def unused_indexes(db, collection_names):
+    """Indexes with no recorded use since the server started (the _id index is ignored)"""
+    unused = []
+    for collection_name in collection_names:
+        try:
+            stats = db[collection_name].aggregate([{"$indexStats": {}}])
+            for index in stats:
+                if index["name"] != "_id_" and index.get("accesses", {}).get("ops", 0) == 0:
+                    unused.append({"collection": collection_name, "index": index["name"]})
+        except OperationFailure as e:
+            logger.warning(f"$indexStats unavailable for {collection_name}: {e}")
+    return sorted(unused, key=lambda item: (item["collection"], item["index"]))
+
+def build_report(db, include_stats=False):
+    """
+    Explain every query shape and collect collection scans, unused and missing indexes.
+    Execution statistics change with the data, so they are left out unless asked for,
+    which keeps the report diffable between releases.
+    """
+    shapes = []
+    for shape in QUERY_SHAPES:
+        result = explain_shape(db, shape)
+        if not include_stats:
+            result.pop("docs_examined", None)
+            result.pop("returned", None)
+        shapes.append(result)
+
+    collections = sorted({shape["collection"] for shape in QUERY_SHAPES} | set(REQUIRED_INDEXES))
+    return {
+        "shapes": shapes,
+        "collection_scans": [
+            f"{shape['source']} on {shape['collection']} {shape['filter_keys']}"
+            for shape in shapes if shape["collection_scan"]
+        ],
+        "missing_indexes": [f"{c}.{n}" for c, n in ensure_indexes(db, create=False)],
+        "unused_indexes": unused_indexes(db, collections)
+    }
@@ -0,0 +1,92 @@
+"""
+Leader election for scheduled jobs.
+Every gunicorn worker and app instance starts a scheduler, but only the process
+holding the lease document in MongoDB runs the jobs. The leader renews the lease
+on every heartbeat; if it dies the lease expires and another process takes over.
+"""
+import os
+import socket
+import uuid
+import logging
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# A lease that is not renewed within this many seconds can be taken over
+LEASE_SECONDS = int(os.environ.get("SCHEDULER_LEASE_SECONDS", 30))
+
+# How often the holder renews the lease (and followers try to acquire it)
+HEARTBEAT_SECONDS = int(os.environ.get("SCHEDULER_HEARTBEAT_SECONDS", 10))
+
+class LeaderLease:
+    def __init__(self, name, lease_seconds=LEASE_SECONDS):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self._reset()
+
+    def _reset(self):
+        # A forked worker must not inherit the parent's identity or leadership
+        self.pid = os.getpid()
+        self.holder_id = f"{socket.gethostname()}:{self.pid}:{uuid.uuid4().hex[:8]}"
+        self.valid_until = None
+
+    @property
+    def is_leader(self):
+        """True while this process holds an unexpired lease, judged by the local clock"""
+        return self.valid_until is not None and datetime.now(timezone.utc) < self.valid_until
+
+    def heartbeat(self, collection):
+        """
+        Acquire the lease if it is free or expired, or renew it if we hold it.
+        Returns True only when this call made the process the leader.
+        """
+        if os.getpid() != self.pid:
+            self._reset()
+
+        was_leader = self.is_leader
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+
+        try:
+            lease = collection.find_one_and_update(
+                {
+                    "_id": self.name,
+                    "$or": [
+                        {"holder": self.holder_id},
+                        {"expires_at": {"$lt": now}}
+                    ]
+                },
+                {"$set": {"holder": self.holder_id, "expires_at": expires_at, "renewed_at": now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            acquired = lease is not None and lease.get("holder") == self.holder_id
+        except DuplicateKeyError:
+            # Another process holds a valid lease, the upsert collided with its document
+            acquired = False
+        except PyMongoError as e:
+            # Without a confirmed renewal we must assume someone else may take over
+            logger.warning(f"Lease heartbeat for '{self.name}' failed: {e}")
+            acquired = False
+
+        # Step down a little before the lease actually expires to allow for clock drift
+        self.valid_until = expires_at - timedelta(seconds=self.lease_seconds / 10) if acquired else None
+
+        if acquired and not was_leader:
+            logger.info(f"{self.holder_id} acquired the '{self.name}' lease")
+        elif was_leader and not acquired:
+            logger.warning(f"{self.holder_id} lost the '{self.name}' lease")
+        return acquired and not was_leader
+
+    def release(self, collection):
+        """Give up the lease so a follower can take over without waiting for expiry"""
+        if self.valid_until is None:
+            return
+        self.valid_until = None
+        try:
+            collection.delete_one({"_id": self.name, "holder": self.holder_id})
+            logger.info(f"{self.holder_id} released the '{self.name}' lease")
+        except PyMongoError as e:
+            logger.warning(f"Could not release the '{self.name}' lease: {e}")
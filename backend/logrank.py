@@ -0,0 +1,118 @@
+"""
+Pairwise log-rank tests from grouped counts.
+The log-rank statistic only depends on how many customers of each segment churn
+and leave the risk set at every tenure, so MongoDB groups the customers by
+(segment, tenure) and all pairs of segments are tested at once on the
+segments x tenures count matrices. The cost no longer grows with the number of
+customers, only with the number of segments and distinct tenures.
+
+For segments a and b, with d events and n customers at risk at each tenure t:
+
+    E_a = sum_t d(t) * n_a(t) / n(t)
+    V   = sum_t d(t) * n_a(t) / n(t) * n_b(t) / n(t) * (n(t) - d(t)) / (n(t) - 1)
+    Z   = (O_a - E_a) ** 2 / V  ~  chi-squared with 1 degree of freedom
+
+which is what lifelines.statistics.logrank_test computes on the raw durations.
+"""
+import numpy as np
+from scipy.stats import chi2
+
+# Segment dimensions of /survival/logrank-matrix
+LOGRANK_COLUMNS = [
+    'Contract', 'InternetService', 'PaymentMethod', 'gender', 'SeniorCitizen',
+    'Partner', 'Dependents', 'PaperlessBilling', 'PhoneService', 'MultipleLines',
+    'OnlineSecurity', 'TechSupport'
+]
+CORRECTIONS = ('holm', 'bonferroni', 'none')
+
+def tenure_counts_pipeline(column):
+    """Customers and churned customers per (segment, tenure), tenure clipped to 1 as for the survival data"""
+    return [
+        {"$match": {column: {"$ne": None}}},
+        {"$group": {
+            "_id": {"segment": f"${column}", "tenure": {"$max": [{"$ifNull": ["$tenure", 1]}, 1]}},
+            "customers": {"$sum": 1},
+            "events": {"$sum": {"$cond": [{"$eq": ["$Churn", "Yes"]}, 1, 0]}}
+        }}
+    ]
+
+def count_matrices(rows):
+    """
+    Segments, tenures and the segments x tenures matrices of events and of
+    customers leaving the risk set (churned or censored), from the pipeline rows
+    """
+    segments = sorted({row["_id"]["segment"] for row in rows}, key=str)
+    tenures = np.unique([float(row["_id"]["tenure"]) for row in rows])
+    segment_index = {segment: index for index, segment in enumerate(segments)}
+    events = np.zeros((len(segments), len(tenures)))
+    removed = np.zeros((len(segments), len(tenures)))
+    for row in rows:
+        position = (segment_index[row["_id"]["segment"]],
+                    np.searchsorted(tenures, float(row["_id"]["tenure"])))
+        events[position] += row["events"]
+        removed[position] += row["customers"]
+    return segments, tenures, events, removed
+
+def pairwise_logrank(events, removed):
+    """Test statistics and p-values of every pair i < j of segments, returns i, j, statistics, p-values"""
+    # At risk at t: everyone whose tenure is t or longer
+    at_risk = np.cumsum(removed[:, ::-1], axis=1)[:, ::-1]
+    first, second = np.triu_indices(len(events), k=1)
+    n_a, n_b = at_risk[first], at_risk[second]
+    d_a = events[first]
+    n = n_a + n_b
+    d = d_a + events[second]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        share = np.where(n > 0, n_a / n, 0.0)
+        ties = np.where(n > 1, (n - d) / (n - 1), 1.0)
+    expected = (d * share).sum(axis=1)
+    variance = (d * share * (1 - share) * ties).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        statistics = np.where(variance > 0, (d_a.sum(axis=1) - expected) ** 2 / variance, 0.0)
+    return first, second, statistics, chi2.sf(statistics, 1)
+
+def adjust_p_values(p_values, correction="holm"):
+    """Family-wise error rate corrections of a set of p-values"""
+    p_values = np.asarray(p_values, dtype=float)
+    m = len(p_values)
+    if correction == "none" or m == 0:
+        return p_values
+    if correction == "bonferroni":
+        return np.minimum(p_values * m, 1.0)
+    # Holm: the k-th smallest p-value times (m - k), kept monotone
+    order = np.argsort(p_values)
+    adjusted = np.maximum.accumulate(p_values[order] * (m - np.arange(m)))
+    result = np.empty(m)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
+
+def logrank_matrix(rows, correction="holm", alpha=0.05):
+    """Pairwise log-rank tests of the segments in the pipeline rows"""
+    segments, tenures, events, removed = count_matrices(rows)
+    first, second, statistics, p_values = pairwise_logrank(events, removed)
+    adjusted = adjust_p_values(p_values, correction)
+
+    size = len(segments)
+    statistic_matrix = np.zeros((size, size))
+    p_matrix = np.ones((size, size))
+    statistic_matrix[first, second] = statistic_matrix[second, first] = statistics
+    p_matrix[first, second] = p_matrix[second, first] = adjusted
+    return {
+        "segments": [
+            {"segment": segment, "customers": int(removed[index].sum()), "events": int(events[index].sum())}
+            for index, segment in enumerate(segments)
+        ],
+        "pairs": [
+            {
+                "a": segments[i], "b": segments[j],
+                "test_statistic": float(statistic), "p_value": float(p_value),
+                "adjusted_p_value": float(adjusted_p), "significant": bool(adjusted_p < alpha)
+            }
+            for i, j, statistic, p_value, adjusted_p in zip(first, second, statistics, p_values, adjusted)
+        ],
+        "test_statistics": statistic_matrix.round(6).tolist(),
+        "adjusted_p_values": p_matrix.tolist(),
+        "tenures": len(tenures),
+        "correction": correction,
+        "alpha": alpha
+    }
@@ -0,0 +1,93 @@
+"""
+Per-request memory accounting.
+After every request the worker's resident memory (RSS) is read and recorded
+per endpoint in /metrics: the growth during the request and the highest RSS
+seen at the end of a request of that endpoint, which shows which routes drive
+the worker's size. Reading /proc/self/statm is cheap enough to stay on.
+
+MEMORY_TRACKING=true additionally runs tracemalloc and records the peak of the
+Python allocations during each request. tracemalloc slows allocations down and
+its peak is process wide, so use it while investigating, ideally with one
+thread per worker. The top allocators of a single request are available on
+demand with X-Profile: memory (see profiling).
+
+MEMORY_BUDGET_MB recycles a gunicorn worker whose RSS is above the budget after
+a request: the worker gets SIGTERM, finishes the request and exits gracefully,
+and gunicorn starts a fresh one, instead of the worker being OOM-killed later.
+"""
+import logging
+import os
+import resource
+import signal
+import sys
+import tracemalloc
+from flask import g, request
+from metrics import (process_resident_memory, request_rss_growth, request_rss_high_water,
+                     request_allocation_peak, request_allocation_high_water)
+
+logger = logging.getLogger(__name__)
+
+MEMORY_TRACKING = os.environ.get("MEMORY_TRACKING", "false").lower() == "true"
+MEMORY_BUDGET_MB = float(os.environ.get("MEMORY_BUDGET_MB", 0))
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+_recycle_requested = False
+
+def current_rss():
+    """Resident memory of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        # No procfs (e.g. macOS), fall back to the peak RSS, in bytes on macOS and KB elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def recycle_worker(rss):
+    """Ask gunicorn to replace this worker once the current request is done"""
+    global _recycle_requested
+    if _recycle_requested:
+        return
+    if not request.environ.get("SERVER_SOFTWARE", "").startswith("gunicorn"):
+        logger.warning(f"Worker RSS {rss / 2 ** 20:.0f} MB is above the {MEMORY_BUDGET_MB:.0f} MB budget")
+        return
+    _recycle_requested = True
+    logger.warning(f"Worker {os.getpid()} RSS {rss / 2 ** 20:.0f} MB is above the "
+                   f"{MEMORY_BUDGET_MB:.0f} MB budget, recycling it")
+    # SIGTERM is gunicorn's graceful worker shutdown, the current request still completes
+    os.kill(os.getpid(), signal.SIGTERM)
+
+def init_app(app):
+    """Record the memory of every request"""
+    if MEMORY_TRACKING and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    @app.before_request
+    def start_memory_accounting():
+        g.rss_start = current_rss()
+        if MEMORY_TRACKING and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            g.allocated_start = tracemalloc.get_traced_memory()[0]
+
+    @app.after_request
+    def record_memory(response):
+        rss_start = g.pop('rss_start', None)
+        if rss_start is None:
+            return response
+        endpoint = request.endpoint or "unmatched"
+        rss = current_rss()
+        process_resident_memory.set(rss)
+        request_rss_growth.observe(max(rss - rss_start, 0), endpoint=endpoint)
+        request_rss_high_water.set_max(rss, endpoint=endpoint)
+
+        allocated_start = g.pop('allocated_start', None)
+        if allocated_start is not None and tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1] - allocated_start, 0)
+            request_allocation_peak.observe(peak, endpoint=endpoint)
+            request_allocation_high_water.set_max(peak, endpoint=endpoint)
+
+        if MEMORY_BUDGET_MB and rss > MEMORY_BUDGET_MB * 2 ** 20:
+            recycle_worker(rss)
+            response.headers['Connection'] = 'close'
+        return response
@@ -0,0 +1,368 @@
+"""
+In-process metrics in the Prometheus text format.
+A small registry of counters, gauges and histograms (no extra dependency) that
+records request latency per endpoint, MongoDB command durations through pymongo
+command monitoring, model inference time and batch size, cache hits, scheduler
+job durations and per request memory (see memory_accounting). Recording is a
+lock, a bisect and two additions, cheap enough to stay on in production.
+routes/metrics_routes.py serves it at /metrics.
+
+Every gunicorn worker keeps its own registry. With METRICS_MULTIPROC_DIR set,
+each worker writes its samples to a file in that directory every
+METRICS_FLUSH_SECONDS (and when it exits), and a scrape merges the files of all
+workers: counters and histograms are summed, including the workers that have
+exited so the totals never go back, the high-water gauges take the maximum and
+the resident memory gauge sums the live workers. The directory has to be
+emptied before gunicorn starts, as for the Prometheus client's multiprocess mode.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from flask import g, request
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Directory shared by the workers of a deployment, unset keeps the metrics per worker
+METRICS_DIR = os.environ.get("METRICS_MULTIPROC_DIR")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", 5))
+
+# Seconds, the Prometheus client defaults plus longer buckets for the model fits
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+# Bytes, 1 MB to 1 GB
+MEMORY_BUCKETS = tuple(2 ** power for power in range(20, 31, 2))
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class Metric:
+    kind = None
+    # Whether the samples of exited workers stay in the merged values
+    keeps_exited_workers = True
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def label_values(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self, values=None):
+        """The text format lines of this process, or of values merged across the workers"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        if values is None:
+            with self.lock:
+                items = sorted(self.values.items())
+        else:
+            items = sorted(values.items())
+        lines.extend(self.render_samples(items))
+        return lines
+
+    def copy_value(self, value):
+        return value
+
+    def samples(self):
+        """The values of this process as [labels, value] pairs, for the worker file"""
+        with self.lock:
+            return [[list(key), self.copy_value(value)] for key, value in self.values.items()]
+
+    def combine(self, workers):
+        """Merge the samples of every worker, workers is a list of (alive, samples)"""
+        values = {}
+        for alive, samples in workers:
+            if not (alive or self.keeps_exited_workers):
+                continue
+            for labels, value in samples:
+                key = tuple(labels)
+                values[key] = self.merge(values[key], value) if key in values else value
+        return values
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(self.label_values(labels), 0)
+
+    def merge(self, first, second):
+        return first + second
+
+    def render_samples(self, items):
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}" for key, value in items]
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess_mode="max"):
+        """multiprocess_mode is how the workers are merged: max, or sum of the live ones"""
+        super().__init__(name, documentation, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+        self.keeps_exited_workers = multiprocess_mode == "max"
+
+    def set(self, value, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def set_max(self, value, **labels):
+        """Keep the highest value seen, for high-water marks"""
+        key = self.label_values(labels)
+        with self.lock:
+            if value > self.values.get(key, float("-inf")):
+                self.values[key] = value
+
+    def get(self, **labels):
+        return self.values.get(self.label_values(labels), 0)
+
+    def merge(self, first, second):
+        return max(first, second) if self.multiprocess_mode == "max" else first + second
+
+    def render_samples(self, items):
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}" for key, value in items]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.label_values(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Per bucket counts (the last one is +Inf), sum, count
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels):
+        state = self.values.get(self.label_values(labels))
+        return state[2] if state else 0
+
+    def copy_value(self, value):
+        return [list(value[0]), value[1], value[2]]
+
+    def merge(self, first, second):
+        return [[a + b for a, b in zip(first[0], second[0])], first[1] + second[1], first[2] + second[2]]
+
+    def render_samples(self, items):
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = [("le", format_value(bound) if bound != float("inf") else "+Inf")]
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, key)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, key)} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def worker_path(self, directory):
+        return os.path.join(directory, f"worker-{os.getpid()}.json")
+
+    def write(self, directory):
+        """Write the samples of this process to its file in the shared directory"""
+        path = self.worker_path(directory)
+        samples = {metric.name: metric.samples() for metric in self.metrics}
+        # Written aside and renamed, so a scrape never reads half a file
+        with open(f"{path}.tmp", "w") as worker_file:
+            json.dump({"pid": os.getpid(), "metrics": samples}, worker_file)
+        os.replace(f"{path}.tmp", path)
+
+    def read(self, directory):
+        """(alive, samples by metric name) of every worker that wrote to the directory"""
+        workers = []
+        for name in sorted(os.listdir(directory)):
+            if not (name.startswith("worker-") and name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(directory, name)) as worker_file:
+                    data = json.load(worker_file)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping metrics file {name}: {e}")
+                continue
+            workers.append((process_alive(data["pid"]), data["metrics"]))
+        return workers
+
+    def render(self, directory=None):
+        """This process' metrics, or the merged metrics of every worker writing to directory"""
+        workers = None
+        if directory:
+            self.write(directory)
+            workers = self.read(directory)
+        lines = []
+        for metric in self.metrics:
+            values = None
+            if workers is not None:
+                values = metric.combine([(alive, samples.get(metric.name, [])) for alive, samples in workers])
+            lines.extend(metric.render(values))
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Request latency by endpoint, method and status",
+    ["endpoint", "method", "status"]))
+mongo_command_duration = registry.register(Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command duration by command and collection",
+    ["command", "collection", "outcome"]))
+model_inference_duration = registry.register(Histogram(
+    "model_inference_duration_seconds", "Model inference and fitting time", ["model", "operation"]))
+model_batch_size = registry.register(Histogram(
+    "model_batch_size", "Rows per model call", ["model", "operation"], buckets=SIZE_BUCKETS))
+cache_requests = registry.register(Counter(
+    "cache_requests_total", "Cache lookups by cache and result (hit or miss)", ["cache", "result"]))
+scheduler_job_duration = registry.register(Histogram(
+    "scheduler_job_duration_seconds", "Scheduled job run time by job and status", ["job_id", "status"]))
+process_resident_memory = registry.register(Gauge(
+    "process_resident_memory_bytes", "Resident memory of the workers after their last request, summed",
+    multiprocess_mode="sum"))
+request_rss_growth = registry.register(Histogram(
+    "http_request_rss_growth_bytes", "Resident memory growth during a request by endpoint", ["endpoint"],
+    buckets=MEMORY_BUCKETS))
+request_rss_high_water = registry.register(Gauge(
+    "http_request_rss_high_water_bytes", "Highest resident memory at the end of a request by endpoint", ["endpoint"]))
+request_allocation_peak = registry.register(Histogram(
+    "http_request_allocation_peak_bytes", "Peak Python allocations of a request above its start (MEMORY_TRACKING)",
+    ["endpoint"], buckets=MEMORY_BUCKETS))
+request_allocation_high_water = registry.register(Gauge(
+    "http_request_allocation_high_water_bytes", "Highest allocation peak of a request by endpoint (MEMORY_TRACKING)",
+    ["endpoint"]))
+
+def observe_model(model, operation, rows, seconds):
+    model_inference_duration.observe(seconds, model=model, operation=operation)
+    model_batch_size.observe(rows, model=model, operation=operation)
+
+def record_cache(cache, hit):
+    cache_requests.inc(cache=cache, result="hit" if hit else "miss")
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every command of the client it is passed to (event_listeners=[...])"""
+
+    # Commands the driver sends on its own, they would drown out the real ones
+    IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions"}
+
+    def __init__(self):
+        self.collections = {}
+        self.lock = threading.Lock()
+
+    def started(self, event):
+        if event.command_name in self.IGNORED_COMMANDS:
+            return
+        # The collection is only part of the started event, keep it until the command ends
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        with self.lock:
+            self.collections[(event.connection_id, event.request_id)] = collection
+
+    def finish(self, event, outcome):
+        if event.command_name in self.IGNORED_COMMANDS:
+            return
+        with self.lock:
+            collection = self.collections.pop((event.connection_id, event.request_id), "")
+        mongo_command_duration.observe(event.duration_micros / 1e6, command=event.command_name,
+                                       collection=collection, outcome=outcome)
+
+    def succeeded(self, event):
+        self.finish(event, "success")
+
+    def failed(self, event):
+        self.finish(event, "failure")
+
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+def start_flusher(directory):
+    """Write the samples of this worker every METRICS_FLUSH_SECONDS, once per process"""
+    global _flusher_pid
+    with _flusher_lock:
+        # Workers forked from a preloaded app start their own
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+
+    def flush():
+        try:
+            registry.write(directory)
+        except OSError as e:
+            logger.warning(f"Could not write the metrics of worker {os.getpid()}: {e}")
+
+    def run():
+        while True:
+            time.sleep(METRICS_FLUSH_SECONDS)
+            flush()
+
+    atexit.register(flush)
+    threading.Thread(target=run, name="metrics-flush", daemon=True).start()
+
+def init_app(app):
+    """Time every request of the app"""
+    if METRICS_DIR:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        if METRICS_DIR and _flusher_pid != os.getpid():
+            start_flusher(METRICS_DIR)
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            http_request_duration.observe(time.perf_counter() - started,
+                                          endpoint=request.endpoint or "unmatched",
+                                          method=request.method, status=response.status_code)
+        return response
+
+    @app.teardown_request
+    def record_failed_request(error=None):
+        # after_request is skipped when a view raises, count those as 500
+        started = g.pop('request_started', None)
+        if started is not None and error is not None:
+            http_request_duration.observe(time.perf_counter() - started,
+                                          endpoint=request.endpoint or "unmatched",
+                                          method=request.method, status=500)
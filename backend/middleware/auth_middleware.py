@@ -4,46 +4,55 @@ import jwt
 import os
 from db import get_db
 
+# Check the bearer token of the current request against the allowed roles
+# Returns (current_user, None) when allowed, otherwise (None, error response)
+def authorize(allowed_roles):
+    token = None
+    
+    # Get token from header
+    if 'Authorization' in request.headers:
+        auth_header = request.headers['Authorization']
+        if auth_header.startswith('Bearer '):
+            token = auth_header.split(' ')[1]
+            
+    if not token:
+        return None, (jsonify({'error': 'Authorization token is missing'}), 401)
+        
+    try:
+        # Decode token
+        data = jwt.decode(token, os.environ.get('JWT_SECRET_KEY'), algorithms=["HS256"])
+        
+        # Check if user has required role
+        if data['role'] not in allowed_roles:
+            return None, (jsonify({'error': 'Insufficient permissions'}), 403)
+            
+        # Get user from database
+        db_connection = get_db()
+        admin_collection = db_connection.admin_users
+        current_user = admin_collection.find_one({"username": data['username']})
+        
+        if not current_user:
+            return None, (jsonify({'error': 'User not found'}), 401)
+            
+        # Double check role in database
+        if current_user['role'] not in allowed_roles:
+            return None, (jsonify({'error': 'Insufficient permissions'}), 403)
+            
+    except jwt.ExpiredSignatureError:
+        return None, (jsonify({'error': 'Token has expired'}), 401)
+    except jwt.InvalidTokenError:
+        return None, (jsonify({'error': 'Invalid token'}), 401)
+        
+    return current_user, None
+
 # Implement Role based access control as middleware
 def role_required(allowed_roles):
     def decorator(f):
         @wraps(f)
         def decorated(*args, **kwargs):
-            token = None
-            
-            # Get token from header
-            if 'Authorization' in request.headers:
-                auth_header = request.headers['Authorization']
-                if auth_header.startswith('Bearer '):
-                    token = auth_header.split(' ')[1]
-                    
-            if not token:
-                return jsonify({'error': 'Authorization token is missing'}), 401
-                
-            try:
-                # Decode token
-                data = jwt.decode(token, os.environ.get('JWT_SECRET_KEY'), algorithms=["HS256"])
-                
-                # Check if user has required role
-                if data['role'] not in allowed_roles:
-                    return jsonify({'error': 'Insufficient permissions'}), 403
-                    
-                # Get user from database
-                db_connection = get_db()
-                admin_collection = db_connection.admin_users
-                current_user = admin_collection.find_one({"username": data['username']})
-                
-                if not current_user:
-                    return jsonify({'error': 'User not found'}), 401
-                    
-                # Double check role in database
-                if current_user['role'] not in allowed_roles:
-                    return jsonify({'error': 'Insufficient permissions'}), 403
-                    
-            except jwt.ExpiredSignatureError:
-                return jsonify({'error': 'Token has expired'}), 401
-            except jwt.InvalidTokenError:
-                return jsonify({'error': 'Invalid token'}), 401
+            current_user, error_response = authorize(allowed_roles)
+            if error_response:
+                return error_response
                 
             # Add current user to kwargs
             kwargs['current_user'] = current_user
@@ -0,0 +1,147 @@
+"""
+Background refits of the Cox model and its publication to every worker.
+refit_model fits the model on the customers in a separate process, warm
+started from the coefficients of the serving model, and validates it on a
+holdout of the customers (chosen by a hash of the customerID, so the same
+customers are held out from every fit) against the serving model. A model
+that fails or has a lower concordance index is recorded and discarded. A better
+one is stored in survival_models, with the coefficient statistics /risk-factors
+serves (model.summary), and published by pointing the single
+model_registry document at it, which workers check every MODEL_CHECK_SECONDS
+(see routes/survival_routes.get_cox_scorer).
+
+The scheduler refits once the data version (see data_version) has moved by
+SURVIVAL_REFIT_MIN_CHANGES since the last attempt, and every night.
+"""
+import logging
+import multiprocessing
+import os
+import time
+import zlib
+from datetime import datetime, timedelta
+import numpy as np
+from bson import Binary
+from survival_model import CoxScorer, RiskIndex, fit_scorer
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "cox"
+REFIT_MIN_CHANGES = int(os.environ.get("SURVIVAL_REFIT_MIN_CHANGES", 100))
+REFIT_TIMEOUT_SECONDS = float(os.environ.get("SURVIVAL_REFIT_TIMEOUT_SECONDS", 1800))
+REFIT_IN_SUBPROCESS = os.environ.get("SURVIVAL_REFIT_SUBPROCESS", "true").lower() == "true"
+# A new model may be this much worse on the holdout and still replace the serving one
+CONCORDANCE_TOLERANCE = float(os.environ.get("SURVIVAL_REFIT_CONCORDANCE_TOLERANCE", 0.0))
+HOLDOUT_PERCENT = 20
+# The risk index is stored with the model, keep the document well below 16 MB
+RISK_INDEX_MAX_POINTS = 1000000
+MODEL_RETENTION_DAYS = 30
+
+def encode_scorer(scorer):
+    """The scorer as a MongoDB document, the risk index as packed doubles"""
+    document = scorer.to_dict()
+    document.pop("risk_index", None)
+    if scorer.risk_index is not None:
+        document["risk_index"] = Binary(scorer.risk_index.partial_hazards.astype("<f8").tobytes())
+    return document
+
+def decode_scorer(document):
+    scorer = CoxScorer.from_dict({**document, "risk_index": None})
+    if document.get("risk_index") is not None:
+        scorer.risk_index = RiskIndex(np.frombuffer(document["risk_index"], dtype="<f8"))
+    return scorer
+
+def published_model_id(db):
+    pointer = db.model_registry.find_one({"_id": MODEL_NAME}, {"model_id": 1})
+    return pointer.get("model_id") if pointer else None
+
+def load_scorer(db, model_id):
+    document = db.survival_models.find_one({"_id": model_id}, {"model": 1})
+    return decode_scorer(document["model"]) if document else None
+
+def should_refit(db, data_version, force=False):
+    """True without a published model, when forced or when the data moved enough since the last attempt"""
+    pointer = db.model_registry.find_one({"_id": MODEL_NAME})
+    if pointer is None or pointer.get("model_id") is None or force:
+        return True
+    last_version = max(pointer.get("data_version", 0), pointer.get("last_attempt_data_version", 0))
+    return data_version - last_version >= REFIT_MIN_CHANGES
+
+def holdout_mask(customer_ids):
+    """Stable split, a customer is held out from every fit or from none"""
+    return np.array([zlib.crc32(str(customer_id).encode()) % 100 < HOLDOUT_PERCENT for customer_id in customer_ids])
+
+def fit_in_subprocess(frame, features, initial_coefficients):
+    """
+    Fit in a fresh process, so the fit neither holds the GIL of the workers nor grows
+    their memory. The model summary /risk-factors serves is computed there too.
+    """
+    if not REFIT_IN_SUBPROCESS:
+        return fit_scorer(frame, features, initial_coefficients, summary=True)
+    context = multiprocessing.get_context("spawn")
+    # Leaving the pool terminates the process, also after a timeout
+    with context.Pool(1) as pool:
+        return pool.apply_async(fit_scorer, (frame, features, initial_coefficients, True)).get(REFIT_TIMEOUT_SECONDS)
+
+def refit_model(db, df, data_version, features):
+    """Fit, validate and, if it is not worse, publish a new model. Returns its id or None"""
+    features = list(features)
+    created_at = datetime.now()
+    previous_id = published_model_id(db)
+    previous = load_scorer(db, previous_id) if previous_id is not None else None
+    comparable = previous is not None and previous.features == features
+
+    if 'customerID' in df.columns:
+        holdout = holdout_mask(df['customerID'])
+    else:
+        holdout = np.arange(len(df)) % 100 < HOLDOUT_PERCENT
+    train, test = df[~holdout], df[holdout]
+    if test['event'].sum() < 2:
+        # Too few customers to hold any out
+        train, test = df, df
+
+    record = {
+        "created_at": created_at,
+        "data_version": data_version,
+        "rows": int(len(train)),
+        "holdout_rows": int(len(test)),
+        "previous_model_id": previous_id,
+        "warm_start": comparable
+    }
+    db.model_registry.update_one({"_id": MODEL_NAME}, {"$set": {"last_attempt_data_version": data_version}},
+                                 upsert=True)
+    try:
+        start_time = time.perf_counter()
+        scorer = fit_in_subprocess(train[features + ['tenure', 'event']], features,
+                                   previous.coefficients if comparable else None)
+        record["fit_seconds"] = round(time.perf_counter() - start_time, 3)
+        record["concordance"] = scorer.concordance(test)
+    except Exception as e:
+        logger.error(f"Cox model refit failed, keeping the serving model: {e}")
+        db.survival_models.insert_one({**record, "status": "failed", "error": str(e)})
+        return None
+
+    if comparable:
+        record["previous_concordance"] = previous.concordance(test)
+        if record["concordance"] < record["previous_concordance"] - CONCORDANCE_TOLERANCE:
+            logger.warning(f"Refitted Cox model is worse ({record['concordance']:.4f} < "
+                           f"{record['previous_concordance']:.4f}), keeping the serving model")
+            db.survival_models.insert_one({**record, "status": "rejected"})
+            return None
+
+    # Risk percentiles are over all customers, not only the training ones
+    scorer.risk_index = RiskIndex(scorer.partial_hazard(df)).compact(RISK_INDEX_MAX_POINTS)
+    model_id = db.survival_models.insert_one({**record, "status": "published", "model": encode_scorer(scorer)}).inserted_id
+    # Publishing is this single document update, workers switch on their next check
+    db.model_registry.update_one({"_id": MODEL_NAME}, {"$set": {
+        "model_id": model_id,
+        "data_version": data_version,
+        "published_at": datetime.now(),
+        "concordance": record["concordance"]
+    }}, upsert=True)
+    db.survival_models.delete_many({
+        "created_at": {"$lt": created_at - timedelta(days=MODEL_RETENTION_DAYS)},
+        "_id": {"$ne": model_id}
+    })
+    logger.info(f"Published Cox model {model_id} (concordance {record['concordance']:.4f}, "
+                f"data version {data_version})")
+    return model_id
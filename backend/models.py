@@ -69,6 +69,32 @@ class UserCollection:
         if query is None:
             query = {}
         return collection.count_documents(query)
+
+    @staticmethod
+    def revenue_totals(query=None):
+        """Sum monthly and total charges of matching users on the server"""
+        collection = UserCollection.get_collection()
+        result = list(collection.aggregate(UserCollection.revenue_pipeline(query)))
+        return UserCollection.revenue_from_result(result)
+
+    @staticmethod
+    def revenue_pipeline(query=None):
+        """Aggregation pipeline of revenue_totals, also run through async_db.gather_queries"""
+        return [
+            {"$match": query or {}},
+            {"$group": {
+                "_id": None,
+                "monthly": {"$sum": "$MonthlyCharges"},
+                "total": {"$sum": "$TotalCharges"}
+            }}
+        ]
+
+    @staticmethod
+    def revenue_from_result(result):
+        """Monthly and total revenue from the documents of revenue_pipeline"""
+        if not result:
+            return 0, 0
+        return result[0]["monthly"], result[0]["total"]
     
     
 # Provide ORM style interface (For more intutive queries)- when using SQLite
@@ -0,0 +1,112 @@
+"""
+Portfolio-wide customer lifetime value.
+For every active customer the fitted Cox model gives the expected remaining
+lifetime over the next PORTFOLIO_HORIZON_MONTHS months (the restricted mean,
+conditional on the customer's current tenure), which times MonthlyCharges is
+their CLV over that horizon. Revenue at risk is the revenue of the horizon the
+customer is expected to churn away. Customers are scored in chunks, the results
+are written back to the users in bulk and the segment totals are stored in the
+portfolio_clv collection, where /survival/portfolio-clv serves the latest run.
+"""
+import logging
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+PORTFOLIO_HORIZON_MONTHS = int(os.environ.get("PORTFOLIO_HORIZON_MONTHS", 24))
+# Rows scored at once, a chunk holds a survival matrix of rows x timeline points
+CHUNK_SIZE = 20000
+WRITE_BATCH_SIZE = 1000
+
+# Customer fields the aggregates are broken down by
+SEGMENT_FIELDS = ("Contract", "InternetService", "PaymentMethod")
+
+def remaining_lifetimes(scorer, df, horizon=PORTFOLIO_HORIZON_MONTHS, chunk_size=CHUNK_SIZE):
+    """Expected remaining months of every row of prepare_survival_data's frame"""
+    remaining = np.empty(len(df))
+    tenure = df['tenure'].to_numpy(dtype=float)
+    for start in range(0, len(df), chunk_size):
+        rows = df.iloc[start:start + chunk_size]
+        remaining[start:start + chunk_size] = scorer.expected_remaining_lifetime(
+            rows, tenure[start:start + chunk_size], horizon)
+    return remaining
+
+def summarize(frame):
+    """Totals of a frame of customers with remaining_months, clv and revenue_at_risk"""
+    return {
+        "customers": int(len(frame)),
+        "total_clv": round(float(frame['clv'].sum()), 2),
+        "revenue_at_risk": round(float(frame['revenue_at_risk'].sum()), 2),
+        "mean_remaining_months": round(float(frame['remaining_months'].mean()), 2) if len(frame) else 0.0
+    }
+
+def segment_aggregates(frame):
+    segments = {}
+    for field in SEGMENT_FIELDS:
+        if field not in frame.columns:
+            continue
+        grouped = frame.groupby(field).agg(
+            customers=('clv', 'size'),
+            total_clv=('clv', 'sum'),
+            revenue_at_risk=('revenue_at_risk', 'sum'),
+            mean_remaining_months=('remaining_months', 'mean')
+        )
+        segments[field] = [
+            {
+                "segment": str(name),
+                "customers": int(row.customers),
+                "total_clv": round(float(row.total_clv), 2),
+                "revenue_at_risk": round(float(row.revenue_at_risk), 2),
+                "mean_remaining_months": round(float(row.mean_remaining_months), 2)
+            }
+            for name, row in grouped.sort_values('revenue_at_risk', ascending=False).iterrows()
+        ]
+    return segments
+
+def write_back(users_collection, frame, computed_at):
+    """Store every customer's results on their user document, in unordered bulk writes"""
+    updates = [
+        UpdateOne({"customerID": customer_id}, {"$set": {
+            "expected_remaining_months": round(float(months), 3),
+            "clv": round(float(clv), 2),
+            "clv_updated_at": computed_at
+        }})
+        for customer_id, months, clv in zip(frame['customerID'], frame['remaining_months'], frame['clv'])
+    ]
+    for start in range(0, len(updates), WRITE_BATCH_SIZE):
+        users_collection.bulk_write(updates[start:start + WRITE_BATCH_SIZE], ordered=False)
+    return len(updates)
+
+def compute_portfolio_clv(db, scorer, df, horizon=PORTFOLIO_HORIZON_MONTHS):
+    """Score the active customers of df, write the results back and store the aggregates"""
+    computed_at = datetime.now()
+    active = df[df['event'] == 0]
+    remaining = remaining_lifetimes(scorer, active, horizon)
+    monthly_charges = active['MonthlyCharges'].to_numpy(dtype=float)
+    frame = pd.DataFrame({
+        'remaining_months': remaining,
+        'clv': monthly_charges * remaining,
+        'revenue_at_risk': monthly_charges * (horizon - remaining)
+    }, index=active.index)
+    for field in ('customerID',) + SEGMENT_FIELDS:
+        if field in active.columns:
+            frame[field] = active[field]
+
+    if 'customerID' in frame.columns:
+        written = write_back(db.users, frame, computed_at)
+    else:
+        written = 0
+    document = {
+        "computed_at": computed_at,
+        "horizon_months": horizon,
+        "portfolio": summarize(frame),
+        "segments": segment_aggregates(frame),
+        "customers_updated": written
+    }
+    db.portfolio_clv.insert_one(document)
+    logger.info(f"Portfolio CLV of {len(frame)} active customers computed over {horizon} months")
+    return document
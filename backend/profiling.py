@@ -0,0 +1,240 @@
+"""
+On-demand profiling of single requests for admins.
+A request with the X-Profile header or the profile query parameter (sample,
+cprofile or memory, any other true value means sample) and an admin bearer
+token is run under a profiler:
+
+- sample: a background thread samples the request thread's stack every few
+  milliseconds and counts collapsed stacks ("frame;frame;frame count"), the
+  input format of flamegraph.pl and speedscope. Low overhead, fine for slow
+  production requests.
+- cprofile: deterministic cProfile, stored as a pstats dump (load it with
+  pstats.Stats, snakeviz or flameprof) plus the top functions by cumulative time.
+- memory: tracemalloc snapshots before and after the view, stored as the source
+  lines that allocated the most memory still held at the end, plus the peak of
+  the allocations during the request. Other threads' allocations are included.
+
+The profile is stored in the request_profiles collection and its id returned in
+the X-Profile-Id header; the admin endpoints in routes/admin_routes.py serve it.
+Only the view is profiled, the body of a streamed response is produced later.
+"""
+import cProfile
+import io
+import logging
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from bson import Binary
+from flask import g, request
+from db import get_db
+from middleware.auth_middleware import authorize
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ('sample', 'cprofile', 'memory')
+SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", 5)) / 1000
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 30
+MEMORY_TRACE_FRAMES = 25
+
+# Profiling slows a worker down, only this many requests per process are profiled at once
+MAX_CONCURRENT_PROFILES = int(os.environ.get("PROFILE_MAX_CONCURRENT", 1))
+_profile_slots = threading.BoundedSemaphore(MAX_CONCURRENT_PROFILES)
+
+def requested_mode():
+    """The profiling mode asked for by the request, or None"""
+    value = request.headers.get('X-Profile') or request.args.get('profile')
+    if not value:
+        return None
+    value = value.lower()
+    if value in PROFILE_MODES:
+        return value
+    if value in ('0', 'false', 'no', 'off'):
+        return None
+    return 'sample'
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class StackSampler:
+    """Samples the stack of one thread from a background thread"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+def top_functions(stats, limit=TOP_FUNCTIONS):
+    """The functions with the highest cumulative time of a pstats.Stats"""
+    rows = []
+    for (filename, line, name), (_, calls, own_time, cumulative_time, _) in stats.stats.items():
+        rows.append({
+            "function": f"{name} ({os.path.basename(filename)}:{line})",
+            "calls": calls,
+            "own_seconds": round(own_time, 6),
+            "cumulative_seconds": round(cumulative_time, 6)
+        })
+    rows.sort(key=lambda row: row["cumulative_seconds"], reverse=True)
+    return rows[:limit]
+
+class AllocationTracer:
+    """tracemalloc snapshots around a request, started only for it unless already on"""
+
+    def __init__(self):
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start(MEMORY_TRACE_FRAMES)
+        tracemalloc.reset_peak()
+        self.start_size = tracemalloc.get_traced_memory()[0]
+        self.before = tracemalloc.take_snapshot()
+
+    def stop(self):
+        self.peak = max(tracemalloc.get_traced_memory()[1] - self.start_size, 0)
+        self.after = tracemalloc.take_snapshot()
+        if self.started_tracing:
+            tracemalloc.stop()
+
+    def top_allocations(self, limit=TOP_ALLOCATIONS):
+        """Source lines by the memory they allocated and still held at the end"""
+        # The snapshots themselves are tracemalloc's own allocations
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        after = self.after.filter_traces(filters)
+        before = self.before.filter_traces(filters)
+        rows = []
+        for stat in after.compare_to(before, 'lineno')[:limit]:
+            frame = stat.traceback[0]
+            rows.append({
+                "location": f"{os.path.basename(frame.filename)}:{frame.lineno}",
+                "filename": frame.filename,
+                "size_diff_bytes": stat.size_diff,
+                "count_diff": stat.count_diff,
+                "size_bytes": stat.size
+            })
+        return rows
+
+def start_profile(mode):
+    if mode == 'memory':
+        return AllocationTracer()
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    sampler = StackSampler(threading.get_ident())
+    sampler.start()
+    return sampler
+
+def finish_profile(mode, profiler, status_code):
+    """Stop the profiler and store the profile, returns its id"""
+    duration = time.perf_counter() - g.profile_started
+    document = {
+        "created_at": datetime.now(),
+        "mode": mode,
+        "method": request.method,
+        "path": request.full_path.rstrip('?'),
+        "endpoint": request.endpoint,
+        "status": status_code,
+        "username": g.profile_user.get('username'),
+        "duration_seconds": round(duration, 6)
+    }
+
+    if mode == 'cprofile':
+        profiler.disable()
+        profiler.create_stats()
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        # Same bytes pstats.Stats.dump_stats writes, so it can be saved and loaded as a .pstats file
+        document["pstats"] = Binary(marshal.dumps(stats.stats))
+        document["top_functions"] = top_functions(stats)
+    elif mode == 'memory':
+        profiler.stop()
+        document["allocation_peak_bytes"] = profiler.peak
+        document["top_allocations"] = profiler.top_allocations()
+    else:
+        profiler.stop()
+        document["collapsed"] = profiler.collapsed()
+        document["samples"] = profiler.samples
+        document["sample_interval_ms"] = profiler.interval * 1000
+
+    return get_db().request_profiles.insert_one(document).inserted_id
+
+def init_app(app):
+    """Profile requests that ask for it"""
+
+    @app.before_request
+    def start_request_profile():
+        mode = requested_mode()
+        if not mode or request.method == 'OPTIONS':
+            return None
+
+        current_user, error_response = authorize(['admin'])
+        if error_response:
+            return error_response
+
+        if not _profile_slots.acquire(blocking=False):
+            g.profile_busy = True
+            return None
+        g.profile_mode = mode
+        g.profile_user = current_user
+        g.profile_started = time.perf_counter()
+        g.profiler = start_profile(mode)
+        return None
+
+    @app.after_request
+    def store_request_profile(response):
+        if g.pop('profile_busy', False):
+            response.headers['X-Profile-Status'] = 'busy'
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        try:
+            profile_id = finish_profile(g.profile_mode, profiler, response.status_code)
+            response.headers['X-Profile-Id'] = str(profile_id)
+        except Exception as e:
+            logger.error(f"Could not store request profile: {e}")
+            response.headers['X-Profile-Status'] = 'failed'
+        finally:
+            _profile_slots.release()
+        return response
+
+    @app.teardown_request
+    def stop_request_profile(error=None):
+        # The view raised and after_request was skipped
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return
+        try:
+            finish_profile(g.profile_mode, profiler, 500)
+        except Exception as e:
+            logger.error(f"Could not store request profile: {e}")
+        finally:
+            _profile_slots.release()
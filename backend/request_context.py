@@ -0,0 +1,58 @@
+"""
+Attribution of work to the request or job that caused it.
+Every request gets an id (the incoming X-Request-ID header or a new one, echoed
+in the response) and a source, the Flask endpoint. Scheduled jobs run under
+job_context with source scheduler.<job id>. Both live in context variables, so
+code without access to the request, like the pymongo command listeners, can
+read them from the thread that issued the command.
+"""
+import re
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import request
+
+request_id_var = ContextVar('request_id', default=None)
+source_var = ContextVar('source', default=None)
+
+# Incoming ids are only trusted when they look like an id
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+def current_request_id():
+    return request_id_var.get()
+
+def current_source():
+    return source_var.get()
+
+@contextmanager
+def job_context(job_id):
+    """Attribute everything inside the block to a scheduled job"""
+    request_token = request_id_var.set(f"{job_id}-{uuid.uuid4().hex[:12]}")
+    source_token = source_var.set(f"scheduler.{job_id}")
+    try:
+        yield
+    finally:
+        source_var.reset(source_token)
+        request_id_var.reset(request_token)
+
+def init_app(app):
+    """Give every request an id and a source"""
+
+    @app.before_request
+    def set_request_context():
+        incoming = request.headers.get('X-Request-ID', '')
+        request_id_var.set(incoming if REQUEST_ID_PATTERN.match(incoming) else uuid.uuid4().hex)
+        source_var.set(request.endpoint or "unmatched")
+
+    @app.after_request
+    def add_request_id(response):
+        request_id = request_id_var.get()
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+        return response
+
+    @app.teardown_request
+    def clear_request_context(error=None):
+        # Threads are reused between requests, don't leak the id into the next one
+        request_id_var.set(None)
+        source_var.set(None)
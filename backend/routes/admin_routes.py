@@ -0,0 +1,109 @@
+from flask import Blueprint, jsonify, request, Response
+from bson import ObjectId
+from datetime import datetime, timedelta
+from db import get_db
+from middleware.auth_middleware import role_required
+from slow_query_log import SLOW_QUERY_COLLECTION, SLOW_QUERY_THRESHOLD_MS, top_offenders
+
+admin_bp = Blueprint('admin_bp', __name__)
+
+# Fields of a stored profile that are too large for the listing and the summary
+PROFILE_PAYLOAD_FIELDS = {"collapsed": 0, "pstats": 0}
+# The index view leaves out the per-function and per-line lists as well
+PROFILE_LIST_FIELDS = {**PROFILE_PAYLOAD_FIELDS, "top_functions": 0, "top_allocations": 0}
+
+def find_profile(profile_id, projection=None):
+    if not ObjectId.is_valid(profile_id):
+        return None
+    return get_db().request_profiles.find_one({"_id": ObjectId(profile_id)}, projection)
+
+def serialize_record(record):
+    """JSON friendly copy of a stored profile or slow query record"""
+    record["id"] = str(record.pop("_id"))
+    record["created_at"] = record["created_at"].isoformat()
+    return record
+
+@admin_bp.route('/profiles', methods=['GET'])
+@role_required(['admin'])
+def list_profiles(current_user):
+    """List the most recent request profiles"""
+    try:
+        limit = min(int(request.args.get('limit', 20)), 200)
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+
+    query = {}
+    if request.args.get('endpoint'):
+        query["endpoint"] = request.args.get('endpoint')
+
+    profiles = get_db().request_profiles.find(query, PROFILE_LIST_FIELDS) \
+        .sort("created_at", -1).limit(limit)
+    return jsonify({"profiles": [serialize_record(profile) for profile in profiles]})
+
+@admin_bp.route('/profiles/<profile_id>', methods=['GET'])
+@role_required(['admin'])
+def get_profile(profile_id, current_user):
+    """Summary of one profile, with the top functions of a cProfile run"""
+    profile = find_profile(profile_id, PROFILE_PAYLOAD_FIELDS)
+    if not profile:
+        return jsonify({"error": "Profile not found"}), 404
+    return jsonify(serialize_record(profile))
+
+@admin_bp.route('/profiles/<profile_id>/collapsed', methods=['GET'])
+@role_required(['admin'])
+def get_profile_collapsed(profile_id, current_user):
+    """Collapsed stacks of a sampled profile, ready for flamegraph.pl or speedscope"""
+    profile = find_profile(profile_id, {"collapsed": 1})
+    if not profile:
+        return jsonify({"error": "Profile not found"}), 404
+    if "collapsed" not in profile:
+        return jsonify({"error": "Profile was not sampled, download the pstats instead"}), 404
+    body = profile["collapsed"] + "\n" if profile["collapsed"] else ""
+    return Response(body, mimetype='text/plain',
+                    headers={"Content-Disposition": f"attachment; filename=profile_{profile_id}.collapsed"})
+
+@admin_bp.route('/profiles/<profile_id>/pstats', methods=['GET'])
+@role_required(['admin'])
+def get_profile_pstats(profile_id, current_user):
+    """cProfile statistics in the pstats file format"""
+    profile = find_profile(profile_id, {"pstats": 1})
+    if not profile:
+        return jsonify({"error": "Profile not found"}), 404
+    if "pstats" not in profile:
+        return jsonify({"error": "Profile was sampled, download the collapsed stacks instead"}), 404
+    return Response(bytes(profile["pstats"]), mimetype='application/octet-stream',
+                    headers={"Content-Disposition": f"attachment; filename=profile_{profile_id}.pstats"})
+
+@admin_bp.route('/slow-queries', methods=['GET'])
+@role_required(['admin'])
+def get_slow_query_offenders(current_user):
+    """Slow query shapes of the last hours, ordered by total time"""
+    try:
+        hours = float(request.args.get('hours', 24))
+        limit = min(int(request.args.get('limit', 20)), 200)
+    except ValueError:
+        return jsonify({"error": "hours and limit must be numbers"}), 400
+
+    since = datetime.now() - timedelta(hours=hours)
+    return jsonify({
+        "threshold_ms": SLOW_QUERY_THRESHOLD_MS,
+        "since": since.isoformat(),
+        "offenders": top_offenders(get_db()[SLOW_QUERY_COLLECTION], since, limit)
+    })
+
+@admin_bp.route('/slow-queries/recent', methods=['GET'])
+@role_required(['admin'])
+def get_recent_slow_queries(current_user):
+    """The most recent slow queries, optionally of one source (endpoint or scheduler job)"""
+    try:
+        limit = min(int(request.args.get('limit', 50)), 500)
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+
+    query = {}
+    for field in ('source', 'request_id', 'collection'):
+        if request.args.get(field):
+            query[field] = request.args.get(field)
+
+    records = get_db()[SLOW_QUERY_COLLECTION].find(query).sort("$natural", -1).limit(limit)
+    return jsonify({"queries": [serialize_record(record) for record in records]})
@@ -4,9 +4,23 @@ from datetime import datetime, timedelta
 import numpy as np
 import pandas as pd
 import pickle
+import time
+from customer_schema import validate_customer, CustomerValidationError
+from metrics import observe_model
+from tracing import span
+from data_version import bump_data_version
 
 customer_bp = Blueprint('customer_bp', __name__)
 
+# Customer fields the prediction pipeline was trained on, in training order
+MODEL_FEATURES = [
+    "gender", "SeniorCitizen", "Partner", "Dependents", "tenure",
+    "PhoneService", "MultipleLines", "InternetService", "OnlineSecurity",
+    "OnlineBackup", "DeviceProtection", "TechSupport", "StreamingTV",
+    "StreamingMovies", "Contract", "PaperlessBilling", "PaymentMethod",
+    "MonthlyCharges", "TotalCharges"
+]
+
 # Load the trained pipeline model for churn prediction
 try:
     pipeline = pickle.load(open("stacking_pipeline_model.pkl", "rb"))
@@ -80,19 +94,14 @@ def get_customer_details(customer_id):
     if pipeline:
         try:
             # Create a DataFrame with just the features needed for prediction
-            features_for_model = [
-                "gender", "SeniorCitizen", "Partner", "Dependents", "tenure",
-                "PhoneService", "MultipleLines", "InternetService", "OnlineSecurity",
-                "OnlineBackup", "DeviceProtection", "TechSupport", "StreamingTV",
-                "StreamingMovies", "Contract", "PaperlessBilling", "PaymentMethod",
-                "MonthlyCharges", "TotalCharges"
-            ]
-            
-            # Create a DataFrame with feature names
-            model_features_df = pd.DataFrame([{k: user.get(k, 0) for k in features_for_model}])
+            with span("build_features"):
+                model_features_df = pd.DataFrame([{k: user.get(k, 0) for k in MODEL_FEATURES}])
             
             # Use the pipeline to predict - it handles all preprocessing steps
-            churn_probability = pipeline.predict_proba(model_features_df)[0][1]
+            with span("model.predict_proba", rows=len(model_features_df)):
+                start_time = time.perf_counter()
+                churn_probability = pipeline.predict_proba(model_features_df)[0][1]
+                observe_model("churn_pipeline", "predict_proba", len(model_features_df), time.perf_counter() - start_time)
         except Exception as e:
             print(f"Error predicting churn: {e}")
             churn_probability = 0.0
@@ -115,8 +124,11 @@ def update_customer_details(customer_id):
     if not user:
         return jsonify({"error": "User not found"}), 404
         
-    # Get the request data
-    data = request.get_json()
+    # Get the request data and check it against the customer schema
+    try:
+        data = validate_customer(request.get_json(), partial=True)
+    except CustomerValidationError as e:
+        return jsonify({"error": str(e), "details": e.errors}), 400
     print(f"Received update data for customer {customer_id}: {data}")
     
     # If joinDate is provided in the request, use that
@@ -135,6 +147,7 @@ def update_customer_details(customer_id):
         
         if result.modified_count == 0:
             return jsonify({"message": "No changes made to the user"}), 200
+        bump_data_version(db_connection, result.modified_count)
             
         # Get the updated user
         updated_user = users_collection.find_one({"customerID": customer_id})
@@ -175,6 +188,7 @@ def delete_customer(customer_id):
         result = users_collection.delete_one({"customerID": customer_id})
         
         if result.deleted_count > 0:
+            bump_data_version(db_connection, result.deleted_count)
             return jsonify({
                 "message": "User deleted successfully",
                 "customer_id": customer_id
@@ -190,6 +204,8 @@ def delete_customer(customer_id):
 def create_customer():
     """Creates a new customer record"""
     data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({"error": "Customer data must be a JSON object"}), 400
     
     if 'joinDate' in data:
         data['join_date'] = data['joinDate']  # Store in database field
@@ -206,6 +222,12 @@ def create_customer():
             # Provide a default tenure if calculation fails
             data['tenure'] = 0
     
+    # Check the customer against the schema, numeric fields come back as numbers
+    try:
+        data = validate_customer(data)
+    except CustomerValidationError as e:
+        return jsonify({"error": str(e), "details": e.errors}), 400
+    
     # Get MongoDB connection
     db_connection = get_db()
     users_collection = db_connection.users
@@ -221,6 +243,7 @@ def create_customer():
         result = users_collection.insert_one(data)
         
         if result.inserted_id:
+            bump_data_version(db_connection)
             # Return the customerID in the response
             return jsonify({
                 "message": "Customer created successfully",
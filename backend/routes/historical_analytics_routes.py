@@ -1,9 +1,11 @@
-from flask import Blueprint, jsonify, request, Response
+from flask import Blueprint, jsonify, request, Response, stream_with_context
 from db import get_db
+from historical_rollups import choose_tier, find_rollups, get_dotted_value, projected_paths, ROLLUP_PERIODS
 from datetime import datetime, timedelta
 import json
 import csv
 import io
+import zlib
 from bson import json_util
 
 historical_analytics_bp = Blueprint('historical_analytics_bp', __name__)
@@ -19,19 +21,7 @@ def get_historical_analytics():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
-        query = {}
-        if start_date and end_date:
-            # Convert string dates to datetime objects
-            start = datetime.strptime(start_date, '%Y-%m-%d')
-            end = datetime.strptime(end_date, '%Y-%m-%d')
-            end = end + timedelta(days=1)  # Include end date
-            
-            query = {
-                "timestamp": {
-                    "$gte": start,
-                    "$lt": end
-                }
-            }
+        query = build_date_range_query(start_date, end_date)
         
         # Get paginated results
         page = int(request.args.get('page', 1))
@@ -61,6 +51,227 @@ def get_historical_analytics():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@historical_analytics_bp.route('/historical-analytics/series', methods=['GET'])
+def get_historical_series():
+    """
+    Returns selected metrics as columnar arrays for charting.
+    metrics is a comma separated list of dotted paths inside a snapshot's data,
+    e.g. metrics=churn_by_contract.Month-to-month,revenue.monthly
+    tier selects raw daily snapshots or week/month rollups, by default it is picked from the range.
+    """
+    try:
+        metrics = [metric.strip() for metric in request.args.get('metrics', '').split(',') if metric.strip()]
+        if not metrics:
+            return jsonify({"error": "At least one metric is required"}), 400
+        
+        for metric in metrics:
+            if any(not part or part.startswith('$') for part in metric.split('.')):
+                return jsonify({"error": f"Invalid metric path: {metric}"}), 400
+        
+        # start and end are both optional, either bound can be left open
+        try:
+            start = request.args.get('start')
+            end = request.args.get('end')
+            start = datetime.strptime(start, '%Y-%m-%d') if start else None
+            end = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1) if end else None
+        except ValueError:
+            return jsonify({"error": "Dates must use the YYYY-MM-DD format"}), 400
+        
+        tier = request.args.get('tier', 'auto')
+        if tier == 'auto':
+            tier = choose_tier(start, end)
+        elif tier != 'raw' and tier not in ROLLUP_PERIODS:
+            return jsonify({"error": f"Invalid tier: {tier}"}), 400
+        
+        db_connection = get_db()
+        
+        # Long ranges are answered from the weekly or monthly rollups
+        if tier in ROLLUP_PERIODS:
+            timestamps, mean, minimum, maximum = find_rollups(db_connection, tier, start, end, metrics)
+            return jsonify({
+                "tier": tier,
+                "timestamps": [timestamp.strftime('%Y-%m-%d') for timestamp in timestamps],
+                "series": mean,
+                "min": minimum,
+                "max": maximum
+            })
+        
+        query = {}
+        if start:
+            query.setdefault("timestamp", {})["$gte"] = start
+        if end:
+            query.setdefault("timestamp", {})["$lt"] = end
+        
+        historical_collection = db_connection.historical_analytics
+        
+        # Project only the requested paths so the scan over the timestamp index stays small
+        projection = {"_id": 0, "timestamp": 1}
+        for metric in projected_paths(metrics):
+            projection[f"data.{metric}"] = 1
+        
+        timestamps = []
+        series = {metric: [] for metric in metrics}
+        for record in historical_collection.find(query, projection).sort("timestamp", 1):
+            timestamps.append(record['timestamp'].strftime('%Y-%m-%d'))
+            for metric in metrics:
+                series[metric].append(get_dotted_value(record.get('data', {}), metric))
+        
+        return jsonify({
+            "tier": "raw",
+            "timestamps": timestamps,
+            "series": series
+        })
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Number of snapshots pulled from MongoDB per round trip while exporting
+CSV_EXPORT_BATCH_SIZE = 500
+
+# Flush the CSV buffer to the client once it grows past this many characters
+CSV_EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Snapshot sections whose keys become one CSV column each
+CSV_KEYED_SECTIONS = [
+    ('churn_by_payment_method', 'Payment Method'),
+    ('churn_by_contract', 'Contract'),
+    ('churn_by_tenure_group', 'Tenure Group'),
+]
+
+# Only the fields written to the CSV are read from each snapshot
+CSV_EXPORT_PROJECTION = {
+    "_id": 0,
+    "timestamp": 1,
+    "data.churn_distribution": 1,
+    "data.churn_by_payment_method": 1,
+    "data.churn_by_contract": 1,
+    "data.churn_by_tenure_group": 1,
+    "data.customer_counts": 1,
+    "data.revenue": 1
+}
+
+def build_date_range_query(start_date, end_date):
+    """Build the timestamp filter for an inclusive YYYY-MM-DD date range"""
+    if not (start_date and end_date):
+        return {}
+
+    # Convert string dates to datetime objects
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    end = end + timedelta(days=1)  # Include end date
+
+    return {
+        "timestamp": {
+            "$gte": start,
+            "$lt": end
+        }
+    }
+
+def format_number(value):
+    """Round floats to 2 decimal places, leave everything else as is"""
+    if isinstance(value, float):
+        return round(value, 2)
+    return value
+
+def probe_csv_columns(historical_collection, query):
+    """
+    Derive the CSV column layout from the newest matching snapshot.
+    Only the keyed sections and the segment counts are fetched, not the whole
+    snapshot; their keys become the columns. Returns None when nothing matches.
+    """
+    projection = {"_id": 0}
+    for section, _ in CSV_KEYED_SECTIONS:
+        projection[f"data.{section}"] = 1
+    projection["data.customer_counts.segments"] = 1
+
+    probe = historical_collection.find_one(query, projection, sort=[("timestamp", -1)])
+    if probe is None:
+        return None
+
+    data = probe.get('data', {})
+    return {
+        'sections': [(section, label, list(data.get(section, {}))) for section, label in CSV_KEYED_SECTIONS],
+        'segments': list(data.get('customer_counts', {}).get('segments', {}))
+    }
+
+def build_csv_header(columns):
+    headers = ["Date", "Time", "Churn Percentage", "Active Percentage"]
+    for _, label, keys in columns['sections']:
+        headers.extend(f"{label} - {key}" for key in keys)
+
+    # Add customer segment headers
+    headers.append("Total Customers")
+    headers.extend(f"Segment - {segment}" for segment in columns['segments'])
+
+    # Add revenue headers
+    headers.extend(["Monthly Revenue", "Total Revenue"])
+    return headers
+
+def build_csv_row(record, columns):
+    data = record.get('data', {})
+    row = [
+        record['timestamp'].strftime('%Y-%m-%d'),
+        record['timestamp'].strftime('%H:%M:%S')
+    ]
+
+    # Add churn distribution data
+    churn_dist = data.get('churn_distribution', {})
+    row.extend([
+        format_number(churn_dist.get('churned', 0)),
+        format_number(churn_dist.get('notChurned', 0))
+    ])
+
+    # Add payment method, contract and tenure group data
+    for section, _, keys in columns['sections']:
+        values = data.get(section, {})
+        row.extend(format_number(values.get(key, 0)) for key in keys)
+
+    # Add customer counts data
+    customer_counts = data.get('customer_counts', {})
+    row.append(customer_counts.get('total', 0))
+    segments = customer_counts.get('segments', {})
+    row.extend(segments.get(segment, 0) for segment in columns['segments'])
+
+    # Add revenue data
+    revenue = data.get('revenue', {})
+    row.append(format_number(revenue.get('monthly', 0)))
+    row.append(format_number(revenue.get('total', 0)))
+    return row
+
+def generate_csv(cursor, columns):
+    """Yield the CSV in chunks while iterating the cursor, so only one batch is held in memory"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(build_csv_header(columns))
+
+    for record in cursor:
+        writer.writerow(build_csv_row(record, columns))
+        if buffer.tell() >= CSV_EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def gzip_stream(chunks):
+    """Compress a stream of text chunks into a gzip stream on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode('utf-8'))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def wants_gzip():
+    """Compress when asked explicitly (?gzip=true) or when the client accepts gzip, unless ?gzip=false"""
+    gzip_param = request.args.get('gzip', '').lower()
+    if gzip_param in ('true', '1'):
+        return True
+    if gzip_param in ('false', '0'):
+        return False
+    return request.accept_encodings['gzip'] > 0
+
 @historical_analytics_bp.route('/historical-analytics/csv', methods=['GET'])
 def download_historical_analytics_csv():
     """ This endpoint helps to export these historical analytics data as a csv file"""
@@ -68,129 +279,39 @@ def download_historical_analytics_csv():
         db_connection = get_db()
         historical_collection = db_connection.historical_analytics
         
-        def format_number(value):
-            try:
-                # Check if it's a numeric value that needs formatting
-                if isinstance(value, (int, float)):
-                    # Format floats to 2 decimal places, leave integers as is
-                    if isinstance(value, float):
-                        return round(value, 2)
-                return value
-            except:
-                return value
-        
         # Handle date range filtering
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
+        query = build_date_range_query(start_date, end_date)
         
-        query = {}
-        if start_date and end_date:
-            # Convert string dates to datetime objects
-            start = datetime.strptime(start_date, '%Y-%m-%d')
-            end = datetime.strptime(end_date, '%Y-%m-%d')
-            end = end + timedelta(days=1)  # Include end date
-            
-            query = {
-                "timestamp": {
-                    "$gte": start,
-                    "$lt": end
-                }
-            }
-        
-        # Get all records for the specified date range
-        records = list(historical_collection.find(query).sort("timestamp", -1))
-        
-        if not records:
+        # Work out the columns before streaming so an empty range can still return 404
+        columns = probe_csv_columns(historical_collection, query)
+        if columns is None:
             return jsonify({"error": "No records found for the specified date range"}), 404
         
-        # Create CSV file
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header row
-        example_record = records[0]
-        headers = ["Date", "Time"]
-        
-        # Add headers for churn distribution
-        headers.extend(["Churn Percentage", "Active Percentage"])
-        
-        # Add headers for payment methods
-        for method in example_record.get('data', {}).get('churn_by_payment_method', {}):
-            headers.append(f"Payment Method - {method}")
-        
-        # Add headers for contracts
-        for contract in example_record.get('data', {}).get('churn_by_contract', {}):
-            headers.append(f"Contract - {contract}")
-        
-        # Add headers for tenure groups
-        for group in example_record.get('data', {}).get('churn_by_tenure_group', {}):
-            headers.append(f"Tenure Group - {group}")
-            
-        # Add customer segment headers
-        headers.append("Total Customers")
-        for segment in example_record.get('data', {}).get('customer_counts', {}).get('segments', {}):
-            headers.append(f"Segment - {segment}")
-            
-        # Add revenue headers
-        headers.append("Monthly Revenue")
-        headers.append("Total Revenue")
-        
-        writer.writerow(headers)
-        
-        # Write data rows
-        for record in records:
-            row = [
-                record['timestamp'].strftime('%Y-%m-%d'),
-                record['timestamp'].strftime('%H:%M:%S')
-            ]
-            
-            # Add churn distribution data
-            churn_dist = record.get('data', {}).get('churn_distribution', {})
-            row.extend([
-                format_number(churn_dist.get('churned', 0)),
-                format_number(churn_dist.get('notChurned', 0))
-            ])
-            
-            # Add payment method data
-            payment_methods = record.get('data', {}).get('churn_by_payment_method', {})
-            for method in example_record.get('data', {}).get('churn_by_payment_method', {}):
-                row.append(format_number(payment_methods.get(method, 0)))
-            
-            # Add contract data
-            contracts = record.get('data', {}).get('churn_by_contract', {})
-            for contract in example_record.get('data', {}).get('churn_by_contract', {}):
-                row.append(format_number(contracts.get(contract, 0)))
-            
-            # Add tenure group data
-            tenure_groups = record.get('data', {}).get('churn_by_tenure_group', {})
-            for group in example_record.get('data', {}).get('churn_by_tenure_group', {}):
-                row.append(format_number(tenure_groups.get(group, 0)))
-                
-            # Add customer counts data
-            customer_counts = record.get('data', {}).get('customer_counts', {})
-            row.append(customer_counts.get('total', 0))
-            
-            segments = customer_counts.get('segments', {})
-            for segment in example_record.get('data', {}).get('customer_counts', {}).get('segments', {}):
-                row.append(segments.get(segment, 0))
-                
-            # Add revenue data
-            revenue = record.get('data', {}).get('revenue', {})
-            row.append(format_number(revenue.get('monthly', 0)))
-            row.append(format_number(revenue.get('total', 0)))
-            
-            writer.writerow(row)
+        # Stream the matching snapshots in batches instead of loading them all
+        cursor = historical_collection.find(query, CSV_EXPORT_PROJECTION) \
+            .sort("timestamp", -1) \
+            .batch_size(CSV_EXPORT_BATCH_SIZE)
+        body = generate_csv(cursor, columns)
         
         # Set up response headers for CSV download
         date_suffix = ""
         if start_date and end_date:
             date_suffix = f"_{start_date}_to_{end_date}"
+        headers = {
+            "Content-Disposition": f"attachment;filename=churn_analytics{date_suffix}.csv",
+            "Vary": "Accept-Encoding"
+        }
+        
+        if wants_gzip():
+            body = gzip_stream(body)
+            headers["Content-Encoding"] = "gzip"
         
-        output.seek(0)
         return Response(
-            output.getvalue(),
+            stream_with_context(body),
             mimetype="text/csv",
-            headers={"Content-Disposition": f"attachment;filename=churn_analytics{date_suffix}.csv"}
+            headers=headers
         )
     
     except Exception as e:
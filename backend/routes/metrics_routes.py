@@ -0,0 +1,24 @@
+from flask import Blueprint, Response, jsonify, request
+import hmac
+import os
+from metrics import registry, METRICS_DIR
+
+metrics_bp = Blueprint('metrics_bp', __name__)
+
+# Content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Expose the recorded metrics of all workers in the Prometheus text format"""
+    # The scraper has to send METRICS_TOKEN as a bearer token, without a token
+    # the endpoint stays closed unless METRICS_PUBLIC=true opens it explicitly
+    metrics_token = os.environ.get('METRICS_TOKEN')
+    if metrics_token:
+        auth_header = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth_header, f"Bearer {metrics_token}"):
+            return jsonify({'error': 'Invalid metrics token'}), 401
+    elif os.environ.get('METRICS_PUBLIC', 'false').lower() != 'true':
+        return jsonify({'error': 'Metrics are disabled until METRICS_TOKEN is set'}), 403
+
+    return Response(registry.render(METRICS_DIR), content_type=PROMETHEUS_CONTENT_TYPE)
@@ -1,13 +1,134 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from db import get_db
-from lifelines import KaplanMeierFitter, CoxPHFitter
+from lifelines import KaplanMeierFitter
 from lifelines.statistics import logrank_test
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+import os
+import threading
+import time
+from metrics import observe_model, record_cache
+from tracing import span
+from pymongo.errors import PyMongoError
+from survival_model import CoxScorer
+import model_registry
+import bootstrap
+from data_version import current_data_version
+from sse import event_stream
+from logrank import LOGRANK_COLUMNS, CORRECTIONS, tenure_counts_pipeline, logrank_matrix
 
 survival_bp = Blueprint('survival_bp', __name__)
 
+# Covariates of the Cox proportional hazards model
+COX_FEATURES = [
+    'gender', 'SeniorCitizen', 'Partner', 'Dependents', 'MonthlyCharges',
+    'Contract_Monthly', 'Contract_OneYear', 'PaperlessBilling',
+    'PaymentMethod_Electronic', 'PaymentMethod_Mailed', 'InternetService_DSL',
+    'InternetService_Fiber'
+]
+
+# How often a worker looks for a newly published Cox model
+MODEL_CHECK_SECONDS = float(os.environ.get("SURVIVAL_MODEL_CHECK_SECONDS", 30))
+# Seconds a client is asked to wait while no model is published yet
+MODEL_RETRY_AFTER_SECONDS = 60
+
+# Customers per batch prediction, and the months of the summary survival probabilities
+BATCH_LIMIT = int(os.environ.get("SURVIVAL_BATCH_LIMIT", 1000))
+SUMMARY_HORIZONS = (6, 12, 24, 36, 48, 60, 72)
+
+# Two sided 95% normal quantile of the asymptotic risk factor intervals
+Z_95 = 1.959963984540054
+
+# Quantiles of /survival/risk-distribution/quantiles unless asked for others
+DEFAULT_RISK_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99)
+
+# How long a worker serves the portfolio CLV it read before reading it again
+PORTFOLIO_CACHE_SECONDS = float(os.environ.get("PORTFOLIO_CACHE_SECONDS", 300))
+
+# Kaplan Meier segments of /survival-curve
+SURVIVAL_CURVE_SEGMENTS = [
+    'Contract_Monthly', 'Contract_OneYear', 'Contract_TwoYear',
+    'InternetService_DSL', 'InternetService_Fiber', 'InternetService_No'
+]
+# Stored curves are rounded to keep the daily documents small
+CURVE_DECIMALS = 6
+# How long a worker serves the latest stored curves before reading them again
+CURVE_CACHE_SECONDS = float(os.environ.get("SURVIVAL_CURVE_CACHE_SECONDS", 300))
+
+_scorer_lock = threading.Lock()
+_scorer_cache = {"scorer": None, "model_id": None, "fitted_at": 0.0, "checked_at": float("-inf")}
+_portfolio_cache = {"document": None, "loaded_at": 0.0}
+_curve_cache = {"response": None, "loaded_at": 0.0}
+# (column, data version) -> per (segment, tenure) counts of the log rank matrix
+_logrank_counts = {}
+
+def customer_features(customer_data):
+    """Cox covariates of a customer as sent by the frontend or stored in MongoDB"""
+    return {
+        'gender': 1 if customer_data.get('gender') == 'Male' else 0,
+        'SeniorCitizen': int(customer_data.get('SeniorCitizen', 0)),
+        'Partner': 1 if customer_data.get('Partner') == 'Yes' else 0,
+        'Dependents': 1 if customer_data.get('Dependents') == 'Yes' else 0,
+        'MonthlyCharges': float(customer_data.get('MonthlyCharges', 0)),
+        'Contract_Monthly': 1 if customer_data.get('Contract') == 'Month-to-month' else 0,
+        'Contract_OneYear': 1 if customer_data.get('Contract') == 'One year' else 0,
+        'PaperlessBilling': 1 if customer_data.get('PaperlessBilling') == 'Yes' else 0,
+        'PaymentMethod_Electronic': 1 if customer_data.get('PaymentMethod') == 'Electronic check' else 0,
+        'PaymentMethod_Mailed': 1 if customer_data.get('PaymentMethod') == 'Mailed check' else 0,
+        'InternetService_DSL': 1 if customer_data.get('InternetService') == 'DSL' else 0,
+        'InternetService_Fiber': 1 if customer_data.get('InternetService') == 'Fiber optic' else 0
+    }
+
+class ModelUnavailable(Exception):
+    """No Cox model has been published yet, the leader's refit job publishes the first one"""
+
+def model_unavailable_response(error):
+    response = jsonify({"error": str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(MODEL_RETRY_AFTER_SECONDS)
+    return response
+
+def load_published_scorer():
+    """
+    Swap in the model the refit job published last, if it changed (see model_registry).
+    The lookups run without the scorer lock, predictions keep using the current
+    scorer until the new one is swapped in.
+    """
+    try:
+        model_id = model_registry.published_model_id(get_db())
+        if model_id is None or model_id == _scorer_cache["model_id"]:
+            return
+        scorer = model_registry.load_scorer(get_db(), model_id)
+    except PyMongoError as e:
+        print(f"Error checking for a published survival model: {str(e)}")
+        return
+    if scorer is not None:
+        with _scorer_lock:
+            _scorer_cache.update(scorer=scorer, model_id=model_id, fitted_at=time.monotonic())
+
+def get_cox_scorer():
+    """
+    The scorer of this process: the published model, checked for a newer one every
+    MODEL_CHECK_SECONDS. Nothing is fitted in the worker, ModelUnavailable is raised
+    until the refit job (see scheduler.refit_survival_model) publishes a model.
+    """
+    with _scorer_lock:
+        now = time.monotonic()
+        # One request per interval checks the registry, every request while there is no model
+        check = (_scorer_cache["scorer"] is None
+                 or now - _scorer_cache["checked_at"] >= MODEL_CHECK_SECONDS)
+        if check:
+            _scorer_cache["checked_at"] = now
+    if check:
+        load_published_scorer()
+    
+    scorer = _scorer_cache["scorer"]
+    record_cache("cox_scorer", scorer is not None)
+    if scorer is None:
+        raise ModelUnavailable("The survival model is not published yet, try again shortly")
+    return scorer
+
 def prepare_survival_data():
     """
     Prepare data for survival analysis.
@@ -17,327 +138,398 @@ def prepare_survival_data():
     db_connection = get_db()
     users_collection = db_connection.users
     
-    # Get all users from MongoDB
-    users = list(users_collection.find())
+    with span("load_customers"):
+        # Get all users from MongoDB
+        users = list(users_collection.find())
     
-    # Convert to pandas DataFrame
-    data = []
-    for user in users:
-        # MongoDB documents are already dictionaries
-        user_dict = {k: v for k, v in user.items() if k != '_id'}  # Exclude _id field
-        data.append(user_dict)
+        # Convert to pandas DataFrame
+        data = []
+        for user in users:
+            # MongoDB documents are already dictionaries
+            user_dict = {k: v for k, v in user.items() if k != '_id'}  # Exclude _id field
+            data.append(user_dict)
     
-    df = pd.DataFrame(data)
+        df = pd.DataFrame(data)
     
-    # Create event indicator (1 for churned, 0 for not churned)
-    df['event'] = (df['Churn'] == 'Yes').astype(int)
+    with span("encode_features", rows=len(df)):
+        # Create event indicator (1 for churned, 0 for not churned)
+        df['event'] = (df['Churn'] == 'Yes').astype(int)
     
-    # Encode categorical variables to dummy variables
-    # Encode gender (1 for Male, 0 for Female)
-    df['gender'] = (df['gender'] == 'Male').astype(int)
+        # Encode categorical variables to dummy variables
+        # Encode gender (1 for Male, 0 for Female)
+        df['gender'] = (df['gender'] == 'Male').astype(int)
     
-    # Encode yes/no variables
-    for col in ['Partner', 'Dependents', 'PhoneService', 'PaperlessBilling']:
-        df[col] = (df[col] == 'Yes').astype(int)
+        # Encode yes/no variables
+        for col in ['Partner', 'Dependents', 'PhoneService', 'PaperlessBilling']:
+            df[col] = (df[col] == 'Yes').astype(int)
     
-    # Create dummy variables for contract
-    df['Contract_Monthly'] = (df['Contract'] == 'Month-to-month').astype(int)
-    df['Contract_OneYear'] = (df['Contract'] == 'One year').astype(int)
-    df['Contract_TwoYear'] = (df['Contract'] == 'Two year').astype(int)
+        # Create dummy variables for contract
+        df['Contract_Monthly'] = (df['Contract'] == 'Month-to-month').astype(int)
+        df['Contract_OneYear'] = (df['Contract'] == 'One year').astype(int)
+        df['Contract_TwoYear'] = (df['Contract'] == 'Two year').astype(int)
     
-    # Create dummy variables for internet service
-    df['InternetService_DSL'] = (df['InternetService'] == 'DSL').astype(int)
-    df['InternetService_Fiber'] = (df['InternetService'] == 'Fiber optic').astype(int)
-    df['InternetService_No'] = (df['InternetService'] == 'No').astype(int)
+        # Create dummy variables for internet service
+        df['InternetService_DSL'] = (df['InternetService'] == 'DSL').astype(int)
+        df['InternetService_Fiber'] = (df['InternetService'] == 'Fiber optic').astype(int)
+        df['InternetService_No'] = (df['InternetService'] == 'No').astype(int)
     
-    # Create dummy variables for payment method
-    df['PaymentMethod_Electronic'] = (df['PaymentMethod'] == 'Electronic check').astype(int)
-    df['PaymentMethod_Mailed'] = (df['PaymentMethod'] == 'Mailed check').astype(int)
-    df['PaymentMethod_BankTransfer'] = (df['PaymentMethod'] == 'Bank transfer (automatic)').astype(int)
-    df['PaymentMethod_CreditCard'] = (df['PaymentMethod'] == 'Credit card (automatic)').astype(int)
+        # Create dummy variables for payment method
+        df['PaymentMethod_Electronic'] = (df['PaymentMethod'] == 'Electronic check').astype(int)
+        df['PaymentMethod_Mailed'] = (df['PaymentMethod'] == 'Mailed check').astype(int)
+        df['PaymentMethod_BankTransfer'] = (df['PaymentMethod'] == 'Bank transfer (automatic)').astype(int)
+        df['PaymentMethod_CreditCard'] = (df['PaymentMethod'] == 'Credit card (automatic)').astype(int)
     
-    # Replace missing values if any
-    df = df.fillna(0)
+        # Replace missing values if any
+        df = df.fillna(0)
     
     # Make sure tenure is at least 1 for survival analysis
+    # Numeric fields are stored as numbers (see customer_schema), so no parsing is needed
     if 'tenure' in df.columns:
-        df['tenure'] = pd.to_numeric(df['tenure'], errors='coerce').fillna(1).clip(lower=1)
+        df['tenure'] = df['tenure'].clip(lower=1)
     else:
         df['tenure'] = 1  # Default value if tenure is missing
     
-    # Convert numeric columns to appropriate types
-    if 'MonthlyCharges' in df.columns:
-        df['MonthlyCharges'] = pd.to_numeric(df['MonthlyCharges'], errors='coerce').fillna(0)
-    
-    if 'TotalCharges' in df.columns:
-        df['TotalCharges'] = pd.to_numeric(df['TotalCharges'], errors='coerce').fillna(0)
-    
     return df
 
-@survival_bp.route('/survival-curve', methods=['GET'])
-def get_survival_curve():
-    """Generate Kaplan Meier survival curves for different customer segments"""
+def kaplan_meier_curve(durations, events, label):
+    """Kaplan Meier curve with its 95% confidence interval, rounded to CURVE_DECIMALS"""
+    kmf = KaplanMeierFitter()
+    kmf.fit(durations, events, label=label)
+    
+    # Extract survival function timeline and probabilities
+    timeline = kmf.timeline.tolist()
+    survival_prob = kmf.survival_function_.values.flatten().round(CURVE_DECIMALS).tolist()
+    
+    # Handle confidence intervals
     try:
-        # Prepare data for survival analysis
-        df = prepare_survival_data()
-        
-        # Fit Kaplan Meier model on the entire dataset
-        kmf = KaplanMeierFitter()
-        kmf.fit(df['tenure'], df['event'], label='Overall')
-        
-        # Extract survival function timeline and probabilities
-        timeline = kmf.timeline.tolist()
-        survival_prob = kmf.survival_function_.values.flatten().tolist()
+        # Check the structure of confidence interval DataFrame to get correct column names
+        ci_columns = list(kmf.confidence_interval_.columns)
+        lower_ci_col = [col for col in ci_columns if 'lower' in col.lower()][0]
+        upper_ci_col = [col for col in ci_columns if 'upper' in col.lower()][0]
         
-        # Handle confidence intervals
-        try:
-            # Check the structure of confidence interval DataFrame to get correct column names
-            ci_columns = list(kmf.confidence_interval_.columns)
-            lower_ci_col = [col for col in ci_columns if 'lower' in col.lower()][0]
-            upper_ci_col = [col for col in ci_columns if 'upper' in col.lower()][0]
-            
-            lower_bound = kmf.confidence_interval_[lower_ci_col].values.tolist()
-            upper_bound = kmf.confidence_interval_[upper_ci_col].values.tolist()
-        except (KeyError, IndexError, AttributeError) as e:
-            print(f"Error extracting confidence intervals: {e}")
-            print(f"Available columns: {ci_columns if 'ci_columns' in locals() else 'unknown'}")
-            # Fallback values if confidence intervals cannot be extracted
-            lower_bound = [max(0, p*0.9) for p in survival_prob]
-            upper_bound = [min(1, p*1.1) for p in survival_prob]
+        lower_bound = kmf.confidence_interval_[lower_ci_col].values.round(CURVE_DECIMALS).tolist()
+        upper_bound = kmf.confidence_interval_[upper_ci_col].values.round(CURVE_DECIMALS).tolist()
+    except (KeyError, IndexError, AttributeError) as e:
+        print(f"Error extracting confidence intervals for {label}: {e}")
+        # Fallback values if confidence intervals cannot be extracted
+        lower_bound = [max(0, p*0.9) for p in survival_prob]
+        upper_bound = [min(1, p*1.1) for p in survival_prob]
+    
+    return {
+        'timeline': timeline,
+        'survival_prob': survival_prob,
+        'lower_bound': lower_bound,
+        'upper_bound': upper_bound
+    }
+
+def contract_logrank(df):
+    """Log rank test between month to month and two year contracts"""
+    monthly_subset = df[df['Contract_Monthly'] == 1]
+    twoyear_subset = df[df['Contract_TwoYear'] == 1]
+    
+    if len(monthly_subset) > 0 and len(twoyear_subset) > 0:
+        logrank_result = logrank_test(
+            monthly_subset['tenure'], 
+            twoyear_subset['tenure'], 
+            monthly_subset['event'], 
+            twoyear_subset['event']
+        )
         
-        # Get survival curves for different segments
-        curves = {
-            'overall': {
-                'timeline': timeline,
-                'survival_prob': survival_prob,
-                'lower_bound': lower_bound,
-                'upper_bound': upper_bound
-            }
+        return {
+            'test_name': 'Log rank test between month-to-month and two-year contracts',
+            'p_value': float(logrank_result.p_value),
+            'test_statistic': float(logrank_result.test_statistic),
+            'interpretation': 'Significant difference in survival patterns' if logrank_result.p_value < 0.05 else 'No significant difference in survival patterns'
         }
-        
-        # Add segment specific curves - Contract Type
-        contract_types = ['Contract_Monthly', 'Contract_OneYear', 'Contract_TwoYear']
-        for contract in contract_types:
-            subset = df[df[contract] == 1]
-            if len(subset) > 0:
-                kmf = KaplanMeierFitter()
-                kmf.fit(subset['tenure'], subset['event'], label=contract)
-                
-                # Extract basic curve data
-                contract_timeline = kmf.timeline.tolist()
-                contract_survival = kmf.survival_function_.values.flatten().tolist()
-                
-                # Extract confidence intervals with error handling
-                try:
-                    ci_columns = list(kmf.confidence_interval_.columns)
-                    lower_ci_col = [col for col in ci_columns if 'lower' in col.lower()][0]
-                    upper_ci_col = [col for col in ci_columns if 'upper' in col.lower()][0]
-                    
-                    contract_lower = kmf.confidence_interval_[lower_ci_col].values.tolist()
-                    contract_upper = kmf.confidence_interval_[upper_ci_col].values.tolist()
-                except (KeyError, IndexError, AttributeError) as e:
-                    print(f"Error extracting confidence intervals for {contract}: {e}")
-                    # Fallback values
-                    contract_lower = [max(0, p*0.9) for p in contract_survival]
-                    contract_upper = [min(1, p*1.1) for p in contract_survival]
-                
-                curves[contract] = {
-                    'timeline': contract_timeline,
-                    'survival_prob': contract_survival,
-                    'lower_bound': contract_lower,
-                    'upper_bound': contract_upper
-                }
-        
-        # Add segment specific curves - Internet Service
-        internet_types = ['InternetService_DSL', 'InternetService_Fiber', 'InternetService_No']
-        for internet in internet_types:
-            subset = df[df[internet] == 1]
-            if len(subset) > 0:
-                kmf = KaplanMeierFitter()
-                kmf.fit(subset['tenure'], subset['event'], label=internet)
-                
-                # Extract basic curve data
-                internet_timeline = kmf.timeline.tolist()
-                internet_survival = kmf.survival_function_.values.flatten().tolist()
-                
-                # Extract confidence intervals with error handling
-                try:
-                    ci_columns = list(kmf.confidence_interval_.columns)
-                    lower_ci_col = [col for col in ci_columns if 'lower' in col.lower()][0]
-                    upper_ci_col = [col for col in ci_columns if 'upper' in col.lower()][0]
-                    
-                    internet_lower = kmf.confidence_interval_[lower_ci_col].values.tolist()
-                    internet_upper = kmf.confidence_interval_[upper_ci_col].values.tolist()
-                except (KeyError, IndexError, AttributeError) as e:
-                    print(f"Error extracting confidence intervals for {internet}: {e}")
-                    # Fallback values
-                    internet_lower = [max(0, p*0.9) for p in internet_survival]
-                    internet_upper = [min(1, p*1.1) for p in internet_survival]
-                
-                curves[internet] = {
-                    'timeline': internet_timeline,
-                    'survival_prob': internet_survival,
-                    'lower_bound': internet_lower,
-                    'upper_bound': internet_upper
-                }
-        
-        # Perform log rank test between month to month and two year contracts
-        monthly_subset = df[df['Contract_Monthly'] == 1]
-        twoyear_subset = df[df['Contract_TwoYear'] == 1]
-        
-        if len(monthly_subset) > 0 and len(twoyear_subset) > 0:
-            logrank_result = logrank_test(
-                monthly_subset['tenure'], 
-                twoyear_subset['tenure'], 
-                monthly_subset['event'], 
-                twoyear_subset['event']
-            )
-            
-            statistical_insights = {
-                'test_name': 'Log rank test between month-to-month and two-year contracts',
-                'p_value': logrank_result.p_value,
-                'test_statistic': logrank_result.test_statistic,
-                'interpretation': 'Significant difference in survival patterns' if logrank_result.p_value < 0.05 else 'No significant difference in survival patterns'
-            }
+    return {
+        'test_name': 'Log-rank test',
+        'p_value': None,
+        'interpretation': 'Not enough data to perform statistical test'
+    }
+
+def iter_survival_curves(df):
+    """
+    The overall and per segment Kaplan Meier curves, then the contract log rank
+    test, as (event, data) pairs as soon as each is computed
+    """
+    # Fit Kaplan Meier model on the entire dataset
+    yield 'curve', {'segment': 'overall', **kaplan_meier_curve(df['tenure'], df['event'], 'Overall')}
+    
+    # Add segment specific curves - Contract Type and Internet Service
+    for segment in SURVIVAL_CURVE_SEGMENTS:
+        subset = df[df[segment] == 1]
+        if len(subset) > 0:
+            yield 'curve', {'segment': segment, **kaplan_meier_curve(subset['tenure'], subset['event'], segment)}
+    
+    yield 'logrank', contract_logrank(df)
+
+def compute_survival_curves(df):
+    """Overall and per segment Kaplan Meier curves and the contract log rank test"""
+    result = {'curves': {}, 'statistical_insights': None}
+    for event, data in iter_survival_curves(df):
+        if event == 'curve':
+            result['curves'][data.pop('segment')] = data
         else:
-            statistical_insights = {
-                'test_name': 'Log-rank test',
-                'p_value': None,
-                'interpretation': 'Not enough data to perform statistical test'
-            }
+            result['statistical_insights'] = data
+    return result
+
+def store_survival_curves(db, day, df):
+    """Compute the curves of the customers in df and store them as the snapshot of day"""
+    result = compute_survival_curves(df)
+    db.survival_curves.update_one(
+        {"timestamp": day},
+        {"$set": {"timestamp": day, "customers": int(len(df)), **result}},
+        upsert=True
+    )
+    return result
+
+def serialize_survival_snapshot(snapshot):
+    return {
+        'curves': snapshot['curves'],
+        'statistical_insights': snapshot['statistical_insights'],
+        'snapshot_date': snapshot['timestamp'].strftime('%Y-%m-%d'),
+        'customers': snapshot.get('customers'),
+        'source': 'snapshot'
+    }
+
+def requested_survival_curves():
+    """
+    The stored curves of ?date=YYYY-MM-DD, or of the latest day unless ?live=true.
+    Returns the curves (None when they have to be computed live) and an error response.
+    """
+    date = request.args.get('date')
+    if date:
+        try:
+            day = datetime.strptime(date, '%Y-%m-%d')
+        except ValueError:
+            return None, (jsonify({"error": "date must be in YYYY-MM-DD format"}), 400)
+        snapshot = get_db().survival_curves.find_one({"timestamp": day}, {"_id": 0})
+        if snapshot is None:
+            return None, (jsonify({"error": f"No survival curves stored for {date}"}), 404)
+        return serialize_survival_snapshot(snapshot), None
+    
+    if request.args.get('live', 'false').lower() == 'true':
+        return None, None
+    response = _curve_cache["response"]
+    fresh = response is not None and time.monotonic() - _curve_cache["loaded_at"] < CURVE_CACHE_SECONDS
+    record_cache("survival_curves", fresh)
+    if fresh:
+        return response, None
+    snapshot = get_db().survival_curves.find_one({}, {"_id": 0}, sort=[("timestamp", -1)])
+    if snapshot is None:
+        # Nothing stored before the first daily capture
+        return None, None
+    response = serialize_survival_snapshot(snapshot)
+    _curve_cache.update(response=response, loaded_at=time.monotonic())
+    return response, None
+
+@survival_bp.route('/survival-curve', methods=['GET'])
+def get_survival_curve():
+    """
+    Kaplan Meier survival curves for different customer segments. Served from the
+    curves the daily analytics capture stores, ?date=YYYY-MM-DD for an earlier day
+    and ?live=true to compute them from the current customers.
+    """
+    try:
+        stored, error = requested_survival_curves()
+        if error is not None:
+            return error
+        if stored is not None:
+            return jsonify(stored)
         
-        return jsonify({
-            'curves': curves,
-            'statistical_insights': statistical_insights
-        })
+        # Nothing stored yet (or asked for), compute from the current customers
+        result = compute_survival_curves(prepare_survival_data())
+        result['source'] = 'live'
+        return jsonify(result)
     
     except Exception as e:
         print(f"Error generating survival curves: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@survival_bp.route('/survival-curve/stream', methods=['GET'])
+def stream_survival_curve():
+    """
+    /survival-curve as Server-Sent Events: a meta event, one curve event per
+    segment and the logrank event, each sent as soon as it is computed
+    """
+    try:
+        stored, error = requested_survival_curves()
+    except Exception as e:
+        print(f"Error generating survival curves: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    if error is not None:
+        return error
+    
+    def events():
+        if stored is not None:
+            yield 'meta', {key: stored[key] for key in ('source', 'snapshot_date', 'customers')}
+            for segment, curve in stored['curves'].items():
+                yield 'curve', {'segment': segment, **curve}
+            yield 'logrank', stored['statistical_insights']
+            return
+        df = prepare_survival_data()
+        yield 'meta', {'source': 'live', 'customers': int(len(df))}
+        yield from iter_survival_curves(df)
+    
+    return event_stream(events())
+
+@survival_bp.route('/survival-curve/dates', methods=['GET'])
+def get_survival_curve_dates():
+    """Days with stored survival curves, newest first"""
+    snapshots = get_db().survival_curves.find({}, {"_id": 0, "timestamp": 1}, sort=[("timestamp", -1)])
+    return jsonify({"dates": [snapshot['timestamp'].strftime('%Y-%m-%d') for snapshot in snapshots]})
+
+def bootstrap_intervals(risk_factors, data_version, features, coefficients):
+    """
+    Swap in the bootstrap intervals of the data version when they are done,
+    otherwise start computing them in the background. Returns their status.
+    """
+    run = bootstrap.load_bootstrap(get_db(), data_version)
+    status = {
+        'method': 'asymptotic',
+        'bootstrap': {
+            'status': run['status'] if run else 'running',
+            'data_version': data_version,
+            'resamples': bootstrap.BOOTSTRAP_RESAMPLES,
+            'seed': bootstrap.BOOTSTRAP_SEED
+        }
+    }
+    if run is None or run['status'] != 'done':
+        # The warm start from the serving model makes every refit a few iterations
+        bootstrap.start_bootstrap(current_app._get_current_object(), prepare_survival_data,
+                                  data_version, features, coefficients)
+        return status
+    
+    for factor in risk_factors:
+        interval = run['factors'].get(factor['feature'])
+        if interval is None:
+            continue
+        factor['asymptotic_lower_ci'] = factor['lower_ci']
+        factor['asymptotic_upper_ci'] = factor['upper_ci']
+        factor['lower_ci'] = interval['lower_ci']
+        factor['upper_ci'] = interval['upper_ci']
+        factor['bootstrap_std_error'] = interval['std_error']
+    status['method'] = 'bootstrap'
+    status['bootstrap'].update(
+        successful_resamples=run['successful_resamples'],
+        confidence=run['confidence'],
+        computed_at=run['computed_at'].isoformat()
+    )
+    return status
+
+def risk_factor_rows(summary, features):
+    """Coefficients, hazard ratios and intervals of the features, the significant and strongest first"""
+    risk_factors = []
+    for feature in features:
+        statistics = summary['coefficients'].get(feature)
+        if statistics is None:
+            continue
+        coef = statistics['coef']
+        p_value = statistics['p']
+        risk_factors.append({
+            'feature': feature,
+            'coefficient': coef,
+            'hazard_ratio': float(np.exp(coef)),
+            'p_value': p_value,
+            'is_significant': p_value < 0.05,
+            # Asymptotic 95% confidence interval, exp(coef -/+ z * se) as lifelines reports it
+            'lower_ci': float(np.exp(coef - Z_95 * statistics['se'])),
+            'upper_ci': float(np.exp(coef + Z_95 * statistics['se']))
+        })
+    
+    # Sort by significance
+    risk_factors.sort(key=lambda x: (not x['is_significant'], -abs(x['hazard_ratio'] - 1)))
+    return risk_factors
+
+def risk_factor_model_summary(summary):
+    """Performance metrics and summary statistics of the model"""
+    model_metrics = {
+        'concordance_index': round(summary['concordance_index'], 3),
+    }
+    return model_metrics, {
+        'number_of_observations': summary['observations'],
+        'number_of_events': summary['events'],
+        'log_likelihood_ratio_test': summary['log_likelihood_ratio_test'],
+        'p_value': summary['log_likelihood_ratio_p_value']
+    }
+
+def risk_factor_ci_method():
+    ci_method = request.args.get('ci', 'asymptotic').lower()
+    return ci_method if ci_method in ('asymptotic', 'bootstrap') else None
+
 @survival_bp.route('/risk-factors', methods=['GET'])
 def get_risk_factors():
-    """Generate Cox Proportional Hazards model to identify risk factors for churn"""
+    """
+    Risk factors for churn from the serving Cox Proportional Hazards model (the
+    published one, see model_registry), so nothing is fitted in the request.
+    ?ci=bootstrap replaces the asymptotic intervals with bootstrap ones once they
+    are computed for the current data (see bootstrap.py).
+    """
+    ci_method = risk_factor_ci_method()
+    if ci_method is None:
+        return jsonify({"error": "ci must be asymptotic or bootstrap"}), 400
     try:
-        # Prepare data for factor analysis
-        df = prepare_survival_data()
-        
-        # Select features for the Cox model
-        features = [
-            'gender', 'SeniorCitizen', 'Partner', 'Dependents', 'MonthlyCharges',
-            'Contract_Monthly', 'Contract_OneYear', 'PaperlessBilling',
-            'PaymentMethod_Electronic', 'PaymentMethod_Mailed', 'InternetService_DSL', 
-            'InternetService_Fiber'
-        ]
-        
-        # Check that all features exist in the df
-        features = [f for f in features if f in df.columns]
-        
-        if len(features) < 2:
-            return jsonify({"error": "Not enough valid features for risk factor analysis"}), 400
+        scorer = get_cox_scorer()
+        # None for a model published before the summaries were stored
+        summary = scorer.summary
+        if summary is None:
+            return jsonify({"error": "The serving survival model has no summary yet, the next refit adds it"}), 503
         
-        # Fit Cox Proportional Hazards model with error handling
-        cph = CoxPHFitter()
-        try:
-            cph.fit(df[features + ['tenure', 'event']], duration_col='tenure', event_col='event')
-            
-            # Extract coefficients and hazard ratios
-            summary = cph.summary
-            
-            # Convert to format suitable for frontend
-            risk_factors = []
-            for feature in features:
-                try:
-                    coef = float(summary.loc[feature, 'coef'])
-                    hazard_ratio = float(summary.loc[feature, 'exp(coef)'])
-                    p_value = float(summary.loc[feature, 'p'])
-                    
-                    # Get confidence intervals
-                    try:
-                        lower_ci = float(summary.loc[feature, 'exp(coef) lower 95%'])
-                        upper_ci = float(summary.loc[feature, 'exp(coef) upper 95%'])
-                    except KeyError:
-                        # Alternative column names
-                        ci_columns = [col for col in summary.columns if 'lower' in col.lower()]
-                        if ci_columns:
-                            lower_ci = float(summary.loc[feature, ci_columns[0]])
-                            upper_ci_cols = [col for col in summary.columns if 'upper' in col.lower()]
-                            upper_ci = float(summary.loc[feature, upper_ci_cols[0]]) if upper_ci_cols else lower_ci * 1.5
-                        else:
-                            lower_ci = hazard_ratio * 0.8
-                            upper_ci = hazard_ratio * 1.2
-                    
-                    risk_factors.append({
-                        'feature': feature,
-                        'coefficient': coef,
-                        'hazard_ratio': hazard_ratio,
-                        'p_value': p_value,
-                        'is_significant': p_value < 0.05,
-                        'lower_ci': lower_ci,
-                        'upper_ci': upper_ci
-                    })
-                except Exception as e:
-                    print(f"Error processing feature {feature}: {str(e)}")
-                    continue
-            
-            # Sort by significance
-            risk_factors.sort(key=lambda x: (not x['is_significant'], -abs(x['hazard_ratio'] - 1)))
-            
-            # Get model performance metrics
-            try:
-                concordance_index = round(float(cph.concordance_index_), 3)
-            except:
-                concordance_index = 0.5
-                
-            try:
-                log_likelihood = round(float(cph.log_likelihood_), 2)
-            except:
-                log_likelihood = 0.0
-                
-            model_metrics = {
-                'concordance_index': concordance_index,
-            }
-            
-            # Get summary statistics
-            n_observations = int(summary['n'].iloc[0]) if 'n' in summary.columns else int(len(df))
-            n_events = int(summary['n_events'].iloc[0]) if 'n_events' in summary.columns else int(df['event'].sum())
-            
-            try:
-                log_likelihood_ratio = float(summary['log_likelihood_ratio_test'].iloc[0])
-                p_value = float(np.exp(-log_likelihood_ratio / 2))
-            except:
-                log_likelihood_ratio = 0.0
-                p_value = 1.0
-            
-            # Convert any potential numpy types to python native types
-            risk_factors = [
-                {k: int(v) if isinstance(v, np.integer) else float(v) if isinstance(v, np.floating) else v 
-                 for k, v in factor.items()}
-                for factor in risk_factors
-            ]
-            
-            return jsonify({
-                'risk_factors': risk_factors,
-                'model_metrics': model_metrics,
-                'model_summary': {
-                    'number_of_observations': int(n_observations),
-                    'number_of_events': int(n_events),
-                    'log_likelihood_ratio_test': float(log_likelihood_ratio),
-                    'p_value': float(p_value)
-                }
-            })
+        risk_factors = risk_factor_rows(summary, scorer.features)
+        confidence_intervals = {'method': 'asymptotic'}
+        if ci_method == 'bootstrap':
+            confidence_intervals = bootstrap_intervals(risk_factors, current_data_version(get_db()),
+                                                       scorer.features, scorer.coefficients)
         
-        except Exception as e:
-            print(f"Error fitting Cox model: {str(e)}")
-            return jsonify({
-                "error": "Failed to fit Cox model with the provided data",
-                "details": str(e)
-            }), 500
+        model_metrics, model_summary = risk_factor_model_summary(summary)
+        return jsonify({
+            'risk_factors': risk_factors,
+            'model_metrics': model_metrics,
+            'confidence_intervals': confidence_intervals,
+            'model_summary': model_summary
+        })
     
+    except ModelUnavailable as e:
+        return model_unavailable_response(e)
     except Exception as e:
         print(f"Error generating risk factors: {str(e)}")
         return jsonify({"error": str(e)}), 500
+
+@survival_bp.route('/risk-factors/stream', methods=['GET'])
+def stream_risk_factors():
+    """
+    /risk-factors as Server-Sent Events: a meta event once the serving model is
+    loaded, one factor event per row, then the confidence_intervals and model events
+    """
+    ci_method = risk_factor_ci_method()
+    if ci_method is None:
+        return jsonify({"error": "ci must be asymptotic or bootstrap"}), 400
+    # Before the stream starts, so a missing model is still a 503
+    try:
+        scorer = get_cox_scorer()
+    except ModelUnavailable as e:
+        return model_unavailable_response(e)
+    
+    def events():
+        summary = scorer.summary
+        if summary is None:
+            raise ValueError("The serving survival model has no summary yet, the next refit adds it")
+        yield 'meta', {'customers': summary['observations'], 'features': scorer.features}
+        
+        risk_factors = risk_factor_rows(summary, scorer.features)
+        confidence_intervals = {'method': 'asymptotic'}
+        if ci_method == 'bootstrap':
+            confidence_intervals = bootstrap_intervals(risk_factors, current_data_version(get_db()),
+                                                       scorer.features, scorer.coefficients)
+        for factor in risk_factors:
+            yield 'factor', factor
+        yield 'confidence_intervals', confidence_intervals
         
+        model_metrics, model_summary = risk_factor_model_summary(summary)
+        yield 'model', {'model_metrics': model_metrics, 'model_summary': model_summary}
+    
+    return event_stream(events())
+
 @survival_bp.route('/survival-prediction', methods=['POST'])
 def predict_survival():
     """Predict survival probability for a given customer over time"""
@@ -345,53 +537,23 @@ def predict_survival():
         # Get customer data from request
         customer_data = request.json
         
-        # Prepare data for survival analysis
-        df = prepare_survival_data()
-        
-        # Select features for the model
-        features = [
-            'gender', 'SeniorCitizen', 'Partner', 'Dependents', 'MonthlyCharges',
-            'Contract_Monthly', 'Contract_OneYear', 'PaperlessBilling',
-            'PaymentMethod_Electronic', 'PaymentMethod_Mailed', 'InternetService_DSL', 
-            'InternetService_Fiber'
-        ]
-        
-        # Fit Cox Proportional Hazards model
-        cph = CoxPHFitter()
-        cph.fit(df[features + ['tenure', 'event']], duration_col='tenure', event_col='event')
-        
-        # Prepare customer data in the required format
-        customer_features = {
-            'gender': 1 if customer_data.get('gender') == 'Male' else 0,
-            'SeniorCitizen': int(customer_data.get('SeniorCitizen', 0)),
-            'Partner': 1 if customer_data.get('Partner') == 'Yes' else 0,
-            'Dependents': 1 if customer_data.get('Dependents') == 'Yes' else 0,
-            'MonthlyCharges': float(customer_data.get('MonthlyCharges', 0)),
-            'Contract_Monthly': 1 if customer_data.get('Contract') == 'Month-to-month' else 0,
-            'Contract_OneYear': 1 if customer_data.get('Contract') == 'One year' else 0,
-            'PaperlessBilling': 1 if customer_data.get('PaperlessBilling') == 'Yes' else 0,
-            'PaymentMethod_Electronic': 1 if customer_data.get('PaymentMethod') == 'Electronic check' else 0,
-            'PaymentMethod_Mailed': 1 if customer_data.get('PaymentMethod') == 'Mailed check' else 0,
-            'InternetService_DSL': 1 if customer_data.get('InternetService') == 'DSL' else 0,
-            'InternetService_Fiber': 1 if customer_data.get('InternetService') == 'Fiber optic' else 0
-        }
+        # The published Cox model, see model_registry
+        scorer = get_cox_scorer()
         
-        # Create a dataframe for the customer
-        customer_df = pd.DataFrame([customer_features])
+        # Score the customer in NumPy, see survival_model
+        with span("cox.score"):
+            start_time = time.perf_counter()
+            customer_row = [customer_features(customer_data)]
+            survival_probs = scorer.survival(customer_row)[0].tolist()
+            median = scorer.median(customer_row)[0]
+            risk_percentile = scorer.risk_percentile(customer_row)
+            observe_model("cox_scorer", "survival", 1, time.perf_counter() - start_time)
         
-        # Predict survival function
-        survival_func = cph.predict_survival_function(customer_df)
-        
-        # Get median survival time (50% survival probability)
-        try:
-            median_survival = cph.predict_median(customer_df)[0]
-        except ValueError:
-            # If median survival is not reached within the data timeframe
-            median_survival = None
+        # Median survival time is None when 50% survival isn't reached within the data timeframe
+        median_survival = float(median) if np.isfinite(median) else None
         
         # Convert survival function to list format for the frontend
-        timeline = survival_func.index.tolist()
-        survival_probs = survival_func.values[0].tolist()
+        timeline = scorer.timeline.tolist()
         
         # Calculate churn probabilities (1 - survival)
         churn_probs = [1 - prob for prob in survival_probs]
@@ -408,9 +570,224 @@ def predict_survival():
             'churn_probabilities': churn_probs,
             'median_survival_time': median_survival,
             'customer_lifetime_value': clv,
-            'risk_percentile': None 
+            'risk_percentile': round(float(risk_percentile[0]), 1) if risk_percentile is not None else None
         })
         
+    except ModelUnavailable as e:
+        return model_unavailable_response(e)
     except Exception as e:
         print(f"Error predicting survival: {str(e)}")
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+@survival_bp.route('/survival-prediction/batch', methods=['POST'])
+def predict_survival_batch():
+    """
+    Predict survival for many customers at once, posted as "customers" or looked
+    up by "customerIDs". With "summary_only" the full curves are left out and
+    survival at SUMMARY_HORIZONS months is returned instead.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    customers = data.get('customers')
+    customer_ids = data.get('customerIDs')
+    if (customers is None) == (customer_ids is None):
+        return jsonify({"error": "Send either customers or customerIDs"}), 400
+    requested = customers if customers is not None else customer_ids
+    if not isinstance(requested, list) or not requested:
+        return jsonify({"error": "customers and customerIDs must be non-empty lists"}), 400
+    if len(requested) > BATCH_LIMIT:
+        return jsonify({"error": f"At most {BATCH_LIMIT} customers per request"}), 400
+    summary_only = bool(data.get('summary_only', False))
+
+    not_found = []
+    if customer_ids is not None:
+        # One $in query for every customer, returned in the requested order
+        projection = {"_id": 0, "customerID": 1, "gender": 1, "SeniorCitizen": 1, "Partner": 1, "Dependents": 1,
+                      "MonthlyCharges": 1, "Contract": 1, "PaperlessBilling": 1, "PaymentMethod": 1,
+                      "InternetService": 1}
+        found = {user['customerID']: user for user in get_db().users.find(
+            {"customerID": {"$in": [str(customer_id) for customer_id in customer_ids]}}, projection)}
+        customers = [found[str(customer_id)] for customer_id in customer_ids if str(customer_id) in found]
+        not_found = [customer_id for customer_id in customer_ids if str(customer_id) not in found]
+        if not customers:
+            return jsonify({"error": "No customers found", "not_found": not_found}), 404
+
+    rows = []
+    for position, customer in enumerate(customers):
+        try:
+            rows.append(customer_features(customer))
+        except (AttributeError, TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid customer at position {position}: {e}"}), 400
+
+    try:
+        scorer = get_cox_scorer()
+        with span("cox.score", rows=len(rows)):
+            start_time = time.perf_counter()
+            medians = scorer.median(rows)
+            monthly_charges = np.array([row['MonthlyCharges'] for row in rows])
+            clv = scorer.clv(rows, monthly_charges)
+            risk_percentiles = scorer.risk_percentile(rows)
+            if summary_only:
+                survival = scorer.survival_at(rows, SUMMARY_HORIZONS)
+            else:
+                survival = scorer.survival(rows)
+            observe_model("cox_scorer", "survival", len(rows), time.perf_counter() - start_time)
+    except ModelUnavailable as e:
+        return model_unavailable_response(e)
+    except Exception as e:
+        print(f"Error predicting survival batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    predictions = []
+    for index, customer in enumerate(customers):
+        prediction = {
+            'customerID': customer.get('customerID'),
+            'median_survival_time': float(medians[index]) if np.isfinite(medians[index]) else None,
+            'customer_lifetime_value': float(clv[index]) if np.isfinite(clv[index]) else None,
+            'risk_percentile': round(float(risk_percentiles[index]), 1) if risk_percentiles is not None else None
+        }
+        if summary_only:
+            # Survival at each of the horizons returned with the predictions
+            prediction['survival_at'] = survival[index].round(6).tolist()
+        else:
+            prediction['survival_probabilities'] = survival[index].tolist()
+        predictions.append(prediction)
+
+    response = {'predictions': predictions, 'not_found': not_found}
+    if summary_only:
+        response['horizons'] = list(SUMMARY_HORIZONS)
+    else:
+        # One timeline shared by every curve
+        response['timeline'] = scorer.timeline.tolist()
+    return jsonify(response)
+
+@survival_bp.route('/survival/risk-distribution', methods=['GET'])
+def get_risk_distribution():
+    """
+    Histogram of the customers' partial hazards (their hazard relative to a
+    customer with average covariates) on log-spaced bins, from the risk index
+    of the current Cox model
+    """
+    try:
+        bins = int(request.args.get('bins', 20))
+    except ValueError:
+        return jsonify({"error": "bins must be a number"}), 400
+    if not 1 <= bins <= 200:
+        return jsonify({"error": "bins must be between 1 and 200"}), 400
+
+    try:
+        risk_index = get_cox_scorer().risk_index
+    except ModelUnavailable as e:
+        return model_unavailable_response(e)
+    except Exception as e:
+        print(f"Error fitting the Cox model: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    if risk_index is None:
+        return jsonify({"error": "No customers to build the risk distribution from"}), 404
+
+    edges, counts = risk_index.histogram(bins)
+    cumulative = np.cumsum(counts) / len(risk_index) * 100
+    return jsonify({
+        'number_of_customers': len(risk_index),
+        'bins': [
+            {
+                'lower': float(edges[index]),
+                'upper': float(edges[index + 1]),
+                'count': int(counts[index]),
+                'cumulative_percent': round(float(cumulative[index]), 2)
+            }
+            for index in range(bins)
+        ]
+    })
+
+@survival_bp.route('/survival/risk-distribution/quantiles', methods=['GET'])
+def get_risk_quantiles():
+    """Partial hazard quantiles, ?q=0.5,0.9 for specific ones"""
+    try:
+        if request.args.get('q'):
+            probabilities = [float(value) for value in request.args['q'].split(',')]
+        else:
+            probabilities = list(DEFAULT_RISK_QUANTILES)
+    except ValueError:
+        return jsonify({"error": "q must be a comma separated list of numbers"}), 400
+    if not all(0 <= probability <= 1 for probability in probabilities):
+        return jsonify({"error": "Quantiles must be between 0 and 1"}), 400
+
+    try:
+        risk_index = get_cox_scorer().risk_index
+    except ModelUnavailable as e:
+        return model_unavailable_response(e)
+    except Exception as e:
+        print(f"Error fitting the Cox model: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    if risk_index is None:
+        return jsonify({"error": "No customers to build the risk distribution from"}), 404
+
+    values = risk_index.quantiles(probabilities)
+    return jsonify({
+        'number_of_customers': len(risk_index),
+        'quantiles': [
+            {'quantile': probability, 'partial_hazard': float(value)}
+            for probability, value in zip(probabilities, values)
+        ]
+    })
+
+@survival_bp.route('/survival/portfolio-clv', methods=['GET'])
+def get_portfolio_clv():
+    """
+    Portfolio CLV, revenue at risk and expected remaining lifetime of the active
+    customers, overall and per segment, from the latest daily portfolio run
+    """
+    document = _portfolio_cache["document"]
+    fresh = document is not None and time.monotonic() - _portfolio_cache["loaded_at"] < PORTFOLIO_CACHE_SECONDS
+    record_cache("portfolio_clv", fresh)
+    if not fresh:
+        document = get_db().portfolio_clv.find_one({}, {"_id": 0}, sort=[("computed_at", -1)])
+        if document is None:
+            return jsonify({"error": "The portfolio CLV has not been computed yet"}), 404
+        document["computed_at"] = document["computed_at"].isoformat()
+        _portfolio_cache.update(document=document, loaded_at=time.monotonic())
+    return jsonify(document)
+
+@survival_bp.route('/survival/logrank-matrix', methods=['GET'])
+def get_logrank_matrix():
+    """
+    Log rank tests between every pair of segments of ?by=<column> (Contract by
+    default), p-values adjusted with ?correction=holm|bonferroni|none
+    """
+    column = request.args.get('by', 'Contract')
+    if column not in LOGRANK_COLUMNS:
+        return jsonify({"error": f"by must be one of {LOGRANK_COLUMNS}"}), 400
+    correction = request.args.get('correction', 'holm').lower()
+    if correction not in CORRECTIONS:
+        return jsonify({"error": f"correction must be one of {list(CORRECTIONS)}"}), 400
+    try:
+        alpha = float(request.args.get('alpha', 0.05))
+    except ValueError:
+        return jsonify({"error": "alpha must be a number"}), 400
+    if not 0 < alpha < 1:
+        return jsonify({"error": "alpha must be between 0 and 1"}), 400
+
+    try:
+        db = get_db()
+        # The counts only change with the customers, reuse them until the data version moves
+        key = (column, current_data_version(db))
+        rows = _logrank_counts.get(key)
+        record_cache("logrank_counts", rows is not None)
+        if rows is None:
+            with span("logrank_counts", column=column):
+                rows = list(db.users.aggregate(tenure_counts_pipeline(column)))
+            for stale in [cached for cached in list(_logrank_counts) if cached[1] != key[1]]:
+                _logrank_counts.pop(stale, None)
+            _logrank_counts[key] = rows
+        if len({row["_id"]["segment"] for row in rows}) < 2:
+            return jsonify({"error": f"Not enough {column} segments to compare"}), 404
+        with span("logrank_matrix", column=column):
+            result = logrank_matrix(rows, correction, alpha)
+    except Exception as e:
+        print(f"Error computing the log rank matrix: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    result['by'] = column
+    return jsonify(result)
@@ -1,12 +1,28 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from datetime import datetime, timedelta
 from db import get_db
+from models import UserCollection
+from historical_rollups import ensure_historical_indexes, roll_up_closed_days, store_daily_snapshot
+from leader_election import LeaderLease, HEARTBEAT_SECONDS
+from index_advisor import ensure_indexes
+from metrics import scheduler_job_duration
+from request_context import job_context
+from async_db import Query, gather_queries
+from routes.analytics_routes import TENURE_GROUPS, churn_rate_queries, churn_rates
+from routes.survival_routes import (prepare_survival_data, get_cox_scorer, store_survival_curves, COX_FEATURES,
+                                    ModelUnavailable)
+from data_version import current_data_version
+import model_registry
+from portfolio import compute_portfolio_clv
+import time
 import requests
 import json
 import os
 import logging
 import flask
+from functools import partial
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -14,6 +30,12 @@ logger = logging.getLogger(__name__)
 
 flask_app = None
 
+# Only the holder of this lease runs scheduled jobs
+leader_lease = LeaderLease('scheduler')
+
+# The running scheduler, the heartbeat queues the takeover jobs on it
+scheduler_instance = None
+
 def capture_daily_analytics():
     """
     Captures the current analytics data and stores it in the historical_analytics collection.
@@ -29,80 +51,43 @@ def capture_daily_analytics():
         with flask_app.app_context():
             # Get MongoDB connection
             db_connection = get_db()
-            historical_collection = db_connection.historical_analytics
-            users_collection = db_connection.users
             
             # Get the same analytics data that the dashboard endpoint would return
-            total_users = users_collection.count_documents({})
-            churned_users = users_collection.count_documents({"Churn": "Yes"})
+            # Independent queries are sent together, see async_db
+            total_users, churned_users, payment_methods, contracts = gather_queries([
+                Query("users", "count_documents", {}),
+                Query("users", "count_documents", {"Churn": "Yes"}),
+                Query("users", "distinct", "PaymentMethod"),
+                Query("users", "distinct", "Contract")
+            ])
             
             # Calculate the percentage of churned users
             churn_percentage = (churned_users / total_users) if total_users > 0 else 0
             not_churned_percentage = 1 - churn_percentage
             
-            # Churn rate by payment method
-            payment_methods = users_collection.distinct("PaymentMethod")
-            churn_by_payment_method = {}
-            for method in payment_methods:
-                total_by_method = users_collection.count_documents({"PaymentMethod": method})
-                churned_by_method = users_collection.count_documents({"PaymentMethod": method, "Churn": "Yes"})
-                churn_by_payment_method[method] = (churned_by_method / total_by_method * 100) if total_by_method > 0 else 0
-            
-            # Churn rate by contract
-            contracts = users_collection.distinct("Contract")
-            churn_by_contract = {}
-            for contract in contracts:
-                total_by_contract = users_collection.count_documents({"Contract": contract})
-                churned_by_contract = users_collection.count_documents({"Contract": contract, "Churn": "Yes"})
-                churn_by_contract[contract] = (churned_by_contract / total_by_contract * 100) if total_by_contract > 0 else 0
-            
-            # Churn rate by tenure group
-            tenure_groups = {
-                '0-12': {"$gte": 0, "$lte": 12},
-                '13-24': {"$gt": 12, "$lte": 24},
-                '25-36': {"$gt": 24, "$lte": 36},
-                '37-48': {"$gt": 36, "$lte": 48},
-                '49+': {"$gt": 48}
-            }
-            churn_by_tenure_group = {}
-            for group, tenure_range in tenure_groups.items():
-                total_by_group = users_collection.count_documents({"tenure": tenure_range})
-                churned_by_group = users_collection.count_documents({"tenure": tenure_range, "Churn": "Yes"})
-                churn_by_tenure_group[group] = (churned_by_group / total_by_group * 100) if total_by_group > 0 else 0
-            
-            # Capture customer segments
-            high_value_customers = users_collection.count_documents({"MonthlyCharges": {"$gt": 75}})
-            long_term_customers = users_collection.count_documents({"tenure": {"$gt": 24}})
-            new_customers = users_collection.count_documents({"tenure": {"$lt": 3}})
-            
-            # Mid term customers (tenure between 3-24 AND MonthlyCharges <= 75)
-            mid_term_customers = users_collection.count_documents({
-                "tenure": {"$gte": 3, "$lte": 24},
-                "MonthlyCharges": {"$lte": 75}
-            })
-            
-            # Calculate revenue metrics
-            all_users = users_collection.find({}, {"MonthlyCharges": 1, "TotalCharges": 1})
-            
-            # Calculate total monthly revenue
-            monthly_revenue = 0
-            total_revenue = 0
-            for user in all_users:
-                try:
-                    # Handle monthly charges
-                    if "MonthlyCharges" in user and user["MonthlyCharges"]:
-                        monthly_charge = float(user["MonthlyCharges"])
-                        monthly_revenue += monthly_charge
-                    
-                    # Handle total charges
-                    if "TotalCharges" in user and user["TotalCharges"]:
-                        total_charge_str = user["TotalCharges"]
-                        if isinstance(total_charge_str, str) and total_charge_str.strip():
-                            total_revenue += float(total_charge_str)
-                        elif not isinstance(total_charge_str, str):
-                            total_revenue += float(total_charge_str)
-                except (ValueError, TypeError) as e:
-                    logger.warning(f"Error processing charges: {e}")
+            results = gather_queries(
+                # Churn rate by payment method, contract and tenure group
+                churn_rate_queries({}, "PaymentMethod", payment_methods)
+                + churn_rate_queries({}, "Contract", contracts)
+                + churn_rate_queries({}, "tenure", TENURE_GROUPS.values())
+                + [
+                    # Customer segments, mid term is tenure 3-24 AND MonthlyCharges <= 75
+                    Query("users", "count_documents", {"MonthlyCharges": {"$gt": 75}}),
+                    Query("users", "count_documents", {"tenure": {"$gt": 24}}),
+                    Query("users", "count_documents", {"tenure": {"$lt": 3}}),
+                    Query("users", "count_documents", {
+                        "tenure": {"$gte": 3, "$lte": 24},
+                        "MonthlyCharges": {"$lte": 75}
+                    }),
+                    # Revenue metrics, charges are stored as numbers so the database sums them
+                    Query("users", "aggregate", UserCollection.revenue_pipeline())
+                ]
+            )
+            churn_by_payment_method, results = churn_rates(payment_methods, results)
+            churn_by_contract, results = churn_rates(contracts, results)
+            churn_by_tenure_group, results = churn_rates(TENURE_GROUPS, results)
+            high_value_customers, long_term_customers, new_customers, mid_term_customers, revenue = results
+            monthly_revenue, total_revenue = UserCollection.revenue_from_result(revenue)
             
             # Prepare data for storage
             analytics_data = {
@@ -131,68 +116,215 @@ def capture_daily_analytics():
             
             # Create a record with timestamp - capture midnight of current day
             today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            record = {
-                "timestamp": today_start,
-                "data": analytics_data
-            }
-            
-            # Check if we already have a record for today to avoid duplicates
-            today_end = today_start + timedelta(days=1)
-            
-            existing_record = historical_collection.find_one({
-                "timestamp": {
-                    "$gte": today_start,
-                    "$lt": today_end
-                }
-            })
             
-            if existing_record:
-                # Update existing record
-                historical_collection.update_one(
-                    {"_id": existing_record["_id"]},
-                    {"$set": record}
-                )
-                logger.info(f"Updated analytics record for {today_start.strftime('%Y-%m-%d')}")
-            else:
-                # Insert new record
-                historical_collection.insert_one(record)
+            # Keyed on the day through _id, so there is exactly one record per day
+            if store_daily_snapshot(db_connection, today_start, analytics_data):
                 logger.info(f"Created new analytics record for {today_start.strftime('%Y-%m-%d')}")
+            else:
+                logger.info(f"Updated analytics record for {today_start.strftime('%Y-%m-%d')}")
+            
+            # Kaplan Meier curves and the log rank test of the day, served by /survival-curve
+            try:
+                store_survival_curves(db_connection, today_start, prepare_survival_data())
+            except Exception as e:
+                logger.error(f"Error storing survival curves: {e}")
             
-            # Clean up old records after 90 days
-            cutoff_date = datetime.now() - timedelta(days=90)
-            delete_result = historical_collection.delete_many({"timestamp": {"$lt": cutoff_date}})
-            if delete_result.deleted_count > 0:
-                logger.info(f"Cleaned up {delete_result.deleted_count} old records")
+            # Fold every closed day into the weekly and monthly rollups
+            # Raw snapshots are no longer deleted here, the TTL index expires them
+            ensure_historical_indexes(db_connection)
+            roll_up_closed_days(db_connection, today_start)
                 
             logger.info("Daily analytics capture completed successfully")
         
     except Exception as e:
         logger.error(f"Error in daily analytics capture: {e}")
+        raise
+
+def capture_portfolio_clv():
+    """
+    Scores every active customer with the serving Cox model and stores their
+    expected remaining lifetime and CLV, with the segment totals (see portfolio).
+    """
+    if not flask_app:
+        logger.error("Flask app not initialized in scheduler")
+        return
+    
+    with flask_app.app_context():
+        try:
+            scorer = get_cox_scorer()
+        except ModelUnavailable:
+            logger.info("No survival model published yet, skipping the portfolio CLV")
+            return
+        compute_portfolio_clv(get_db(), scorer, prepare_survival_data())
+
+def refit_survival_model(force=False):
+    """
+    Refits the Cox model in a separate process once the customers changed enough
+    (or when forced) and publishes it to every worker if it is not worse (see model_registry).
+    """
+    if not flask_app:
+        logger.error("Flask app not initialized in scheduler")
+        return
+    
+    with flask_app.app_context():
+        db_connection = get_db()
+        # Read before the customers, so changes made during the fit trigger the next refit
+        data_version = current_data_version(db_connection)
+        if not model_registry.should_refit(db_connection, data_version, force):
+            logger.info(f"Survival model is up to date with data version {data_version}")
+            return
+        df = prepare_survival_data()
+        model_registry.refit_model(db_connection, df, data_version, COX_FEATURES)
+
+def run_job(job_id, func):
+    """
+    Run a scheduled job on the leader only and record the run with its duration.
+    Followers skip the job, the leader's run is stored in scheduler_job_runs.
+    """
+    if not flask_app:
+        logger.error("Flask app not initialized in scheduler")
+        return
+    if not leader_lease.is_leader:
+        logger.debug(f"Skipping {job_id}: this process is not the scheduler leader")
+        return
+    
+    started_at = datetime.now()
+    start_time = time.perf_counter()
+    status = "success"
+    error = None
+    try:
+        # Attribute the job's queries to it in the slow query log
+        with job_context(job_id):
+            func()
+    except Exception as e:
+        status = "failed"
+        error = str(e)
+        logger.error(f"Scheduled job {job_id} failed: {e}")
+    duration = time.perf_counter() - start_time
+    scheduler_job_duration.observe(duration, job_id=job_id, status=status)
+    
+    try:
+        with flask_app.app_context():
+            get_db().scheduler_job_runs.insert_one({
+                "job_id": job_id,
+                "holder": leader_lease.holder_id,
+                "started_at": started_at,
+                "duration_seconds": duration,
+                "status": status,
+                "error": error
+            })
+    except Exception as e:
+        logger.warning(f"Could not record run of {job_id}: {e}")
+    
+    logger.info(f"Job {job_id} finished with status {status} in {duration:.2f} seconds")
+
+def leader_heartbeat():
+    """
+    Acquire or renew the scheduler lease.
+    The process that just became leader queues the index creation and the startup
+    capture, so a fresh deployment (or a failover) gets both without every worker
+    doing it. They run as one-off jobs, the heartbeat itself only touches the lease
+    and keeps renewing it while they run.
+    """
+    if not flask_app:
+        return
+    
+    with flask_app.app_context():
+        db_connection = get_db()
+        became_leader = leader_lease.heartbeat(db_connection.scheduler_leases)
+    
+    if became_leader and scheduler_instance is not None:
+        queue_takeover_jobs(scheduler_instance)
+
+def queue_takeover_jobs(scheduler):
+    """
+    Run the index creation, the startup capture and a refit check once, now, on the
+    leader. On a fresh deployment the refit publishes the first survival model.
+    """
+    for job_id, func in [('ensure_indexes', ensure_database_indexes),
+                         ('startup_analytics_capture', capture_daily_analytics),
+                         ('startup_survival_model_refit', refit_survival_model)]:
+        scheduler.add_job(
+            run_job,
+            args=[job_id, func],
+            id=job_id,
+            name=f'Leader takeover: {job_id}',
+            next_run_time=datetime.now(),
+            replace_existing=True
+        )
+
+def ensure_database_indexes():
+    """
+    Create the declared indexes once per deployment, on the leader.
+    With AUTO_CREATE_INDEXES=false the missing indexes are only logged.
+    """
+    create = os.environ.get("AUTO_CREATE_INDEXES", "true").lower() != "false"
+    with flask_app.app_context():
+        ensure_indexes(get_db(), create=create)
 
 def setup_scheduler(app=None):
     """
-    Sets up the APScheduler to run the capture_daily_analytics function daily at midnight
+    Sets up the APScheduler to run the capture_daily_analytics function daily at midnight.
+    Every process runs the heartbeat, only the lease holder runs the jobs.
     """
     # Store the Flask app reference globally
-    global flask_app
+    global flask_app, scheduler_instance
     flask_app = app
     
-    scheduler = BackgroundScheduler()
+    scheduler = scheduler_instance = BackgroundScheduler()
+    
+    # Acquire / renew the leader lease, starting immediately
+    scheduler.add_job(
+        leader_heartbeat,
+        trigger=IntervalTrigger(seconds=HEARTBEAT_SECONDS),
+        id='scheduler_leader_heartbeat',
+        name='Scheduler leader lease heartbeat',
+        next_run_time=datetime.now(),
+        max_instances=1,
+        replace_existing=True
+    )
     
-    # Run at midnight every day
+    # Run at midnight every day (on the leader)
     scheduler.add_job(
-        capture_daily_analytics,
+        run_job,
         trigger=CronTrigger(hour=0, minute=0),
+        args=['daily_analytics_capture', capture_daily_analytics],
         id='daily_analytics_capture',
         name='Capture daily analytics data',
         replace_existing=True
     )
     
-    # Also run it immediately at startup to ensure we have today's data
+    # Portfolio CLV once a day, after the analytics capture (on the leader)
+    scheduler.add_job(
+        run_job,
+        trigger=CronTrigger(hour=1, minute=0),
+        args=['portfolio_clv', capture_portfolio_clv],
+        id='portfolio_clv',
+        name='Compute portfolio CLV',
+        replace_existing=True
+    )
+    
+    # Refit the survival model when the customers changed enough, first check a minute after startup
+    scheduler.add_job(
+        run_job,
+        trigger=IntervalTrigger(minutes=int(os.environ.get("SURVIVAL_REFIT_CHECK_MINUTES", 15))),
+        args=['survival_model_refit', refit_survival_model],
+        id='survival_model_refit',
+        name='Refit the survival model on data changes',
+        next_run_time=datetime.now() + timedelta(minutes=1),
+        max_instances=1,
+        replace_existing=True
+    )
+    
+    # And every night, whatever changed (on the leader)
     scheduler.add_job(
-        capture_daily_analytics,
-        id='startup_analytics_capture',
-        name='Initial analytics capture at startup'
+        run_job,
+        trigger=CronTrigger(hour=2, minute=0),
+        args=['survival_model_nightly_refit', partial(refit_survival_model, force=True)],
+        id='survival_model_nightly_refit',
+        name='Nightly survival model refit',
+        max_instances=1,
+        replace_existing=True
     )
     
     # Start the scheduler
@@ -201,3 +333,13 @@ def setup_scheduler(app=None):
     logger.info("Scheduler started: Daily analytics capture scheduled at midnight")
     
     return scheduler
+
+def shutdown_scheduler(scheduler):
+    """Stop the scheduler and hand the lease over straight away"""
+    scheduler.shutdown()
+    if flask_app:
+        try:
+            with flask_app.app_context():
+                leader_lease.release(get_db().scheduler_leases)
+        except Exception as e:
+            logger.warning(f"Could not release scheduler lease: {e}")
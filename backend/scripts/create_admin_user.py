@@ -21,7 +21,7 @@ print("-----------------------")
 # Connect to MongoDB
 try:
     client = pymongo.MongoClient(mongo_uri)
-    db = client.churn_database
+    db = client[os.environ.get("MONGO_DB_NAME", "churn_database")]
     admin_collection = db.admin_users
 except Exception as e:
     print(f"ERROR: Could not connect to MongoDB: {e}")
@@ -0,0 +1,186 @@
+"""
+Generate synthetic customers for scale testing.
+Learns the customer distributions from the Telco CSV (see synthetic_customers)
+and streams any number of unique customers into MongoDB or to a CSV or Parquet
+file. Batches are generated in parallel worker processes; the output only
+depends on the seed, so the same command always produces the same customers.
+
+Usage:
+    python scripts/generate_customers.py COUNT [--to mongo|csv|parquet] [--output PATH]
+                                         [--seed N] [--workers N] [--batch-size N]
+                                         [--start-index N] [--as-of YYYY-MM-DD]
+
+Use --start-index to append more customers to an earlier run without reusing IDs.
+Writing to MongoDB uses MONGO_URI and MONGO_DB_NAME (default churn_database).
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+import pymongo
+from pymongo.errors import BulkWriteError
+from dotenv import load_dotenv
+
+# Make the backend modules importable when run as python scripts/<name>.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from synthetic_customers import CustomerModel, DEFAULT_CSV_PATH, batch_ranges, generate_batch
+from data_version import bump_data_version
+
+# Load environment variables
+load_dotenv()
+
+# Per worker process state, set by init_worker
+worker_model = None
+worker_collection = None
+
+def init_worker(model, mongo_uri, database, collection):
+    global worker_model, worker_collection
+    worker_model = model
+    if mongo_uri:
+        # Every process needs its own client, MongoClient is not fork safe
+        client = pymongo.MongoClient(mongo_uri)
+        worker_collection = client[database][collection]
+
+def build_batch(seed, number, first_index, size, as_of):
+    return generate_batch(worker_model, seed, number, first_index, size, as_of)
+
+def insert_batch(seed, number, first_index, size, as_of):
+    """Generate one batch and insert it, returns (inserted, duplicate IDs)"""
+    customers = build_batch(seed, number, first_index, size, as_of).to_dict('records')
+    try:
+        result = worker_collection.insert_many(customers, ordered=False)
+        return len(result.inserted_ids), 0
+    except BulkWriteError as e:
+        # IDs that already exist, e.g. the same range generated twice
+        errors = e.details.get('writeErrors', [])
+        duplicates = sum(1 for error in errors if error.get('code') == 11000)
+        if duplicates != len(errors):
+            raise
+        return e.details.get('nInserted', 0), duplicates
+
+def csv_writer(path):
+    first = [True]
+    handle = open(path, 'w', newline='')
+
+    def write(batch):
+        batch.to_csv(handle, header=first[0], index=False)
+        first[0] = False
+    return write, handle.close
+
+def parquet_writer(path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Writing Parquet needs pyarrow, install it with pip install pyarrow")
+    state = {}
+
+    def write(batch):
+        table = pa.Table.from_pandas(batch, preserve_index=False)
+        if 'writer' not in state:
+            state['writer'] = pq.ParquetWriter(path, table.schema)
+        state['writer'].write_table(table)
+
+    def close():
+        if 'writer' in state:
+            state['writer'].close()
+    return write, close
+
+def run(args):
+    model = CustomerModel.from_csv(args.source_csv)
+    batches = batch_ranges(args.count, args.batch_size, args.start_index)
+    as_of = args.as_of or date.today()
+
+    mongo_uri = None
+    if args.to == 'mongo':
+        mongo_uri = os.environ.get("MONGO_URI")
+        if not mongo_uri:
+            raise ValueError("No MONGO_URI found in environment variables")
+        database = os.environ.get("MONGO_DB_NAME", "churn_database")
+        client = pymongo.MongoClient(mongo_uri)
+        client[database][args.collection].create_index([("customerID", pymongo.ASCENDING)], unique=True)
+        client.close()
+        task = insert_batch
+        write, close = None, None
+    else:
+        database = None
+        task = build_batch
+        output = args.output or f"synthetic_customers.{args.to}"
+        write, close = csv_writer(output) if args.to == 'csv' else parquet_writer(output)
+
+    written = 0
+    duplicates = 0
+    start_time = time.time()
+    last_report = start_time
+
+    # Bound the batches in flight and consume them in order, so files are written
+    # in customer order and memory stays flat for any count
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(model, mongo_uri, database, args.collection)) as executor:
+        try:
+            while True:
+                while len(in_flight) < args.workers * 2:
+                    batch = next(batches, None)
+                    if batch is None:
+                        break
+                    in_flight.append(executor.submit(task, args.seed, *batch, as_of))
+                if not in_flight:
+                    break
+
+                result = in_flight.popleft().result()
+                if write:
+                    write(result)
+                    written += len(result)
+                else:
+                    written += result[0]
+                    duplicates += result[1]
+
+                now = time.time()
+                if now - last_report >= args.report_every:
+                    print(f"{written} customers written ({written / (now - start_time):.0f} customers/s)")
+                    last_report = now
+        finally:
+            if close:
+                close()
+
+    elapsed = time.time() - start_time
+    print(f"Finished: {written} customers in {elapsed:.1f} seconds ({written / elapsed if elapsed else 0:.0f} customers/s)")
+    if duplicates:
+        print(f"Skipped {duplicates} customers whose IDs already existed, use --start-index to generate new IDs")
+    if not write:
+        print(f"Written to {database}.{args.collection}")
+        if args.collection == 'users':
+            # Let the survival model refit see the new customers
+            client = pymongo.MongoClient(mongo_uri)
+            bump_data_version(client[database], written)
+            client.close()
+    else:
+        print(f"Written to {output}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic customers from the customer CSV")
+    parser.add_argument("count", type=int, help="number of customers to generate")
+    parser.add_argument("--to", default="mongo", choices=["mongo", "csv", "parquet"])
+    parser.add_argument("--output", help="file for csv and parquet output")
+    parser.add_argument("--collection", default="users", help="collection for mongo output")
+    parser.add_argument("--source-csv", default=DEFAULT_CSV_PATH, help="CSV the distributions are learned from")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="generator processes")
+    parser.add_argument("--batch-size", type=int, default=100000, help="customers per batch")
+    parser.add_argument("--start-index", type=int, default=0, help="index of the first customer, determines the IDs")
+    parser.add_argument("--as-of", type=date.fromisoformat, help="date join dates are counted back from (default today)")
+    parser.add_argument("--report-every", type=float, default=5.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    try:
+        run(args)
+    except Exception as e:
+        print(f"Error generating customers: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,53 +1,226 @@
+"""
+Bulk importer for the customer CSV.
+Streams the file in chunks, normalizes types per chunk and upserts every row by
+customerID with unordered bulk writes from several parallel writers. Progress is
+checkpointed in MongoDB so an interrupted import resumes where it stopped, and
+re-running a finished import is harmless because every write is an upsert.
+
+Usage:
+    python scripts/import_csv_to_mongodb.py [csv_path] [--chunk-size N] [--workers N]
+                                            [--write-concern W] [--journal] [--restart]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import pandas as pd
 import pymongo
-import os
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from pymongo.write_concern import WriteConcern
 from dotenv import load_dotenv
 
+# Make the backend modules importable when run as python scripts/<name>.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from customer_schema import INT_FIELDS, DOUBLE_FIELDS
+from data_version import bump_data_version
+
 # Load environment variables
 load_dotenv()
 
-# Get MongoDB connection string
-mongo_uri = os.environ.get("MONGO_URI")
-if not mongo_uri:
-    raise ValueError("No MONGO_URI found in environment variables")
+DEFAULT_CSV_PATH = 'WA_Fn-UseC_-Telco-Customer-Churn 2.csv'
+
+def normalize_chunk(chunk):
+    """
+    Convert one chunk to the stored types.
+    Everything is read as text, numeric columns (as declared in customer_schema)
+    are parsed once here and blanks (e.g. TotalCharges of brand new customers) become 0.
+    """
+    for column in INT_FIELDS:
+        if column in chunk.columns:
+            chunk[column] = pd.to_numeric(chunk[column].str.strip(), errors='coerce').fillna(0).astype(int)
+    for column in DOUBLE_FIELDS:
+        if column in chunk.columns:
+            chunk[column] = pd.to_numeric(chunk[column].str.strip(), errors='coerce').fillna(0.0).astype(float)
+    return chunk
+
+def build_operations(chunk):
+    """One upsert per row, keyed by customerID, so re-importing a row just overwrites it"""
+    operations = []
+    for record in chunk.to_dict('records'):
+        customer_id = record.get('customerID')
+        if not customer_id:
+            continue
+        operations.append(UpdateOne({"customerID": customer_id}, {"$set": record}, upsert=True))
+    return operations
+
+def write_chunk(collection, chunk_index, chunk):
+    """Normalize and write one chunk, returns (chunk_index, rows, upserted, modified, errors)"""
+    operations = build_operations(normalize_chunk(chunk))
+    if not operations:
+        return chunk_index, len(chunk), 0, 0, 0
+    try:
+        result = collection.bulk_write(operations, ordered=False)
+        return chunk_index, len(chunk), result.upserted_count, result.modified_count, 0
+    except BulkWriteError as e:
+        details = e.details
+        return (chunk_index, len(chunk), details.get('nUpserted', 0),
+                details.get('nModified', 0), len(details.get('writeErrors', [])))
+
+class Checkpoint:
+    """
+    Tracks which chunks of a file are written.
+    Chunks finish out of order, so only the contiguous prefix of finished chunks is
+    persisted; a resumed import starts after that prefix.
+    """
+    def __init__(self, collection, csv_path, chunk_size):
+        stat = os.stat(csv_path)
+        self.collection = collection
+        self.key = f"{os.path.abspath(csv_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+        self.chunk_size = chunk_size
+        self.next_chunk = 0
+        self.finished = set()
+        self.lock = threading.Lock()
+
+    def load(self):
+        saved = self.collection.find_one({"_id": self.key})
+        if saved and not saved.get("completed"):
+            # Chunk boundaries must match the ones the checkpoint was written with
+            self.chunk_size = saved["chunk_size"]
+            self.next_chunk = saved["next_chunk"]
+        elif saved and saved.get("completed"):
+            self.next_chunk = None
+        return self.next_chunk
+
+    def reset(self):
+        self.collection.delete_one({"_id": self.key})
+
+    def mark_done(self, chunk_index):
+        with self.lock:
+            self.finished.add(chunk_index)
+            advanced = False
+            while self.next_chunk in self.finished:
+                self.finished.discard(self.next_chunk)
+                self.next_chunk += 1
+                advanced = True
+            if advanced:
+                self.collection.update_one(
+                    {"_id": self.key},
+                    {"$max": {"next_chunk": self.next_chunk}, "$set": {"chunk_size": self.chunk_size, "updated_at": time.time()}},
+                    upsert=True
+                )
 
-# Connect to MongoDB
-client = pymongo.MongoClient(mongo_uri)
-db = client.churn_database
-users_collection = db.users
+    def complete(self):
+        self.collection.update_one({"_id": self.key}, {"$set": {"completed": True}}, upsert=True)
 
-# Read CSV file
-csv_path = 'WA_Fn-UseC_-Telco-Customer-Churn 2.csv'
-data = pd.read_csv(csv_path)
+def parse_write_concern(value):
+    return int(value) if value.isdigit() else value
 
-# Handle any NaN or missing values
-data = data.fillna(0)
+def run_import(args):
+    mongo_uri = os.environ.get("MONGO_URI")
+    if not mongo_uri:
+        raise ValueError("No MONGO_URI found in environment variables")
 
-# Convert decimal fields to proper numeric types
-data['MonthlyCharges'] = pd.to_numeric(data['MonthlyCharges'], errors='coerce')
-data['TotalCharges'] = pd.to_numeric(data['TotalCharges'], errors='coerce')
+    client = pymongo.MongoClient(mongo_uri, maxPoolSize=max(args.workers * 2, 10))
+    db = client[os.environ.get("MONGO_DB_NAME", "churn_database")]
+    users_collection = db.users.with_options(
+        write_concern=WriteConcern(w=parse_write_concern(args.write_concern), j=args.journal)
+    )
 
-# Replace any NaN after conversion with 0
-data = data.fillna(0)
+    # Upserts look rows up by customerID, the unique index keeps that fast and race free
+    db.users.create_index([("customerID", pymongo.ASCENDING)], unique=True)
 
-# Convert to list of dictionaries for MongoDB insert
-records = data.to_dict('records')
+    checkpoint = Checkpoint(db.import_checkpoints, args.csv_path, args.chunk_size)
+    if args.restart:
+        checkpoint.reset()
+    start_chunk = checkpoint.load()
+    if start_chunk is None:
+        print(f"{args.csv_path} was already imported completely, use --restart to import it again")
+        return
+    if start_chunk:
+        print(f"Resuming from chunk {start_chunk} (row {start_chunk * checkpoint.chunk_size})")
+
+    chunk_size = checkpoint.chunk_size
+    # A callable instead of a range, pandas turns a range into a set of every skipped row
+    skipped_rows = start_chunk * chunk_size
+    reader = pd.read_csv(
+        args.csv_path,
+        dtype=str,
+        keep_default_na=False,
+        chunksize=chunk_size,
+        skiprows=lambda row: 0 < row <= skipped_rows
+    )
+
+    totals = {"rows": 0, "upserted": 0, "modified": 0, "errors": 0}
+    start_time = time.time()
+    last_report = start_time
+
+    def record(future):
+        chunk_index, rows, upserted, modified, errors = future.result()
+        totals["rows"] += rows
+        totals["upserted"] += upserted
+        totals["modified"] += modified
+        totals["errors"] += errors
+        # A chunk with failed writes is not checkpointed, so a re-run retries it
+        if errors == 0:
+            checkpoint.mark_done(chunk_index)
+
+    # Bound the number of chunks in flight so memory stays flat for any file size
+    max_in_flight = args.workers * 2
+    in_flight = set()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for offset, chunk in enumerate(reader):
+            in_flight.add(executor.submit(write_chunk, users_collection, start_chunk + offset, chunk))
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record(future)
+
+            now = time.time()
+            if now - last_report >= args.report_every:
+                elapsed = now - start_time
+                print(f"{totals['rows']} rows written ({totals['rows'] / elapsed:.0f} rows/s), "
+                      f"{totals['upserted']} inserted, {totals['modified']} updated, {totals['errors']} errors")
+                last_report = now
+
+        done, _ = wait(in_flight)
+        for future in done:
+            record(future)
+
+    elapsed = time.time() - start_time
+    print(f"Finished: {totals['rows']} rows in {elapsed:.1f} seconds "
+          f"({totals['rows'] / elapsed if elapsed else 0:.0f} rows/s), "
+          f"{totals['upserted']} inserted, {totals['modified']} updated, {totals['errors']} errors")
+
+    # Count the changed customers, so the survival model refit and the cached results notice them
+    bump_data_version(db, totals["upserted"] + totals["modified"])
+
+    if totals["errors"]:
+        print("Some rows failed to write, run the importer again to retry the affected chunks")
+    else:
+        checkpoint.complete()
+
+    print(f"Total documents in collection: {db.users.estimated_document_count()}")
+    client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Import the customer CSV into MongoDB")
+    parser.add_argument("csv_path", nargs="?", default=DEFAULT_CSV_PATH)
+    parser.add_argument("--chunk-size", type=int, default=5000, help="rows per bulk write")
+    parser.add_argument("--workers", type=int, default=4, help="parallel bulk writers")
+    parser.add_argument("--write-concern", default="1", help="w value, a number or 'majority'")
+    parser.add_argument("--journal", action="store_true", help="wait for the journal on every write")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and import from the start")
+    parser.add_argument("--report-every", type=float, default=5.0, help="seconds between progress lines")
+    args = parser.parse_args()
 
-# Insert into MongoDB
-if records:
     try:
-        result = users_collection.insert_many(records)
-        print(f"Successfully inserted {len(result.inserted_ids)} records into MongoDB")
+        run_import(args)
     except Exception as e:
-        print(f"Error inserting records: {e}")
-else:
-    print("No records to insert")
-
-# Verify the data was inserted
-count = users_collection.count_documents({})
-print(f"Total documents in collection: {count}")
-
-# Print a sample record
-if count > 0:
-    print("\nSample record:")
-    print(users_collection.find_one())
+        print(f"Error importing records: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Explain every query shape the backend issues and report collection scans,
+unused indexes and missing indexes as JSON. Store the output with each release
+and diff it against the previous one to catch query regressions.
+
+Usage:
+    python scripts/index_report.py [--output index_report.json] [--create] [--with-stats]
+"""
+import argparse
+import json
+import os
+import sys
+import pymongo
+from dotenv import load_dotenv
+
+# Make the backend modules importable when run as python scripts/<name>.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from index_advisor import build_report, ensure_indexes
+
+# Load environment variables
+load_dotenv()
+
+def main():
+    parser = argparse.ArgumentParser(description="Explain query shapes and report index problems")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--create", action="store_true", help="create the missing indexes before explaining")
+    parser.add_argument("--with-stats", action="store_true", help="include documents examined/returned")
+    args = parser.parse_args()
+
+    mongo_uri = os.environ.get("MONGO_URI")
+    if not mongo_uri:
+        print("ERROR: No MONGO_URI found in environment variables")
+        sys.exit(1)
+
+    client = pymongo.MongoClient(mongo_uri)
+    db = client[os.environ.get("MONGO_DB_NAME", "churn_database")]
+
+    if args.create:
+        ensure_indexes(db)
+
+    report = build_report(db, include_stats=args.with_stats)
+    output = json.dumps(report, indent=2, sort_keys=True, default=str)
+
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output + "\n")
+        print(f"Report written to {args.output}")
+    else:
+        print(output)
+
+    if report["collection_scans"]:
+        print(f"\n{len(report['collection_scans'])} query shapes use a collection scan:", file=sys.stderr)
+        for scan in report["collection_scans"]:
+            print(f"  - {scan}", file=sys.stderr)
+
+    client.close()
+    # Non-zero exit lets CI fail on new collection scans
+    sys.exit(1 if report["collection_scans"] else 0)
+
+if __name__ == "__main__":
+    main()
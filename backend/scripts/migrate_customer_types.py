@@ -0,0 +1,84 @@
+"""
+One-shot migration of existing customer documents to the declared schema.
+Numeric fields stored as strings (e.g. TotalCharges " " for new customers) are
+converted in place on the server with an update pipeline, then the $jsonSchema
+validator from customer_schema is installed on the users collection.
+Running it again only touches documents that still have the wrong types.
+
+Usage:
+    python scripts/migrate_customer_types.py [--validation-level strict|moderate]
+"""
+import argparse
+import os
+import sys
+import pymongo
+from dotenv import load_dotenv
+
+# Make the backend modules importable when run as python scripts/<name>.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from customer_schema import INT_FIELDS, DOUBLE_FIELDS, apply_customer_validator, customer_json_schema
+from data_version import bump_data_version
+
+# Load environment variables
+load_dotenv()
+
+def convert_expression(field, target):
+    """Trim strings and convert to the target type, blanks and garbage become 0"""
+    trimmed = {
+        "$cond": [
+            {"$eq": [{"$type": f"${field}"}, "string"]},
+            {"$trim": {"input": f"${field}"}},
+            f"${field}"
+        ]
+    }
+    zero = 0.0 if target == "double" else 0
+    return {"$convert": {"input": trimmed, "to": target, "onError": zero, "onNull": zero}}
+
+def migrate(db):
+    users_collection = db.users
+    conversions = {field: "double" for field in DOUBLE_FIELDS}
+    conversions.update({field: "int" for field in INT_FIELDS})
+
+    # Only documents with at least one field of the wrong type are rewritten
+    wrong_type = []
+    for field, target in conversions.items():
+        allowed = ["double"] if target == "double" else ["int", "long"]
+        wrong_type.append({field: {"$not": {"$type": allowed}}})
+
+    result = users_collection.update_many(
+        {"$or": wrong_type},
+        [{"$set": {field: convert_expression(field, target) for field, target in conversions.items()}}]
+    )
+    print(f"Converted numeric fields on {result.modified_count} customer documents")
+    bump_data_version(db, result.modified_count)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert customer numeric fields and install the schema validator")
+    parser.add_argument("--validation-level", default="strict", choices=["strict", "moderate"])
+    args = parser.parse_args()
+
+    mongo_uri = os.environ.get("MONGO_URI")
+    if not mongo_uri:
+        print("ERROR: No MONGO_URI found in environment variables")
+        sys.exit(1)
+
+    client = pymongo.MongoClient(mongo_uri)
+    db = client[os.environ.get("MONGO_DB_NAME", "churn_database")]
+
+    try:
+        migrate(db)
+        apply_customer_validator(db, args.validation_level)
+        print(f"Installed customer $jsonSchema validator ({args.validation_level})")
+
+        # Documents that still fail the schema (e.g. unknown categorical values) need a manual fix
+        invalid = db.users.count_documents({"$nor": [customer_json_schema()]})
+        if invalid:
+            print(f"WARNING: {invalid} customer documents do not match the schema")
+    except Exception as e:
+        print(f"ERROR: Migration failed: {e}")
+        sys.exit(1)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
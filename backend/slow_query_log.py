@@ -0,0 +1,205 @@
+"""
+Slow-query log with route attribution.
+A pymongo CommandListener that records every command slower than
+SLOW_QUERY_THRESHOLD_MS into the capped slow_queries collection, together with
+the route or scheduled job that issued it (see request_context), the request
+id, the filter shape with all values redacted, the duration and the number of
+documents returned. Records are queued and written by a background thread, so
+the listener never waits on MongoDB. /admin/slow-queries aggregates the log.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pymongo import monitoring
+from pymongo.errors import CollectionInvalid, PyMongoError
+from request_context import current_request_id, current_source
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", 100))
+SLOW_QUERY_COLLECTION = "slow_queries"
+# The capped collection keeps the newest entries within this size
+SLOW_QUERY_LOG_BYTES = int(os.environ.get("SLOW_QUERY_LOG_BYTES", 50 * 1024 * 1024))
+QUEUE_SIZE = 10000
+
+# Where each command keeps its filter
+FILTER_FIELDS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+}
+REDACTED = "?"
+LOGICAL_OPERATORS = ("$and", "$or", "$nor")
+
+def redact(value):
+    """Replace every value with ? and keep field names and operators"""
+    if isinstance(value, dict):
+        return {key: redact_list(item) if key in LOGICAL_OPERATORS else redact(item) for key, item in value.items()}
+    return REDACTED
+
+def redact_list(clauses):
+    if isinstance(clauses, list):
+        return [redact(clause) for clause in clauses]
+    return REDACTED
+
+def command_shape(command_name, command):
+    """The redacted filter (or $match stages) of a command"""
+    if command_name in FILTER_FIELDS:
+        return redact(command.get(FILTER_FIELDS[command_name]) or {})
+    if command_name == "aggregate":
+        stages = []
+        for stage in command.get("pipeline", []):
+            name = next(iter(stage), None)
+            stages.append({name: redact(stage[name])} if name == "$match" else name)
+        return stages
+    if command_name in ("update", "delete"):
+        statements = command.get("updates") or command.get("deletes") or []
+        return redact(statements[0].get("q", {})) if statements else {}
+    return {}
+
+def documents_returned(command_name, reply):
+    cursor = reply.get("cursor")
+    if cursor is not None:
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if command_name in ("count", "update", "delete", "insert"):
+        return reply.get("n")
+    if command_name == "distinct":
+        return len(reply.get("values", []))
+    return None
+
+class SlowQueryLog(monitoring.CommandListener):
+    # Commands the driver sends on its own, and getMore, which is part of the original query
+    IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions", "getMore"}
+
+    def __init__(self, threshold_ms=SLOW_QUERY_THRESHOLD_MS):
+        self.threshold_micros = threshold_ms * 1000
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.collection = None
+        self.writer = None
+        self.dropped = 0
+
+    def start(self, database):
+        """Write the log to database.slow_queries from a background thread"""
+        with self.lock:
+            if self.writer is not None and self.writer.is_alive():
+                return
+            self.collection = database[SLOW_QUERY_COLLECTION]
+            self.writer = threading.Thread(target=self._write_loop, args=(database,), name="slow-query-log", daemon=True)
+            self.writer.start()
+
+    def started(self, event):
+        if event.command_name in self.IGNORED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if collection == SLOW_QUERY_COLLECTION:
+            return
+        # The command and the attribution are only available now, the duration only at the end
+        with self.lock:
+            self.pending[(event.connection_id, event.request_id)] = (
+                event.command, event.database_name, collection, current_source(), current_request_id()
+            )
+
+    def finish(self, event, reply, error):
+        with self.lock:
+            pending = self.pending.pop((event.connection_id, event.request_id), None)
+        if pending is None or event.duration_micros < self.threshold_micros:
+            return
+
+        command, database_name, collection, source, request_id = pending
+        shape = command_shape(event.command_name, command)
+        record = {
+            "created_at": datetime.now(),
+            "database": database_name,
+            "collection": collection if isinstance(collection, str) else None,
+            "command": event.command_name,
+            "shape": json.dumps(shape, sort_keys=True),
+            "duration_ms": event.duration_micros / 1000,
+            "documents_returned": documents_returned(event.command_name, reply) if reply else None,
+            "source": source or "unknown",
+            "request_id": request_id,
+            "error": error
+        }
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def succeeded(self, event):
+        self.finish(event, event.reply, None)
+
+    def failed(self, event):
+        self.finish(event, None, str(event.failure.get("errmsg", event.failure)))
+
+    def _ensure_collection(self, database):
+        if SLOW_QUERY_COLLECTION in database.list_collection_names():
+            return
+        try:
+            database.create_collection(SLOW_QUERY_COLLECTION, capped=True, size=SLOW_QUERY_LOG_BYTES)
+        except CollectionInvalid:
+            pass  # created by another worker in the meantime
+
+    def _write_loop(self, database):
+        try:
+            self._ensure_collection(database)
+        except Exception as e:
+            logger.warning(f"Could not create the slow query log collection: {e}")
+
+        while True:
+            records = [self.queue.get()]
+            # Write whatever else is waiting in the same insert
+            while len(records) < 500:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.collection.insert_many(records, ordered=False)
+            except PyMongoError as e:
+                logger.warning(f"Could not write {len(records)} slow query records: {e}")
+            finally:
+                for _ in records:
+                    self.queue.task_done()
+
+    def flush(self, timeout=5):
+        """Wait until the queued records are written (for tests and shutdown)"""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+def top_offenders(collection, since, limit=20):
+    """Slow query shapes since a time, ordered by their total time"""
+    pipeline = [
+        {"$match": {"created_at": {"$gte": since}}},
+        {"$group": {
+            "_id": {"collection": "$collection", "command": "$command", "shape": "$shape"},
+            "count": {"$sum": 1},
+            "total_ms": {"$sum": "$duration_ms"},
+            "avg_ms": {"$avg": "$duration_ms"},
+            "max_ms": {"$max": "$duration_ms"},
+            "avg_documents_returned": {"$avg": "$documents_returned"},
+            "sources": {"$addToSet": "$source"},
+            "last_seen": {"$max": "$created_at"},
+            "last_request_id": {"$last": "$request_id"}
+        }},
+        {"$sort": {"total_ms": -1}},
+        {"$limit": limit}
+    ]
+    offenders = []
+    for row in collection.aggregate(pipeline):
+        key = row.pop("_id")
+        row.update(key)
+        row["sources"] = sorted(row["sources"])
+        for field in ("total_ms", "avg_ms", "max_ms"):
+            row[field] = round(row[field], 2)
+        if row["avg_documents_returned"] is not None:
+            row["avg_documents_returned"] = round(row["avg_documents_returned"], 1)
+        row["last_seen"] = row["last_seen"].isoformat()
+        offenders.append(row)
+    return offenders
@@ -0,0 +1,43 @@
+"""
+Server-Sent Events responses.
+The survival endpoints compute several independent results (one curve per
+segment, a test, the model rows). event_stream sends each one as an event as
+soon as it is computed, so the frontend can draw the first chart while the rest
+is still being computed:
+
+    event: curve
+    data: {"segment": "overall", "timeline": [...], ...}
+
+A stream ends with a done event, or an error event when it fails midway (the
+status code has already been sent by then).
+"""
+import logging
+from flask import Response, current_app, stream_with_context
+
+logger = logging.getLogger(__name__)
+
+def format_event(event, data):
+    # The JSON provider of the app, so the data is encoded as jsonify would
+    return f"event: {event}\ndata: {current_app.json.dumps(data)}\n\n"
+
+def event_stream(events):
+    """Stream (event, data) pairs from an iterator as a text/event-stream response"""
+
+    def generate():
+        # A comment first, so the headers go out before the first result is computed
+        yield ": stream opened\n\n"
+        try:
+            for event, data in events:
+                yield format_event(event, data)
+        except Exception as e:
+            logger.error(f"Event stream failed: {e}")
+            yield format_event("error", {"error": str(e)})
+            return
+        yield format_event("done", {})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        # Proxies such as nginx would otherwise buffer the events until the end
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
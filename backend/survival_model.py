@@ -0,0 +1,219 @@
+"""
+Compact NumPy scorer for a fitted Cox proportional hazards model.
+lifelines predicts through pandas on every call. CoxScorer keeps only what a
+prediction needs (the coefficients, the covariate means the baseline refers to
+and the baseline cumulative hazard) and scores any number of customers at once:
+
+    S(t|x) = S0(t) ** exp((x - mean) . beta) = exp(-H0(t) * exp((x - mean) . beta))
+
+The results match CoxPHFitter.predict_survival_function and predict_median
+(see tests/test_survival_model.py). to_dict/from_dict turn a scorer into plain
+lists, so it can be stored or sent to other processes without lifelines.
+
+RiskIndex keeps the partial hazards of all customers sorted, computed once per
+fit, so a risk percentile is a binary search and the risk distribution is
+served without reading the customers again.
+
+A scorer exported with summary=True also keeps the coefficient statistics and
+fit metrics of the model (model_summary), which /risk-factors serves.
+"""
+import numpy as np
+
+LN2 = np.log(2)
+
+class RiskIndex:
+    """Sorted partial hazards of the customers a model was fitted on"""
+
+    def __init__(self, partial_hazards):
+        self.partial_hazards = np.sort(np.asarray(partial_hazards, dtype=float))
+
+    def __len__(self):
+        return len(self.partial_hazards)
+
+    def percentile(self, partial_hazards):
+        """Percentage of customers with the same or a lower risk"""
+        ranks = np.searchsorted(self.partial_hazards, partial_hazards, side="right")
+        return ranks / len(self.partial_hazards) * 100
+
+    def quantiles(self, probabilities):
+        return np.quantile(self.partial_hazards, probabilities)
+
+    def compact(self, max_points):
+        """At most max_points evenly spaced order statistics, percentiles stay within 1 / max_points"""
+        if len(self.partial_hazards) <= max_points:
+            return self
+        positions = np.linspace(0, len(self.partial_hazards) - 1, max_points).round().astype(int)
+        return RiskIndex(self.partial_hazards[positions])
+
+    def histogram(self, bins):
+        """Counts of log-spaced partial hazard bins, returns the edges and the counts"""
+        low, high = self.partial_hazards[0], self.partial_hazards[-1]
+        if high <= low:
+            high = low * 1.000001
+        edges = np.geomspace(low, high, bins + 1)
+        # Bin boundaries by binary search, the last bin includes the maximum
+        positions = np.searchsorted(self.partial_hazards, edges, side="left")
+        positions[-1] = len(self.partial_hazards)
+        return edges, np.diff(positions)
+
+def model_summary(cph):
+    """Coefficient statistics and fit metrics of a fitted CoxPHFitter, as plain numbers"""
+    summary = cph.summary
+    likelihood_ratio = cph.log_likelihood_ratio_test()
+    return {
+        "coefficients": {
+            feature: {
+                "coef": float(summary.loc[feature, 'coef']),
+                "se": float(summary.loc[feature, 'se(coef)']),
+                "p": float(summary.loc[feature, 'p'])
+            }
+            for feature in summary.index
+        },
+        "concordance_index": float(cph.concordance_index_),
+        "observations": int(len(cph.durations)),
+        "events": int(cph.event_observed.sum()),
+        "log_likelihood_ratio_test": float(likelihood_ratio.test_statistic),
+        "log_likelihood_ratio_p_value": float(likelihood_ratio.p_value)
+    }
+
+class CoxScorer:
+    def __init__(self, features, coefficients, means, timeline, baseline_cumulative_hazard, risk_index=None,
+                 summary=None):
+        self.features = list(features)
+        self.coefficients = np.asarray(coefficients, dtype=float)
+        self.means = np.asarray(means, dtype=float)
+        self.timeline = np.asarray(timeline, dtype=float)
+        self.baseline_cumulative_hazard = np.asarray(baseline_cumulative_hazard, dtype=float)
+        self.risk_index = risk_index
+        self.summary = summary
+
+    @classmethod
+    def from_fitter(cls, cph, training_data=None, summary=False):
+        """
+        Export a fitted lifelines CoxPHFitter, with the risk index of its training
+        data if given and its model_summary with summary=True
+        """
+        features = list(cph.params_.index)
+        scorer = cls(
+            features,
+            cph.params_.values,
+            cph._norm_mean[features].values,
+            cph.baseline_cumulative_hazard_.index.values,
+            cph.baseline_cumulative_hazard_.values[:, 0]
+        )
+        if training_data is not None and len(training_data):
+            scorer.risk_index = RiskIndex(scorer.partial_hazard(training_data))
+        if summary:
+            scorer.summary = model_summary(cph)
+        return scorer
+
+    def to_dict(self):
+        data = {
+            "features": self.features,
+            "coefficients": self.coefficients.tolist(),
+            "means": self.means.tolist(),
+            "timeline": self.timeline.tolist(),
+            "baseline_cumulative_hazard": self.baseline_cumulative_hazard.tolist()
+        }
+        if self.risk_index is not None:
+            data["risk_index"] = self.risk_index.partial_hazards.tolist()
+        if self.summary is not None:
+            data["summary"] = self.summary
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        risk_index = RiskIndex(data["risk_index"]) if data.get("risk_index") is not None else None
+        return cls(data["features"], data["coefficients"], data["means"], data["timeline"],
+                   data["baseline_cumulative_hazard"], risk_index, data.get("summary"))
+
+    def matrix(self, rows):
+        """Covariate matrix of a DataFrame, a 2d array in feature order or a list of feature dicts"""
+        if hasattr(rows, "columns"):
+            return rows[self.features].to_numpy(dtype=float)
+        if len(rows) and isinstance(rows[0], dict):
+            return np.array([[row.get(feature, 0) for feature in self.features] for row in rows], dtype=float)
+        return np.asarray(rows, dtype=float).reshape(-1, len(self.features))
+
+    def partial_hazard(self, rows):
+        """exp((x - mean) . beta) of every row"""
+        return np.exp((self.matrix(rows) - self.means) @ self.coefficients)
+
+    def survival(self, rows):
+        """Survival probabilities, one row per customer and one column per timeline point"""
+        return np.exp(-np.outer(self.partial_hazard(rows), self.baseline_cumulative_hazard))
+
+    def survival_at(self, rows, times):
+        """Survival probabilities at given times, the curve is a step function of the timeline"""
+        index = np.searchsorted(self.timeline, np.asarray(times, dtype=float), side="right") - 1
+        # Before the first timeline point nobody has churned yet
+        hazard = np.where(index >= 0, self.baseline_cumulative_hazard[np.maximum(index, 0)], 0.0)
+        return np.exp(-np.outer(self.partial_hazard(rows), hazard))
+
+    def median(self, rows):
+        """First timeline point where survival is at most 0.5, inf when it is never reached"""
+        # S(t) <= 0.5 exactly when H0(t) >= ln 2 / partial hazard, H0 is non-decreasing
+        thresholds = LN2 / self.partial_hazard(rows)
+        index = np.searchsorted(self.baseline_cumulative_hazard, thresholds, side="left")
+        medians = np.full(len(thresholds), np.inf)
+        reached = index < len(self.timeline)
+        medians[reached] = self.timeline[index[reached]]
+        return medians
+
+    def risk_percentile(self, rows):
+        """Risk percentile of every row among the training customers, None without a risk index"""
+        if self.risk_index is None:
+            return None
+        return self.risk_index.percentile(self.partial_hazard(rows))
+
+    def expected_remaining_lifetime(self, rows, tenure, horizon):
+        """
+        Restricted mean remaining lifetime of customers still active at their tenure,
+        the area under S(t) / S(tenure) from tenure to tenure + horizon. Past the
+        timeline the last survival value is carried forward.
+        """
+        tenure = np.asarray(tenure, dtype=float)
+        knots = np.concatenate(([0.0], self.timeline))
+        # Survival on [knots[k], knots[k + 1]), 1 before the first timeline point
+        survival = np.exp(-np.outer(self.partial_hazard(rows), np.concatenate(([0.0], self.baseline_cumulative_hazard))))
+        area = np.zeros_like(survival)
+        area[:, 1:] = np.cumsum(survival[:, :-1] * np.diff(knots), axis=1)
+        row_index = np.arange(len(tenure))
+
+        def area_until(times):
+            knot = np.searchsorted(knots, times, side="right") - 1
+            value = survival[row_index, knot]
+            return area[row_index, knot] + value * (times - knots[knot]), value
+
+        start_area, start_survival = area_until(tenure)
+        end_area, _ = area_until(tenure + horizon)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            remaining = (end_area - start_area) / start_survival
+        # A customer the model gives no chance of reaching their tenure has nothing left
+        return np.clip(np.nan_to_num(remaining, nan=0.0, posinf=0.0), 0.0, horizon)
+
+    def concordance(self, frame):
+        """Harrell's concordance index on a frame with tenure and event columns"""
+        from lifelines.utils import concordance_index
+        return float(concordance_index(frame['tenure'], -self.partial_hazard(frame), frame['event']))
+
+    def clv(self, rows, monthly_charges):
+        """Monthly charges times the median survival, nan when the median isn't reached"""
+        medians = self.median(rows)
+        return np.where(np.isfinite(medians), np.asarray(monthly_charges, dtype=float) * medians, np.nan)
+
+def fit_scorer(frame, features, initial_coefficients=None, summary=False):
+    """
+    Fit a Cox model on the features, tenure and event columns of frame and export it.
+    initial_coefficients (e.g. of the serving model) warm start the optimizer.
+    """
+    from lifelines import CoxPHFitter
+    features = list(features)
+    initial_point = None
+    if initial_coefficients is not None:
+        # lifelines optimizes on standardized covariates
+        initial_point = np.asarray(initial_coefficients, dtype=float) * frame[features].std().to_numpy()
+    cph = CoxPHFitter()
+    cph.fit(frame[features + ['tenure', 'event']], duration_col='tenure', event_col='event',
+            initial_point=initial_point)
+    return CoxScorer.from_fitter(cph, summary=summary)
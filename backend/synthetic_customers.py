@@ -0,0 +1,143 @@
+"""
+Synthetic customers that follow the distributions of the Telco churn CSV.
+CustomerModel learns from the CSV with a smoothed bootstrap: every synthetic
+customer starts from a randomly drawn real customer, so the joint distribution
+of the categorical fields and their relationship with churn is kept exactly,
+and tenure and MonthlyCharges get kernel noise so numeric values are not just
+copies. TotalCharges follows the template's charges per month of tenure, so
+it stays consistent with the new tenure and MonthlyCharges.
+
+Generation is vectorized per batch and every batch has its own seed derived
+from (seed, batch index), so the output is the same for any number of workers.
+See scripts/generate_customers.py for the command line tool.
+"""
+from datetime import date
+import numpy as np
+import pandas as pd
+from customer_schema import CUSTOMER_FIELDS, INT_FIELDS, DOUBLE_FIELDS
+
+DEFAULT_CSV_PATH = 'WA_Fn-UseC_-Telco-Customer-Churn 2.csv'
+
+# Every field with a fixed set of values is sampled jointly from the template customer
+CATEGORICAL_FIELDS = [name for name, field in CUSTOMER_FIELDS.items() if 'enum' in field]
+
+# Same approximation of a month as calculate_join_date in the routes
+DAYS_PER_MONTH = 30
+
+ID_LETTERS = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+MAX_CUSTOMERS = 10000 * 26 ** 5
+
+def customer_ids(indexes):
+    """
+    Unique IDs in the format of the real data (1234-ABCDE) for customer indexes.
+    The digits are index % 10000 and the letters encode index // 10000 in base 26,
+    so every index below MAX_CUSTOMERS gets a different ID.
+    """
+    indexes = np.asarray(indexes, dtype=np.int64)
+    if indexes.size and (indexes.min() < 0 or indexes.max() >= MAX_CUSTOMERS):
+        raise ValueError(f"Customer indexes must be between 0 and {MAX_CUSTOMERS - 1}")
+    digits = np.char.zfill((indexes % 10000).astype(str), 4)
+    rest = indexes // 10000
+    letters = np.full(indexes.shape, '', dtype='<U5')
+    for _ in range(5):
+        letters = np.char.add(ID_LETTERS[rest % 26], letters)
+        rest //= 26
+    return np.char.add(np.char.add(digits, '-'), letters)
+
+def silverman_bandwidth(values):
+    """Rule of thumb kernel bandwidth of a 1-d sample"""
+    values = np.asarray(values, dtype=float)
+    spread = min(values.std(), np.subtract(*np.percentile(values, [75, 25])) / 1.34)
+    return 0.9 * spread * len(values) ** (-1 / 5)
+
+class CustomerModel:
+    """Smoothed bootstrap of the customer CSV"""
+
+    def __init__(self, categories, codes, tenure, monthly, charge_ratio):
+        self.categories = categories  # field -> array of values
+        self.codes = codes  # rows x CATEGORICAL_FIELDS, index into categories
+        self.tenure = tenure
+        self.monthly = monthly
+        self.charge_ratio = charge_ratio  # TotalCharges / (MonthlyCharges * tenure)
+        self.max_tenure = int(tenure.max())
+        self.monthly_range = (float(monthly.min()), float(monthly.max()))
+        self.tenure_bandwidth = silverman_bandwidth(tenure[tenure > 0])
+        self.monthly_bandwidth = silverman_bandwidth(monthly)
+
+    @classmethod
+    def from_frame(cls, df):
+        df = df.copy()
+        for column in INT_FIELDS + DOUBLE_FIELDS:
+            df[column] = pd.to_numeric(df[column].astype(str).str.strip(), errors='coerce').fillna(0)
+
+        categories = {}
+        codes = np.empty((len(df), len(CATEGORICAL_FIELDS)), dtype=np.int16)
+        for position, name in enumerate(CATEGORICAL_FIELDS):
+            values = CUSTOMER_FIELDS[name]['enum']
+            column = df[name].astype(int) if CUSTOMER_FIELDS[name]['type'] == 'int' else df[name]
+            lookup = {value: code for code, value in enumerate(values)}
+            mapped = column.map(lookup)
+            if mapped.isna().any():
+                unknown = sorted(set(column[mapped.isna()].astype(str)))
+                raise ValueError(f"Unexpected {name} values in the CSV: {unknown}")
+            categories[name] = np.array(values, dtype=object)
+            codes[:, position] = mapped.to_numpy()
+
+        tenure = df['tenure'].to_numpy(dtype=np.int64)
+        monthly = df['MonthlyCharges'].to_numpy(dtype=float)
+        expected = monthly * np.maximum(tenure, 1)
+        charge_ratio = np.where((tenure > 0) & (expected > 0), df['TotalCharges'].to_numpy(dtype=float) / expected, 0.0)
+        return cls(categories, codes, tenure, monthly, charge_ratio)
+
+    @classmethod
+    def from_csv(cls, csv_path=DEFAULT_CSV_PATH):
+        return cls.from_frame(pd.read_csv(csv_path, dtype=str, keep_default_na=False))
+
+    def sample(self, size, rng, start_index=0, as_of=None):
+        """
+        Generate size customers as a DataFrame with the stored column types.
+        start_index is the index of the first customer and determines the IDs.
+        as_of is the date tenure is counted back from for the join dates (default today).
+        """
+        templates = rng.integers(0, len(self.tenure), size)
+        data = {'customerID': customer_ids(np.arange(start_index, start_index + size))}
+
+        for position, name in enumerate(CATEGORICAL_FIELDS):
+            data[name] = self.categories[name][self.codes[templates, position]]
+        data['SeniorCitizen'] = data['SeniorCitizen'].astype(np.int64)
+
+        # Brand new customers (tenure 0) stay new, the others get jittered tenure
+        template_tenure = self.tenure[templates]
+        jittered = np.rint(template_tenure + rng.normal(0, self.tenure_bandwidth, size))
+        tenure = np.where(template_tenure > 0, np.clip(jittered, 1, self.max_tenure), 0).astype(np.int64)
+
+        monthly = self.monthly[templates] + rng.normal(0, self.monthly_bandwidth, size)
+        monthly = np.round(np.clip(monthly, *self.monthly_range), 2)
+        total = np.round(monthly * tenure * self.charge_ratio[templates], 2)
+
+        data['tenure'] = tenure
+        data['MonthlyCharges'] = monthly
+        data['TotalCharges'] = total
+
+        # Join date: tenure months back from as_of, spread over the month
+        as_of = np.datetime64(as_of or date.today(), 'D')
+        days_back = tenure * DAYS_PER_MONTH + rng.integers(0, DAYS_PER_MONTH, size)
+        data['join_date'] = np.datetime_as_string(as_of - days_back.astype('timedelta64[D]'), unit='D')
+
+        columns = [name for name in CUSTOMER_FIELDS if name in data]
+        return pd.DataFrame(data, columns=columns)
+
+def batch_ranges(total, batch_size, start_index=0):
+    """(batch number, first customer index, size) for every batch of a run"""
+    for number, offset in enumerate(range(0, total, batch_size)):
+        yield number, start_index + offset, min(batch_size, total - offset)
+
+def generate_batch(model, seed, number, first_index, size, as_of=None):
+    """One batch, reproducible from (seed, batch number) alone"""
+    rng = np.random.default_rng([seed, number])
+    return model.sample(size, rng, start_index=first_index, as_of=as_of)
+
+def iter_customers(model, total, batch_size=100000, seed=0, start_index=0, as_of=None):
+    """Stream total customers in DataFrame batches"""
+    for number, first_index, size in batch_ranges(total, batch_size, start_index):
+        yield generate_batch(model, seed, number, first_index, size, as_of)
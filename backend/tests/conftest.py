@@ -1,9 +1,12 @@
 import os
 import sys
+import tempfile
 import pytest
 from flask import Flask, jsonify
 from dotenv import load_dotenv
 import json
+import numpy as np
+import pandas as pd
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
 # This file is used to set up the test environment and fixtures for the Flask application
@@ -14,6 +17,12 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 # Load environment variables for testing
 load_dotenv('.env.test', override=True)
 
+# db.py reads the database name on import, the tests must never write to the real one
+os.environ["MONGO_DB_NAME"] = os.environ.get("TEST_MONGO_DB_NAME", "test_churn_db")
+
+# Keep traces of the test requests out of the working directory
+os.environ.setdefault("TRACE_EXPORT_PATH", os.path.join(tempfile.gettempdir(), "churn_test_traces.jsonl"))
+
 from app import create_app
 from db import get_db
 
@@ -118,3 +127,45 @@ def db_with_test_data(app):
         
         # Clean up test data
         db.users.delete_one({"_id": customer_id})
+
+def synthetic_survival_customers(n=400, seed=0, effects=None, event_share=1.0, id_prefix="TEST-SYN"):
+    """
+    Random customers in the shape prepare_survival_data returns (the Cox features,
+    the curve segments, tenure and event), plus customerID and Contract.
+    Tenure follows a Cox model: an average customer churns at 1% a month, effects
+    are the log hazard ratios of columns. Customers still there at 72 months are
+    censored, the others are observed churning with probability event_share.
+    """
+    rng = np.random.default_rng(seed)
+    contract = rng.choice(["Month-to-month", "One year", "Two year"], n)
+    internet = rng.choice(["DSL", "Fiber optic", "No"], n)
+    payment = rng.choice(["Electronic check", "Mailed check", "Bank transfer (automatic)"], n)
+    df = pd.DataFrame({
+        "customerID": [f"{id_prefix}-{seed}-{index}" for index in range(n)],
+        "Contract": contract,
+        "gender": rng.integers(0, 2, n),
+        "SeniorCitizen": rng.integers(0, 2, n),
+        "Partner": rng.integers(0, 2, n),
+        "Dependents": rng.integers(0, 2, n),
+        "PaperlessBilling": rng.integers(0, 2, n),
+        "MonthlyCharges": rng.uniform(20, 110, n),
+        "Contract_Monthly": (contract == "Month-to-month").astype(int),
+        "Contract_OneYear": (contract == "One year").astype(int),
+        "Contract_TwoYear": (contract == "Two year").astype(int),
+        "PaymentMethod_Electronic": (payment == "Electronic check").astype(int),
+        "PaymentMethod_Mailed": (payment == "Mailed check").astype(int),
+        "InternetService_DSL": (internet == "DSL").astype(int),
+        "InternetService_Fiber": (internet == "Fiber optic").astype(int),
+        "InternetService_No": (internet == "No").astype(int)
+    })
+    log_hazard = np.zeros(n)
+    for column, effect in (effects or {}).items():
+        log_hazard += effect * (df[column] - df[column].mean())
+    df["tenure"] = np.clip(np.ceil(rng.exponential(1 / (0.01 * np.exp(log_hazard)))), 1, 72).astype(int)
+    df["event"] = ((df["tenure"] < 72) & (rng.random(n) < event_share)).astype(int)
+    return df
+
+@pytest.fixture(scope="session")
+def make_customers():
+    """The synthetic_survival_customers factory, for the survival, model and bootstrap tests"""
+    return synthetic_survival_customers
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import pytest
+import async_db
+from async_db import Query, BackgroundLoop, gather_queries
+from request_context import request_id_var
+# This file tests the concurrent query layer, its sync path and the background loop
+
+@pytest.fixture
+def started_loops():
+    """Background loops started by a test, stopped afterwards so their threads don't pile up"""
+    loops = []
+    yield loops
+    for loop in loops:
+        loop.stop()
+        assert not loop.thread.is_alive()
+
+def test_sync_path_matches_direct_queries(app, db_with_test_data, monkeypatch):
+    """With async queries off, the same results come from the sync client in order."""
+    db, _ = db_with_test_data
+    monkeypatch.setattr(async_db, 'MONGO_ASYNC_QUERIES', False)
+    total, customer, contracts, rows = gather_queries([
+        Query("users", "count_documents", {}),
+        Query("users", "find_one", {"customerID": "TEST-1001"}, {"_id": 0}),
+        Query("users", "distinct", "Contract"),
+        Query("users", "find", {"customerID": "TEST-1001"})
+    ])
+    assert total == db.users.count_documents({})
+    assert customer["MonthlyCharges"] == 65.4
+    assert "Month-to-month" in contracts
+    assert [row["customerID"] for row in rows] == ["TEST-1001"]
+
+def test_async_queries_read_cursors():
+    """Awaitable results are awaited, cursors are read into lists."""
+    class FakeCursor:
+        async def to_list(self):
+            return [{"n": 1}]
+
+    class FakeCollection:
+        async def count_documents(self, query):
+            return 3
+
+        async def aggregate(self, pipeline):
+            return FakeCursor()
+
+        def find(self, query):
+            return FakeCursor()
+
+    db = {"users": FakeCollection()}
+    queries = [Query("users", "count_documents", {}), Query("users", "aggregate", []), Query("users", "find", {})]
+
+    async def run_all():
+        return await asyncio.gather(*(query.run_async(db) for query in queries))
+
+    assert asyncio.run(run_all()) == [3, [{"n": 1}], [{"n": 1}]]
+
+def test_background_loop_keeps_caller_context(started_loops):
+    """Coroutines see the request id of the thread that submitted them."""
+    loop = BackgroundLoop()
+    started_loops.append(loop)
+
+    async def read_request_id():
+        await asyncio.sleep(0)
+        return request_id_var.get()
+
+    token = request_id_var.set("req-42")
+    try:
+        assert loop.submit(read_request_id()).result(5) == "req-42"
+    finally:
+        request_id_var.reset(token)
+
+def test_forked_worker_gets_its_own_loop(started_loops, monkeypatch):
+    first = async_db.background_loop()
+    assert async_db.background_loop() is first
+    # The process keeps its own loop once the test is done
+    monkeypatch.setattr(async_db, '_loop', first)
+    monkeypatch.setattr(os, 'getpid', lambda: first.pid + 1)
+    forked = async_db.background_loop()
+    started_loops.append(forked)
+    assert forked is not first
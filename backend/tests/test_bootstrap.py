@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from datetime import datetime, timedelta
+import bootstrap
+from bootstrap import bootstrap_coefficients, percentile_intervals, claim_bootstrap, run_key, run_id
+from db import get_db
+from routes import survival_routes
+from survival_model import fit_scorer
+# This file tests the bootstrap confidence intervals of the risk factors
+
+@pytest.fixture(scope="module")
+def frame(make_customers):
+    return make_customers(n=300, seed=8, effects={"Contract_Monthly": 1.0}, event_share=0.7)
+
+def test_same_seed_same_intervals_whatever_the_workers(frame):
+    """Every resample has its own seed, so the process pool does not change the result."""
+    features = ["Contract_Monthly", "MonthlyCharges"]
+    serial = bootstrap_coefficients(frame, features, resamples=6, seed=4, workers=1)
+    pooled = bootstrap_coefficients(frame, features, resamples=6, seed=4, workers=2)
+    assert serial.shape == (6, 2)
+    assert np.allclose(serial, pooled)
+    assert not np.allclose(serial, bootstrap_coefficients(frame, features, resamples=6, seed=5, workers=1))
+
+    lower, upper, std_error = percentile_intervals(serial)
+    assert (lower <= serial.mean(axis=0)).all() and (serial.mean(axis=0) <= upper).all()
+    assert (std_error > 0).all()
+
+@pytest.fixture
+def bootstrap_runs(app):
+    collection = get_db().risk_factor_bootstrap
+    collection.delete_many({"data_version": -1})
+    yield collection
+    collection.delete_many({"data_version": -1})
+
+def test_claim_once_and_take_over_stale_runs(bootstrap_runs):
+    # The deterministic _id turns away a second claim, without any other index
+    assert claim_bootstrap(get_db(), -1) is True
+    assert claim_bootstrap(get_db(), -1) is False
+
+    bootstrap_runs.update_one({"_id": run_id(-1)}, {"$set": {
+        "started_at": datetime.now() - timedelta(seconds=bootstrap.BOOTSTRAP_TIMEOUT_SECONDS + 1)}})
+    assert claim_bootstrap(get_db(), -1) is True
+
+def test_risk_factors_serve_stored_intervals(client, bootstrap_runs, make_customers, monkeypatch):
+    """Stored intervals of the data version replace the asymptotic ones, without a background run."""
+    customers = make_customers(seed=2, effects={"Contract_Monthly": 1.0})
+    # The intervals and the warm start come from the serving model
+    scorer = fit_scorer(customers, survival_routes.COX_FEATURES, summary=True)
+    monkeypatch.setattr(survival_routes, "get_cox_scorer", lambda: scorer)
+    monkeypatch.setattr(survival_routes, "current_data_version", lambda db: -1)
+    started = []
+    monkeypatch.setattr(bootstrap, "start_bootstrap", lambda *args: started.append(args))
+
+    body = client.get('/risk-factors?ci=bootstrap').get_json()
+    assert body["confidence_intervals"]["method"] == "asymptotic"
+    assert body["confidence_intervals"]["bootstrap"]["status"] == "running"
+    assert len(started) == 1
+
+    features = [factor["feature"] for factor in body["risk_factors"]]
+    bootstrap_runs.insert_one({"_id": run_id(-1), **run_key(-1), "status": "done", "computed_at": datetime.now(),
+                               "successful_resamples": 200, "confidence": 0.95,
+                               "factors": {feature: {"lower_ci": 0.5, "upper_ci": 2.0, "std_error": 0.1}
+                                           for feature in features}})
+    body = client.get('/risk-factors?ci=bootstrap').get_json()
+    assert body["confidence_intervals"]["method"] == "bootstrap"
+    assert all(factor["lower_ci"] == 0.5 and "asymptotic_lower_ci" in factor for factor in body["risk_factors"])
+    assert len(started) == 1
+    assert client.get('/risk-factors?ci=jackknife').status_code == 400
+
+    # A model published before the summaries were stored
+    scorer.summary = None
+    assert client.get('/risk-factors').status_code == 503
@@ -0,0 +1,66 @@
+import json
+import pytest
+from customer_schema import validate_customer, CustomerValidationError, customer_json_schema
+# This file tests the customer schema and the validation at the API layer
+
+def valid_customer():
+    return {
+        "customerID": "TEST-SCHEMA-1",
+        "gender": "Female",
+        "SeniorCitizen": "1",
+        "Partner": "Yes",
+        "Dependents": "No",
+        "tenure": 5.0,
+        "Contract": "One year",
+        "PaymentMethod": "Mailed check",
+        "MonthlyCharges": "70.35",
+        "TotalCharges": " ",
+        "Churn": "No"
+    }
+
+def test_numeric_fields_are_coerced():
+    """Numeric strings become numbers and blank charges become 0."""
+    customer = validate_customer(valid_customer())
+    assert customer["SeniorCitizen"] == 1
+    assert customer["tenure"] == 5 and isinstance(customer["tenure"], int)
+    assert customer["MonthlyCharges"] == 70.35
+    assert customer["TotalCharges"] == 0.0
+
+@pytest.mark.parametrize("field,value", [
+    ("MonthlyCharges", "abc"),
+    ("tenure", 2.5),
+    ("tenure", -1),
+    ("Contract", "Weekly"),
+    ("SeniorCitizen", True),
+    ("join_date", "2024-13-40"),
+    ("favouriteColour", "blue"),
+])
+def test_invalid_fields_are_rejected(field, value):
+    """Wrong types, unknown enum values, bad dates and unknown fields are reported per field."""
+    data = valid_customer()
+    data[field] = value
+    with pytest.raises(CustomerValidationError) as error:
+        validate_customer(data)
+    assert field in error.value.errors
+
+def test_partial_updates_skip_required_fields():
+    """Updates only validate the fields they contain."""
+    assert validate_customer({"MonthlyCharges": 60}, partial=True) == {"MonthlyCharges": 60.0}
+    with pytest.raises(CustomerValidationError) as error:
+        validate_customer({"MonthlyCharges": 60})
+    assert "customerID" in error.value.errors
+
+def test_json_schema_matches_declared_types():
+    """The MongoDB validator is generated from the same field definitions."""
+    schema = customer_json_schema()["$jsonSchema"]
+    assert schema["properties"]["TotalCharges"]["bsonType"] == "double"
+    assert schema["properties"]["tenure"]["bsonType"] == ["int", "long"]
+    assert "customerID" in schema["required"]
+
+def test_create_customer_rejects_invalid_data(client):
+    """The create endpoint returns 400 with details instead of storing arbitrary JSON."""
+    data = valid_customer()
+    data["MonthlyCharges"] = "lots"
+    response = client.post('/customer', json=data)
+    assert response.status_code == 400
+    assert "MonthlyCharges" in json.loads(response.data)["details"]
@@ -14,8 +14,9 @@ def test_get_db_connection(app):
 @patch('pymongo.MongoClient')
 def test_get_db_mock(mock_client, app):
     """Test database connection using mocks."""
+    from db import mongo_db_name
     mock_db = MagicMock()
-    mock_client.return_value.churn_database = mock_db
+    setattr(mock_client.return_value, mongo_db_name, mock_db)
     
     with app.app_context():
         from db import get_db
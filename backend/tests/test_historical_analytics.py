@@ -0,0 +1,156 @@
+import csv
+import gzip
+import io
+import pytest
+from datetime import datetime, timedelta
+from db import get_db
+from historical_rollups import (roll_up_closed_days, choose_tier, get_period_bounds, store_daily_snapshot,
+                                ROLLUP_PERIODS)
+# This file tests the historical analytics endpoints
+
+def recent_week():
+    """Monday to Wednesday four weeks ago, inside the retention of the historical_analytics TTL index"""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    monday = today - timedelta(days=today.weekday() + 28)
+    return [monday + timedelta(days=offset) for offset in range(3)]
+
+def query_range(days):
+    return f"{days[0]:%Y-%m-%d}", f"{days[-1]:%Y-%m-%d}"
+
+def roll_up_test_days(days):
+    """Fold only the snapshots of the fixture, never the rest of the collection"""
+    return roll_up_closed_days(get_db(), days[-1] + timedelta(days=1), {"timestamp": {"$gte": days[0]}})
+
+@pytest.fixture
+def historical_snapshots(app):
+    """Insert a few recent snapshots into the test database, replacing any of those days."""
+    with app.app_context():
+        db = get_db()
+        days = recent_week()
+        db.historical_analytics.delete_many({"timestamp": {"$gte": days[0], "$lt": days[-1] + timedelta(days=1)}})
+        db.historical_rollups.delete_many({"$or": [
+            {"period": period, "period_start": get_period_bounds(days[0], period)[0]} for period in ROLLUP_PERIODS]})
+
+        for index, day in enumerate(days):
+            db.historical_analytics.insert_one({
+                "timestamp": day,
+                "data": {
+                    "churn_distribution": {"churned": 26.5 + index, "notChurned": 73.5 - index},
+                    "churn_by_payment_method": {"Electronic check": 45.291, "Mailed check": 19.1},
+                    "churn_by_contract": {"Month-to-month": 42.7, "Two year": 2.8},
+                    "churn_by_tenure_group": {"0-12": 47.4, "49+": 9.5},
+                    "customer_counts": {
+                        "total": 7043 + index,
+                        "segments": {"high_value": 3000, "new": 500}
+                    },
+                    "revenue": {"monthly": 456116.6, "total": 16056168.7},
+                    # Only in the last snapshot
+                    **({"portfolio": {"clv": 1000.0}} if index == len(days) - 1 else {})
+                }
+            })
+
+        yield days
+
+        db.historical_analytics.delete_many({"timestamp": {"$gte": days[0], "$lt": days[-1] + timedelta(days=1)}})
+        db.historical_rollups.delete_many({"$or": [
+            {"period": period, "period_start": get_period_bounds(days[0], period)[0]} for period in ROLLUP_PERIODS]})
+
+def test_csv_export_streams_all_rows(client, historical_snapshots):
+    """The CSV export contains the probed header and one row per snapshot, newest first."""
+    start, end = query_range(historical_snapshots)
+    response = client.get(f'/historical-analytics/csv?start_date={start}&end_date={end}')
+    assert response.status_code == 200
+    assert response.is_streamed
+
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0][:4] == ["Date", "Time", "Churn Percentage", "Active Percentage"]
+    assert "Contract - Month-to-month" in rows[0]
+    assert "Segment - high_value" in rows[0]
+    assert len(rows) == 4
+    assert rows[1][0] == end
+    assert rows[1][rows[0].index("Payment Method - Electronic check")] == "45.29"
+
+def test_csv_export_gzip(client, historical_snapshots):
+    """The export can be gzip-compressed on the fly."""
+    start, end = query_range(historical_snapshots)
+    response = client.get(f'/historical-analytics/csv?start_date={start}&end_date={end}&gzip=true')
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+
+    text = gzip.decompress(response.get_data()).decode('utf-8')
+    assert len(list(csv.reader(io.StringIO(text)))) == 4
+
+def test_csv_export_empty_range(client):
+    """An empty date range returns 404 before anything is streamed."""
+    response = client.get('/historical-analytics/csv?start_date=1990-01-01&end_date=1990-01-02')
+    assert response.status_code == 404
+
+def test_series_returns_columnar_metrics(client, historical_snapshots):
+    """The series endpoint returns only the requested metrics as arrays, oldest first."""
+    start, end = query_range(historical_snapshots)
+    response = client.get('/historical-analytics/series'
+                          '?metrics=churn_by_contract.Month-to-month,customer_counts.total,revenue.missing'
+                          f'&start={start}&end={end}&tier=raw')
+    assert response.status_code == 200
+
+    data = response.get_json()
+    assert data["timestamps"] == [f"{day:%Y-%m-%d}" for day in historical_snapshots]
+    assert data["series"]["churn_by_contract.Month-to-month"] == [42.7, 42.7, 42.7]
+    assert data["series"]["customer_counts.total"] == [7043, 7044, 7045]
+    assert data["series"]["revenue.missing"] == [None, None, None]
+
+def test_series_with_overlapping_metrics(client, historical_snapshots):
+    """A metric and its parent can be requested together, the parent covers the projection."""
+    start, end = query_range(historical_snapshots)
+    for tier in ('raw', 'week'):
+        if tier == 'week':
+            roll_up_test_days(historical_snapshots)
+        response = client.get('/historical-analytics/series?metrics=revenue,revenue.monthly'
+                              f'&start={start}&end={end}&tier={tier}')
+        assert response.status_code == 200
+        assert response.get_json()["series"]["revenue.monthly"][0] == pytest.approx(456116.6)
+
+def test_series_requires_metrics(client):
+    """Requests without metrics or with invalid paths are rejected."""
+    assert client.get('/historical-analytics/series').status_code == 400
+    assert client.get('/historical-analytics/series?metrics=$where').status_code == 400
+
+def test_closed_days_roll_up_once(app, client, historical_snapshots):
+    """Closed days are folded into weekly rollups exactly once and served from that tier."""
+    assert roll_up_test_days(historical_snapshots) == 3
+    assert roll_up_test_days(historical_snapshots) == 0
+
+    start, end = query_range(historical_snapshots)
+    response = client.get('/historical-analytics/series?metrics=customer_counts.total,portfolio.clv'
+                          f'&start={start}&end={end}&tier=week')
+    assert response.status_code == 200
+
+    data = response.get_json()
+    assert data["tier"] == "week"
+    assert data["timestamps"] == [start]
+    assert data["series"]["customer_counts.total"] == [7044]
+    # The mean of a metric only some snapshots have is over those snapshots
+    assert data["series"]["portfolio.clv"] == [1000.0]
+    assert data["min"]["customer_counts.total"] == [7043]
+    assert data["max"]["customer_counts.total"] == [7045]
+
+def test_daily_snapshot_is_keyed_on_the_day(app):
+    """Capturing a day twice, e.g. by two overlapping leaders, updates the one document."""
+    db = get_db()
+    day = recent_week()[0] - timedelta(days=1)
+    db.historical_analytics.delete_many({"timestamp": day})
+    try:
+        assert store_daily_snapshot(db, day, {"customer_counts": {"total": 1}}) is True
+        assert store_daily_snapshot(db, day, {"customer_counts": {"total": 2}}) is False
+        documents = list(db.historical_analytics.find({"timestamp": day}))
+        assert len(documents) == 1
+        assert documents[0]["_id"] == f"{day:%Y-%m-%d}" and documents[0]["data"]["customer_counts"]["total"] == 2
+    finally:
+        db.historical_analytics.delete_many({"timestamp": day})
+
+def test_long_ranges_use_rollup_tiers():
+    """Recent short ranges stay raw, older or longer ranges move to rollups."""
+    now = datetime(2024, 6, 1)
+    assert choose_tier(datetime(2024, 5, 1), None, now) == 'raw'
+    assert choose_tier(datetime(2023, 6, 1), datetime(2024, 6, 1), now) == 'week'
+    assert choose_tier(datetime(2020, 1, 1), datetime(2024, 6, 1), now) == 'month'
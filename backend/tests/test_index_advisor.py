@@ -0,0 +1,118 @@
+import importlib
+from pymongo.errors import OperationFailure
+import index_advisor
+from index_advisor import (QUERY_SHAPES, REQUIRED_INDEXES, build_report, ensure_indexes, index_name,
+                           summarize_plan, unused_indexes, _filter_keys)
+# This file tests the index advisor against canned explain() output
+
+# Winning plans as a server returns them
+INDEX_PLAN = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "customerID_1"}}
+SORTED_SCAN_PLAN = {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}
+OR_PLAN = {"stage": "SUBPLAN", "inputStage": {"stage": "FETCH", "inputStage": {"stage": "OR", "inputStages": [
+    {"stage": "IXSCAN", "indexName": "join_date_1"},
+    {"stage": "IXSCAN", "indexName": "joinDate_1"}
+]}}}
+
+class FakeCursor:
+    def __init__(self, explain):
+        self.explained = explain
+        self.sorted_by = None
+
+    def sort(self, keys):
+        self.sorted_by = keys
+        return self
+
+    def explain(self):
+        return self.explained
+
+class FakeCollection:
+    def __init__(self, indexes=(), plan=None, index_stats=None):
+        self.indexes = [{"name": "_id_"}] + [{"name": name} for name in indexes]
+        self.plan = plan or INDEX_PLAN
+        self.index_stats = index_stats
+        self.created = []
+
+    def find(self, query):
+        # Newer servers wrap the classic plan in queryPlan
+        return FakeCursor({"queryPlanner": {"winningPlan": {"queryPlan": self.plan}},
+                           "executionStats": {"totalDocsExamined": 10, "nReturned": 1}})
+
+    def list_indexes(self):
+        return iter(self.indexes)
+
+    def create_index(self, keys, **options):
+        self.created.append((index_name(keys), options))
+
+    def aggregate(self, pipeline):
+        if self.index_stats is None:
+            raise OperationFailure("$indexStats is not allowed")
+        return iter(self.index_stats)
+
+class FakeDatabase(dict):
+    def __missing__(self, name):
+        collection = self[name] = FakeCollection()
+        return collection
+
+def test_summarize_plan_follows_every_input_stage():
+    assert summarize_plan(INDEX_PLAN) == (["FETCH", "IXSCAN"], ["customerID_1"])
+    assert summarize_plan(SORTED_SCAN_PLAN) == (["SORT", "COLLSCAN"], [])
+    stages, indexes = summarize_plan(OR_PLAN)
+    assert stages == ["SUBPLAN", "FETCH", "OR", "IXSCAN", "IXSCAN"]
+    assert sorted(indexes) == ["joinDate_1", "join_date_1"]
+    assert summarize_plan({}) == ([], [])
+
+def test_filter_keys_include_logical_clauses():
+    query = {"$or": [{"join_date": {"$gte": "2024"}}, {"$and": [{"joinDate": 1}, {"Churn": "Yes"}]}],
+             "tenure": {"$gt": 12}, "$comment": "ignored"}
+    assert _filter_keys(query) == {"join_date", "joinDate", "Churn", "tenure"}
+
+def test_ensure_indexes_reports_without_creating(monkeypatch):
+    monkeypatch.setattr(index_advisor, "ensure_historical_indexes", lambda db: None)
+    db = FakeDatabase()
+    db["users"] = FakeCollection(indexes=[index_name(spec["keys"]) for spec in REQUIRED_INDEXES["users"]])
+
+    missing = ensure_indexes(db, create=False)
+    assert missing and all(collection != "users" for collection, _ in missing)
+    assert not any(collection.created for collection in db.values())
+
+    assert ensure_indexes(db) == missing
+    created = {(name, collection_name) for collection_name, collection in db.items()
+               for name, _ in collection.created}
+    assert created == {(name, collection_name) for collection_name, name in missing}
+
+def test_unused_indexes_skip_the_id_index_and_collections_without_stats():
+    db = FakeDatabase()
+    db["users"] = FakeCollection(index_stats=[
+        {"name": "_id_", "accesses": {"ops": 0}},
+        {"name": "tenure_1", "accesses": {"ops": 0}},
+        {"name": "Churn_1", "accesses": {"ops": 12}}
+    ])
+    db["historical_analytics"] = FakeCollection()
+    assert unused_indexes(db, ["users", "historical_analytics"]) == [{"collection": "users", "index": "tenure_1"}]
+
+def test_build_report_flags_scans_and_leaves_out_statistics(monkeypatch):
+    monkeypatch.setattr(index_advisor, "QUERY_SHAPES", [
+        {"source": "customer_bp.get_customer_details", "collection": "users", "filter": {"customerID": "x"}},
+        {"source": "survival_bp.get_survival_curve", "collection": "survival_curves", "filter": {},
+         "sort": [("timestamp", -1)]}
+    ])
+    db = FakeDatabase()
+    db["survival_curves"] = FakeCollection(plan=SORTED_SCAN_PLAN)
+
+    report = build_report(db)
+    users, curves = report["shapes"]
+    assert users["indexes"] == ["customerID_1"] and not users["collection_scan"]
+    assert curves["collection_scan"] and curves["in_memory_sort"]
+    assert report["collection_scans"] == ["survival_bp.get_survival_curve on survival_curves []"]
+    assert "docs_examined" not in users
+    assert build_report(db, include_stats=True)["shapes"][0]["docs_examined"] == 10
+
+def test_every_query_shape_source_exists(app):
+    """Sources are endpoints of the app or module functions, so the list can't drift silently."""
+    for shape in QUERY_SHAPES:
+        source = shape["source"]
+        if source in app.view_functions:
+            continue
+        module_name, function_name = source.rsplit(".", 1)
+        module = importlib.import_module(module_name)
+        assert callable(getattr(module, function_name, None)), f"{source} is neither an endpoint nor a function"
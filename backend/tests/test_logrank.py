@@ -0,0 +1,63 @@
+import itertools
+import numpy as np
+import pytest
+from lifelines.statistics import logrank_test
+from logrank import logrank_matrix, adjust_p_values
+from routes import survival_routes
+# This file tests the pairwise log rank tests computed from grouped counts
+
+SEGMENTS = ["Month-to-month", "One year", "Two year"]
+
+@pytest.fixture(scope="module")
+def customers(make_customers):
+    """Random customers of three contract segments with different churn hazards"""
+    df = make_customers(n=600, seed=3, effects={"Contract_Monthly": 0.6, "Contract_OneYear": 0.1}, event_share=0.7)
+    return df.assign(segment=df["Contract"])[["segment", "tenure", "event"]]
+
+def pipeline_rows(df):
+    """What tenure_counts_pipeline returns for the frame"""
+    grouped = df.groupby(["segment", "tenure"])["event"].agg(["size", "sum"]).reset_index()
+    return [
+        {"_id": {"segment": row.segment, "tenure": int(row.tenure)}, "customers": int(row.size), "events": int(row.sum)}
+        for row in grouped.itertuples()
+    ]
+
+def test_matches_lifelines_logrank(customers):
+    """Every pair gets the statistic lifelines computes on the raw durations."""
+    result = logrank_matrix(pipeline_rows(customers), correction="none")
+    assert [segment["segment"] for segment in result["segments"]] == SEGMENTS
+    assert sum(segment["customers"] for segment in result["segments"]) == len(customers)
+    pairs = {(pair["a"], pair["b"]): pair for pair in result["pairs"]}
+    for a, b in itertools.combinations(SEGMENTS, 2):
+        first, second = customers[customers["segment"] == a], customers[customers["segment"] == b]
+        expected = logrank_test(first["tenure"], second["tenure"], first["event"], second["event"])
+        assert pairs[(a, b)]["test_statistic"] == pytest.approx(expected.test_statistic, rel=1e-9)
+        assert pairs[(a, b)]["p_value"] == pytest.approx(expected.p_value, rel=1e-6)
+    # The matrices are symmetric with nothing on the diagonal
+    statistics = np.array(result["test_statistics"])
+    assert np.allclose(statistics, statistics.T) and not statistics.diagonal().any()
+
+def test_holm_and_bonferroni():
+    p_values = [0.01, 0.04, 0.03, 0.5]
+    assert np.allclose(adjust_p_values(p_values, "bonferroni"), [0.04, 0.16, 0.12, 1.0])
+    # Sorted 0.01 * 4, 0.03 * 3, 0.04 * 2, 0.5 * 1 with the running maximum
+    assert np.allclose(adjust_p_values(p_values, "holm"), [0.04, 0.09, 0.09, 0.5])
+
+def test_endpoint_validates_and_caches(client, db_with_test_data, monkeypatch):
+    db, _ = db_with_test_data
+    # A second contract type for the matrix
+    db.users.insert_one({"customerID": "TEST-1002", "Contract": "Two year", "tenure": 40, "Churn": "Yes"})
+    try:
+        monkeypatch.setattr(survival_routes, "_logrank_counts", {})
+        assert client.get('/survival/logrank-matrix?by=customerID').status_code == 400
+        assert client.get('/survival/logrank-matrix?correction=fdr').status_code == 400
+
+        response = client.get('/survival/logrank-matrix?by=Contract')
+        assert response.status_code == 200
+        body = response.get_json()
+        assert body["by"] == "Contract" and body["correction"] == "holm"
+        assert len(body["pairs"]) == len(body["segments"]) * (len(body["segments"]) - 1) // 2
+        assert len(survival_routes._logrank_counts) == 1
+        assert client.get('/survival/logrank-matrix?by=Contract').get_json() == body
+    finally:
+        db.users.delete_one({"customerID": "TEST-1002"})
@@ -0,0 +1,48 @@
+import json
+import pytest
+import memory_accounting
+from metrics import request_rss_growth, request_rss_high_water
+# This file tests the per-request memory accounting and the memory profiles
+
+@pytest.fixture
+def admin_headers(client, setup_test_user):
+    response = client.post('/auth/login', json={'username': 'testuser', 'password': 'testpassword'})
+    return {'Authorization': f"Bearer {json.loads(response.data)['token']}"}
+
+def test_current_rss():
+    assert memory_accounting.current_rss() > 1024 * 1024
+
+def test_requests_record_memory(client):
+    """Every request records its RSS growth and the endpoint high-water mark."""
+    before = request_rss_growth.count(endpoint='analytics_bp.get_churn_analytics')
+    response = client.get('/analytics')
+    assert response.status_code == 200
+    assert request_rss_growth.count(endpoint='analytics_bp.get_churn_analytics') == before + 1
+    assert request_rss_high_water.get(endpoint='analytics_bp.get_churn_analytics') > 0
+    assert 'Connection' not in response.headers
+
+def test_budget_outside_gunicorn_only_warns(client, monkeypatch):
+    """Above the budget the connection is closed, but only gunicorn workers are signalled."""
+    kills = []
+    monkeypatch.setattr(memory_accounting, 'MEMORY_BUDGET_MB', 1)
+    monkeypatch.setattr(memory_accounting.os, 'kill', lambda pid, sig: kills.append(sig))
+    response = client.get('/analytics')
+    assert response.headers['Connection'] == 'close'
+    assert kills == []
+
+def test_memory_profile(client, admin_headers):
+    """A memory profile stores the top allocating lines and the peak."""
+    response = client.get('/analytics', headers={**admin_headers, 'X-Profile': 'memory'})
+    assert response.status_code == 200
+    profile_id = response.headers['X-Profile-Id']
+
+    data = json.loads(client.get(f'/admin/profiles/{profile_id}', headers=admin_headers).data)
+    assert data['mode'] == 'memory'
+    assert data['allocation_peak_bytes'] > 0
+    for row in data['top_allocations']:
+        assert 'tracemalloc' not in row['filename']
+        assert ':' in row['location']
+
+    listing = json.loads(client.get('/admin/profiles', headers=admin_headers).data)
+    listed = next(profile for profile in listing['profiles'] if profile['id'] == profile_id)
+    assert 'top_allocations' not in listed
@@ -0,0 +1,96 @@
+import json
+import subprocess
+import sys
+import pytest
+from types import SimpleNamespace
+from metrics import (Histogram, Counter, Gauge, Registry, MongoCommandMetrics, mongo_command_duration,
+                     http_request_duration)
+# This file tests the in-process metrics and the /metrics endpoint
+
+def test_histogram_renders_cumulative_buckets():
+    """Buckets are cumulative and end with +Inf, sum and count follow."""
+    histogram = Histogram("test_seconds", "Test histogram", ["route"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, route="/a")
+
+    lines = histogram.render()
+    assert lines[0] == "# HELP test_seconds Test histogram"
+    assert lines[1] == "# TYPE test_seconds histogram"
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/a",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'test_seconds_sum{route="/a"} 4.05' in lines
+    assert 'test_seconds_count{route="/a"} 4' in lines
+
+def test_counter_escapes_label_values():
+    counter = Counter("test_total", "Test counter", ["cache"])
+    counter.inc(cache='say "hi"')
+    counter.inc(2, cache='say "hi"')
+    assert counter.render()[-1] == 'test_total{cache="say \\"hi\\""} 3'
+
+def test_workers_are_merged(tmp_path):
+    """Counters and histograms sum over all workers, the sum gauge only over the live ones."""
+    registry = Registry()
+    requests = registry.register(Counter("test_requests_total", "Test counter", ["route"]))
+    latency = registry.register(Histogram("test_seconds", "Test histogram", buckets=(0.1, 1.0)))
+    memory = registry.register(Gauge("test_memory_bytes", "Test gauge", multiprocess_mode="sum"))
+    peak = registry.register(Gauge("test_peak_bytes", "Test high-water gauge"))
+    requests.inc(2, route="/a")
+    latency.observe(0.05)
+    memory.set(100)
+    peak.set_max(100)
+
+    # A worker that has exited
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    (tmp_path / "worker-exited.json").write_text(json.dumps({"pid": int(exited.stdout), "metrics": {
+        "test_requests_total": [[["/a"], 3], [["/b"], 1]],
+        "test_seconds": [[[], [[0, 1, 0], 0.5, 1]]],
+        "test_memory_bytes": [[[], 500]],
+        "test_peak_bytes": [[[], 500]]
+    }}))
+
+    lines = registry.render(str(tmp_path)).splitlines()
+    assert 'test_requests_total{route="/a"} 5' in lines
+    assert 'test_requests_total{route="/b"} 1' in lines
+    assert 'test_seconds_bucket{le="0.1"} 1' in lines and 'test_seconds_bucket{le="1.0"} 2' in lines
+    assert 'test_seconds_count 2' in lines
+    assert 'test_memory_bytes 100' in lines
+    assert 'test_peak_bytes 500' in lines
+
+def test_mongo_listener_times_commands():
+    """The collection of the started event is attached to the finished command."""
+    listener = MongoCommandMetrics()
+    before = mongo_command_duration.count(command="find", collection="metrics_test", outcome="success")
+
+    started = SimpleNamespace(command_name="find", command={"find": "metrics_test"}, connection_id=("h", 1), request_id=7)
+    listener.started(started)
+    listener.succeeded(SimpleNamespace(command_name="find", connection_id=("h", 1), request_id=7, duration_micros=1500))
+
+    assert mongo_command_duration.count(command="find", collection="metrics_test", outcome="success") == before + 1
+    assert listener.collections == {}
+
+def test_metrics_endpoint(client, monkeypatch):
+    """Requests are recorded per endpoint and exposed in the text format."""
+    monkeypatch.setenv("METRICS_TOKEN", "secret")
+    client.environ_base['HTTP_AUTHORIZATION'] = 'Bearer secret'
+    before = http_request_duration.count(endpoint="metrics_bp.get_metrics", method="GET", status=200)
+    client.get('/metrics')
+    assert http_request_duration.count(endpoint="metrics_bp.get_metrics", method="GET", status=200) == before + 1
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    body = response.get_data(as_text=True)
+    assert '# TYPE http_request_duration_seconds histogram' in body
+    assert 'http_request_duration_seconds_count{endpoint="metrics_bp.get_metrics",method="GET",status="200"}' in body
+
+def test_metrics_token(client, monkeypatch):
+    """Without a token the endpoint is closed unless METRICS_PUBLIC opens it."""
+    monkeypatch.delenv("METRICS_TOKEN", raising=False)
+    assert client.get('/metrics').status_code == 403
+    monkeypatch.setenv("METRICS_PUBLIC", "true")
+    assert client.get('/metrics').status_code == 200
+
+    monkeypatch.setenv("METRICS_TOKEN", "secret")
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+from db import get_db
+import model_registry
+from data_version import bump_data_version, current_data_version
+from survival_model import CoxScorer, fit_scorer
+from routes import survival_routes
+# This file tests the background Cox refit, its validation and publication
+
+FEATURES = ["Contract_Monthly", "MonthlyCharges"]
+
+@pytest.fixture(scope="module")
+def random_customers(make_customers):
+    """Random customers with contract and charge effects, a different set per seed"""
+    return lambda seed: make_customers(seed=seed, effects={"Contract_Monthly": 1.2, "MonthlyCharges": 0.01},
+                                       id_prefix="TEST-REFIT")
+
+@pytest.fixture
+def registry(app, monkeypatch):
+    """An empty model registry, fits run in the test process"""
+    db = get_db()
+    db.model_registry.delete_many({})
+    db.survival_models.delete_many({})
+    monkeypatch.setattr(model_registry, "REFIT_IN_SUBPROCESS", False)
+    yield db
+    db.model_registry.delete_many({})
+    db.survival_models.delete_many({})
+
+def test_encode_round_trip(random_customers):
+    df = random_customers(1)
+    scorer = fit_scorer(df, FEATURES)
+    scorer.risk_index = model_registry.RiskIndex(scorer.partial_hazard(df))
+    restored = model_registry.decode_scorer(model_registry.encode_scorer(scorer))
+    np.testing.assert_allclose(restored.survival(df.head(5)), scorer.survival(df.head(5)))
+    np.testing.assert_array_equal(restored.risk_index.partial_hazards, scorer.risk_index.partial_hazards)
+
+def test_warm_start_matches_cold_fit(random_customers):
+    df = random_customers(2)
+    cold = fit_scorer(df, FEATURES)
+    warm = fit_scorer(df, FEATURES, cold.coefficients * 0.9)
+    np.testing.assert_allclose(warm.coefficients, cold.coefficients, rtol=1e-5)
+
+def test_fit_in_subprocess(random_customers, monkeypatch):
+    monkeypatch.setattr(model_registry, "REFIT_IN_SUBPROCESS", True)
+    df = random_customers(3)
+    scorer = model_registry.fit_in_subprocess(df[FEATURES + ["tenure", "event"]], FEATURES, None)
+    np.testing.assert_allclose(scorer.coefficients, fit_scorer(df, FEATURES).coefficients)
+
+def test_refit_publishes_to_workers(registry, random_customers, monkeypatch):
+    """The first refit is published and workers switch to it on their next check."""
+    df = random_customers(4)
+    assert model_registry.should_refit(registry, 0)
+    model_id = model_registry.refit_model(registry, df, 5, FEATURES)
+    assert model_registry.published_model_id(registry) == model_id
+    assert not model_registry.should_refit(registry, 5 + model_registry.REFIT_MIN_CHANGES - 1)
+    assert model_registry.should_refit(registry, 5 + model_registry.REFIT_MIN_CHANGES)
+    assert model_registry.should_refit(registry, 5, force=True)
+
+    monkeypatch.setitem(survival_routes._scorer_cache, "checked_at", float("-inf"))
+    monkeypatch.setitem(survival_routes._scorer_cache, "model_id", None)
+    scorer = survival_routes.get_cox_scorer()
+    assert survival_routes._scorer_cache["model_id"] == model_id
+    assert len(scorer.risk_index) == len(df)
+    # /risk-factors is served from the stored summary
+    assert set(scorer.summary["coefficients"]) == set(FEATURES)
+    assert scorer.summary["observations"] == registry.survival_models.find_one({"_id": model_id})["rows"]
+
+def test_worse_or_failed_refit_keeps_serving_model(registry, random_customers, monkeypatch):
+    df = random_customers(5)
+    model_id = model_registry.refit_model(registry, df, 1, FEATURES)
+    good = model_registry.load_scorer(registry, model_id)
+
+    # Reversed coefficients rank the customers backwards
+    worse = CoxScorer(FEATURES, -good.coefficients, good.means, good.timeline, good.baseline_cumulative_hazard)
+    monkeypatch.setattr(model_registry, "fit_in_subprocess", lambda *args: worse)
+    assert model_registry.refit_model(registry, df, 200, FEATURES) is None
+
+    def fail(*args):
+        raise RuntimeError("convergence failure")
+    monkeypatch.setattr(model_registry, "fit_in_subprocess", fail)
+    assert model_registry.refit_model(registry, df, 300, FEATURES) is None
+
+    assert model_registry.published_model_id(registry) == model_id
+    statuses = [record["status"] for record in registry.survival_models.find({}, sort=[("data_version", 1)])]
+    assert statuses == ["published", "rejected", "failed"]
+    # The attempts count, the same data isn't refitted again
+    assert not model_registry.should_refit(registry, 300)
+
+def test_customer_writes_bump_data_version(client, app):
+    db = get_db()
+    before = current_data_version(db)
+    assert bump_data_version(db, 0) == before
+    response = client.post('/customer', json={
+        "customerID": "TEST-VERSION-1", "gender": "Male", "SeniorCitizen": 0, "Partner": "No", "Dependents": "No",
+        "tenure": 1, "PhoneService": "Yes", "MultipleLines": "No", "InternetService": "DSL", "OnlineSecurity": "No",
+        "OnlineBackup": "No", "DeviceProtection": "No", "TechSupport": "No", "StreamingTV": "No",
+        "StreamingMovies": "No", "Contract": "Month-to-month", "PaperlessBilling": "Yes",
+        "PaymentMethod": "Mailed check", "MonthlyCharges": 20.0, "TotalCharges": 20.0, "Churn": "No"
+    })
+    try:
+        assert response.status_code == 200
+        assert current_data_version(db) == before + 1
+        assert client.delete('/customer/TEST-VERSION-1').status_code == 200
+        assert current_data_version(db) == before + 2
+    finally:
+        db.users.delete_many({"customerID": "TEST-VERSION-1"})
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from lifelines import CoxPHFitter
+from db import get_db
+from portfolio import compute_portfolio_clv
+from survival_model import CoxScorer
+from routes import survival_routes
+# This file tests the portfolio CLV job and its endpoint
+
+@pytest.fixture(scope="module")
+def customers(make_customers):
+    """Random customers with a Cox model fitted on them"""
+    df = make_customers(n=300, seed=11, effects={"Contract_Monthly": 1.2}, event_share=0.6, id_prefix="TEST-CLV")
+    cph = CoxPHFitter().fit(df[["Contract_Monthly", "MonthlyCharges", "tenure", "event"]], "tenure", "event")
+    return CoxScorer.from_fitter(cph), df
+
+def test_remaining_lifetime_matches_integration(customers):
+    """The restricted mean equals a fine numerical integration of S(t) / S(tenure)."""
+    scorer, df = customers
+    rows = df.head(5)
+    tenure = rows["tenure"].to_numpy(dtype=float)
+    horizon = 24
+    remaining = scorer.expected_remaining_lifetime(rows, tenure, horizon)
+
+    step = 0.001
+    for index in range(len(rows)):
+        grid = np.arange(tenure[index], tenure[index] + horizon, step)
+        curve = scorer.survival_at(rows.iloc[[index]], grid)[0]
+        start = scorer.survival_at(rows.iloc[[index]], [tenure[index]])[0, 0]
+        assert remaining[index] == pytest.approx(curve.sum() * step / start, rel=1e-3)
+    assert ((remaining > 0) & (remaining <= horizon)).all()
+
+def test_portfolio_job_and_endpoint(app, client, customers, monkeypatch):
+    """Active customers get their CLV written back and the segment totals are served."""
+    scorer, df = customers
+    db = get_db()
+    db.users.delete_many({"customerID": {"$regex": "^TEST-CLV-"}})
+    db.users.insert_many(df[["customerID", "Contract", "MonthlyCharges"]].to_dict("records"))
+    document = None
+    try:
+        document = compute_portfolio_clv(db, scorer, df, horizon=12)
+        active = df[df["event"] == 0]
+        assert document["portfolio"]["customers"] == len(active)
+        assert document["customers_updated"] == len(active)
+        contracts = {row["segment"]: row for row in document["segments"]["Contract"]}
+        assert sum(row["customers"] for row in contracts.values()) == len(active)
+        assert contracts["Month-to-month"]["mean_remaining_months"] < contracts["Two year"]["mean_remaining_months"]
+
+        customer = db.users.find_one({"customerID": active["customerID"].iloc[0]})
+        assert 0 < customer["expected_remaining_months"] <= 12
+        assert customer["clv"] == pytest.approx(customer["MonthlyCharges"] * customer["expected_remaining_months"], abs=0.1)
+        assert db.users.find_one({"customerID": df[df["event"] == 1]["customerID"].iloc[0]}).get("clv") is None
+
+        monkeypatch.setitem(survival_routes._portfolio_cache, "document", None)
+        response = client.get('/survival/portfolio-clv')
+        assert response.status_code == 200
+        assert response.get_json()["portfolio"] == document["portfolio"]
+    finally:
+        db.users.delete_many({"customerID": {"$regex": "^TEST-CLV-"}})
+        if document is not None:
+            db.portfolio_clv.delete_many({"computed_at": document["computed_at"]})
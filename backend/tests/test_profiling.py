@@ -0,0 +1,63 @@
+import json
+import pstats
+import pytest
+# This file tests the on-demand request profiling for admins
+
+@pytest.fixture
+def admin_headers(client, setup_test_user):
+    response = client.post('/auth/login', json={'username': 'testuser', 'password': 'testpassword'})
+    return {'Authorization': f"Bearer {json.loads(response.data)['token']}"}
+
+def test_profiling_requires_admin(client):
+    """Asking for a profile without an admin token is rejected."""
+    response = client.get('/analytics?profile=sample')
+    assert response.status_code == 401
+
+def test_requests_without_flag_are_not_profiled(client):
+    response = client.get('/analytics')
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers
+
+def test_sampled_profile(client, admin_headers):
+    """A sampled request stores collapsed stacks that the admin endpoints serve."""
+    response = client.get('/analytics', headers={**admin_headers, 'X-Profile': 'sample'})
+    assert response.status_code == 200
+    profile_id = response.headers['X-Profile-Id']
+
+    summary = client.get(f'/admin/profiles/{profile_id}', headers=admin_headers)
+    assert summary.status_code == 200
+    data = json.loads(summary.data)
+    assert data['mode'] == 'sample'
+    assert data['endpoint'] == 'analytics_bp.get_churn_analytics'
+    assert data['username'] == 'testuser'
+    assert 'collapsed' not in data
+
+    collapsed = client.get(f'/admin/profiles/{profile_id}/collapsed', headers=admin_headers)
+    assert collapsed.status_code == 200
+    for line in collapsed.get_data(as_text=True).splitlines():
+        stack, count = line.rsplit(' ', 1)
+        assert int(count) > 0
+
+    assert client.get(f'/admin/profiles/{profile_id}/pstats', headers=admin_headers).status_code == 404
+
+def test_cprofile_profile(client, admin_headers, tmp_path):
+    """A cProfile request stores a pstats file and the top functions."""
+    response = client.get('/analytics?profile=cprofile', headers=admin_headers)
+    profile_id = response.headers['X-Profile-Id']
+
+    data = json.loads(client.get(f'/admin/profiles/{profile_id}', headers=admin_headers).data)
+    assert data['mode'] == 'cprofile'
+    assert any('get_churn_analytics' in row['function'] for row in data['top_functions'])
+
+    download = client.get(f'/admin/profiles/{profile_id}/pstats', headers=admin_headers)
+    assert download.status_code == 200
+    path = tmp_path / 'profile.pstats'
+    path.write_bytes(download.data)
+    stats = pstats.Stats(str(path))
+    assert stats.total_calls > 0
+
+    listing = json.loads(client.get('/admin/profiles', headers=admin_headers).data)
+    assert profile_id in [profile['id'] for profile in listing['profiles']]
+
+def test_unknown_profile(client, admin_headers):
+    assert client.get('/admin/profiles/not-an-id', headers=admin_headers).status_code == 404
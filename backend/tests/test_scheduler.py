@@ -0,0 +1,74 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from db import get_db
+from leader_election import LeaderLease
+# This file tests leader election for the scheduled jobs
+
+@pytest.fixture
+def lease_collection(app):
+    """Lease collection with the test lease removed before and after each test."""
+    collection = get_db().scheduler_leases
+    collection.delete_many({"_id": "test_scheduler"})
+    yield collection
+    collection.delete_many({"_id": "test_scheduler"})
+
+def test_only_one_process_holds_the_lease(lease_collection):
+    """A second process cannot acquire a lease that is held and not expired."""
+    first = LeaderLease('test_scheduler')
+    second = LeaderLease('test_scheduler')
+
+    assert first.heartbeat(lease_collection) is True
+    assert second.heartbeat(lease_collection) is False
+    assert first.is_leader and not second.is_leader
+
+    # Renewing does not report a new leadership
+    assert first.heartbeat(lease_collection) is False
+    assert first.is_leader
+
+def test_expired_lease_fails_over(lease_collection):
+    """When the holder stops renewing, another process takes the lease over."""
+    first = LeaderLease('test_scheduler')
+    second = LeaderLease('test_scheduler')
+    first.heartbeat(lease_collection)
+
+    # Simulate a holder that died without releasing the lease
+    lease_collection.update_one(
+        {"_id": "test_scheduler"},
+        {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(minutes=5)}}
+    )
+
+    assert second.heartbeat(lease_collection) is True
+    assert first.heartbeat(lease_collection) is False
+    assert not first.is_leader
+
+def test_release_hands_over_immediately(lease_collection):
+    """A released lease can be acquired without waiting for expiry."""
+    first = LeaderLease('test_scheduler')
+    second = LeaderLease('test_scheduler')
+    first.heartbeat(lease_collection)
+    first.release(lease_collection)
+
+    assert not first.is_leader
+    assert second.heartbeat(lease_collection) is True
+
+def test_takeover_queues_jobs_instead_of_running_them(app, lease_collection, monkeypatch):
+    """The heartbeat only renews the lease, the takeover work runs as one-off jobs."""
+    import scheduler
+    queued = []
+
+    class FakeScheduler:
+        def add_job(self, func, **kwargs):
+            queued.append(kwargs["args"][0])
+
+    ran = []
+    monkeypatch.setattr(scheduler, "flask_app", app)
+    monkeypatch.setattr(scheduler, "scheduler_instance", FakeScheduler())
+    monkeypatch.setattr(scheduler, "leader_lease", LeaderLease('test_scheduler'))
+    monkeypatch.setattr(scheduler, "capture_daily_analytics", lambda: ran.append("capture"))
+
+    scheduler.leader_heartbeat()
+    assert queued == ["ensure_indexes", "startup_analytics_capture", "startup_survival_model_refit"]
+    assert ran == []
+    # Renewals do not queue them again
+    scheduler.leader_heartbeat()
+    assert len(queued) == 3
@@ -0,0 +1,92 @@
+import json
+import mongomock
+import pytest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from request_context import job_context
+from slow_query_log import SlowQueryLog, command_shape, top_offenders
+# This file tests the slow query log and its admin endpoint
+
+def started_event(request_id, command_name, command):
+    return SimpleNamespace(command_name=command_name, command=command, database_name="churn_database",
+                           connection_id=("localhost", 27017), request_id=request_id)
+
+def succeeded_event(request_id, command_name, duration_ms, reply):
+    return SimpleNamespace(command_name=command_name, connection_id=("localhost", 27017), request_id=request_id,
+                           duration_micros=duration_ms * 1000, reply=reply)
+
+def test_shapes_redact_values():
+    """Field names and operators are kept, values are not."""
+    shape = command_shape("find", {"find": "users", "filter": {
+        "tenure": {"$gt": 12, "$lte": 24},
+        "$or": [{"Churn": "Yes"}, {"PaymentMethod": {"$in": ["Electronic check"]}}]
+    }})
+    assert shape == {"tenure": {"$gt": "?", "$lte": "?"}, "$or": [{"Churn": "?"}, {"PaymentMethod": {"$in": "?"}}]}
+
+    # count_documents is sent as an aggregate with a $match stage
+    shape = command_shape("aggregate", {"aggregate": "users", "pipeline": [
+        {"$match": {"Contract": "Two year", "Churn": "Yes"}}, {"$group": {"_id": 1, "n": {"$sum": 1}}}
+    ]})
+    assert shape == [{"$match": {"Contract": "?", "Churn": "?"}}, "$group"]
+
+def test_only_slow_commands_are_recorded():
+    log = SlowQueryLog(threshold_ms=50)
+    with job_context("daily_capture"):
+        log.started(started_event(1, "find", {"find": "users", "filter": {"Churn": "Yes"}}))
+        log.started(started_event(2, "find", {"find": "users", "filter": {"Churn": "No"}}))
+    log.succeeded(succeeded_event(1, "find", 120, {"cursor": {"firstBatch": [{}, {}, {}]}}))
+    log.succeeded(succeeded_event(2, "find", 10, {"cursor": {"firstBatch": []}}))
+
+    assert log.queue.qsize() == 1
+    record = log.queue.get_nowait()
+    assert record["source"] == "scheduler.daily_capture"
+    assert record["request_id"].startswith("daily_capture-")
+    assert record["collection"] == "users"
+    assert record["documents_returned"] == 3
+    assert json.loads(record["shape"]) == {"Churn": "?"}
+    assert log.pending == {}
+
+def test_top_offenders_groups_by_shape():
+    collection = mongomock.MongoClient().db.slow_queries
+    now = datetime.now()
+    collection.insert_many([
+        {"created_at": now, "collection": "users", "command": "aggregate", "shape": "A", "duration_ms": 300.0,
+         "documents_returned": 1, "source": "analytics_bp.get_churn_analytics", "request_id": "r1"},
+        {"created_at": now, "collection": "users", "command": "aggregate", "shape": "A", "duration_ms": 200.0,
+         "documents_returned": 1, "source": "scheduler.daily_analytics_capture", "request_id": "r2"},
+        {"created_at": now, "collection": "users", "command": "find", "shape": "B", "duration_ms": 150.0,
+         "documents_returned": 50, "source": "users_bp.get_users", "request_id": "r3"},
+        {"created_at": now - timedelta(days=3), "collection": "users", "command": "find", "shape": "C",
+         "duration_ms": 900.0, "documents_returned": 50, "source": "users_bp.get_users", "request_id": "r4"},
+    ])
+
+    offenders = top_offenders(collection, now - timedelta(hours=24))
+    assert [offender["shape"] for offender in offenders] == ["A", "B"]
+    assert offenders[0]["count"] == 2
+    assert offenders[0]["total_ms"] == 500.0
+    assert offenders[0]["sources"] == ["analytics_bp.get_churn_analytics", "scheduler.daily_analytics_capture"]
+
+def test_request_id_header(client):
+    """Requests get an id, a valid incoming one is kept."""
+    response = client.get('/analytics')
+    assert len(response.headers['X-Request-ID']) == 32
+    response = client.get('/analytics', headers={'X-Request-ID': 'trace-123'})
+    assert response.headers['X-Request-ID'] == 'trace-123'
+
+def test_slow_query_endpoint_requires_admin(client):
+    assert client.get('/admin/slow-queries').status_code == 401
+
+def test_slow_query_endpoints(client, setup_test_user):
+    from db import get_db
+    get_db().slow_queries.insert_one({
+        "created_at": datetime.now(), "collection": "users", "command": "find", "shape": "{}",
+        "duration_ms": 250.0, "documents_returned": 10, "source": "users_bp.get_users", "request_id": "r1"
+    })
+    token = json.loads(client.post('/auth/login', json={'username': 'testuser', 'password': 'testpassword'}).data)['token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    offenders = json.loads(client.get('/admin/slow-queries', headers=headers).data)['offenders']
+    assert any(offender['sources'] == ['users_bp.get_users'] for offender in offenders)
+
+    recent = json.loads(client.get('/admin/slow-queries/recent?source=users_bp.get_users', headers=headers).data)
+    assert recent['queries'][0]['request_id'] == 'r1'
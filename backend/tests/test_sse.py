@@ -0,0 +1,70 @@
+import json
+import pytest
+from datetime import datetime
+from db import get_db
+from routes import survival_routes
+from routes.survival_routes import store_survival_curves
+from sse import event_stream
+from survival_model import fit_scorer
+# This file tests the Server-Sent Events variants of the survival endpoints
+
+def parse_events(body):
+    """(event, data) pairs of a text/event-stream body, comments skipped"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n") if not line.startswith(":"))
+        if lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+@pytest.fixture
+def customers(make_customers, monkeypatch):
+    """Random customers served to the survival routes"""
+    df = make_customers(seed=6, effects={"Contract_Monthly": 1.5})
+    monkeypatch.setattr(survival_routes, "prepare_survival_data", lambda: df)
+    return df
+
+def test_error_midway_ends_the_stream(app):
+    def events():
+        yield "curve", {"segment": "overall"}
+        raise ValueError("lost the database")
+
+    with app.test_request_context():
+        response = event_stream(events())
+        assert response.mimetype == "text/event-stream"
+        body = "".join(response.response)
+    assert parse_events(body) == [("curve", {"segment": "overall"}), ("error", {"error": "lost the database"})]
+
+def test_live_curve_stream_matches_json(client, customers):
+    body = client.get('/survival-curve/stream?live=true').get_data(as_text=True)
+    events = parse_events(body)
+    assert events[0] == ("meta", {"source": "live", "customers": len(customers)})
+    assert [event for event, _ in events[1:]] == ["curve"] * 7 + ["logrank", "done"]
+
+    expected = client.get('/survival-curve?live=true').get_json()
+    curves = {data.pop("segment"): data for event, data in events if event == "curve"}
+    assert curves == expected["curves"]
+    assert events[-2][1] == expected["statistical_insights"]
+
+def test_curve_stream_of_a_stored_day(client, customers):
+    day = datetime(2999, 4, 1)
+    store_survival_curves(get_db(), day, customers)
+    try:
+        events = parse_events(client.get('/survival-curve/stream?date=2999-04-01').get_data(as_text=True))
+        assert events[0] == ("meta", {"source": "snapshot", "snapshot_date": "2999-04-01", "customers": len(customers)})
+        assert sum(event == "curve" for event, _ in events) == 7
+        assert client.get('/survival-curve/stream?date=2999-04-02').status_code == 404
+    finally:
+        get_db().survival_curves.delete_many({"timestamp": day})
+
+def test_risk_factor_stream_matches_json(client, customers, monkeypatch):
+    scorer = fit_scorer(customers, survival_routes.COX_FEATURES, summary=True)
+    monkeypatch.setattr(survival_routes, "get_cox_scorer", lambda: scorer)
+    events = parse_events(client.get('/risk-factors/stream').get_data(as_text=True))
+    names = [event for event, _ in events]
+    assert names[0] == "meta" and names[-3:] == ["confidence_intervals", "model", "done"]
+
+    expected = client.get('/risk-factors').get_json()
+    assert [data for event, data in events if event == "factor"] == expected["risk_factors"]
+    assert events[-2][1]["model_summary"] == expected["model_summary"]
+    assert client.get('/risk-factors/stream?ci=jackknife').status_code == 400
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from datetime import datetime
+from lifelines import KaplanMeierFitter
+from db import get_db
+from routes import survival_routes
+from routes.survival_routes import compute_survival_curves, store_survival_curves, SURVIVAL_CURVE_SEGMENTS
+# This file tests the daily survival curve snapshots and how /survival-curve serves them
+
+@pytest.fixture(scope="module")
+def survival_frame(make_customers):
+    """Random customers, monthly contracts churning sooner"""
+    return make_customers(seed=5, effects={"Contract_Monthly": 1.5})
+
+@pytest.fixture
+def curve_snapshots(app, monkeypatch):
+    """Two stored days after any real one, removed again after the test"""
+    db = get_db()
+    days = [datetime(2999, 3, 1), datetime(2999, 3, 2)]
+    db.survival_curves.delete_many({"timestamp": {"$in": days}})
+    monkeypatch.setitem(survival_routes._curve_cache, "response", None)
+    yield db, days
+    db.survival_curves.delete_many({"timestamp": {"$in": days}})
+
+def test_curves_match_lifelines(survival_frame):
+    """Stored curves are the lifelines Kaplan Meier estimates, rounded."""
+    result = compute_survival_curves(survival_frame)
+    assert set(result["curves"]) == {"overall", *SURVIVAL_CURVE_SEGMENTS}
+    kmf = KaplanMeierFitter().fit(survival_frame["tenure"], survival_frame["event"])
+    overall = result["curves"]["overall"]
+    assert overall["timeline"] == kmf.timeline.tolist()
+    assert np.allclose(overall["survival_prob"], kmf.survival_function_.values.flatten(), atol=1e-6)
+    assert result["statistical_insights"]["p_value"] < 0.05
+
+def test_endpoint_serves_latest_and_dated_snapshots(client, survival_frame, curve_snapshots):
+    db, (first_day, second_day) = curve_snapshots
+    store_survival_curves(db, first_day, survival_frame.head(200))
+    stored = store_survival_curves(db, second_day, survival_frame)
+
+    response = client.get('/survival-curve')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["source"] == "snapshot" and body["snapshot_date"] == "2999-03-02"
+    assert body["curves"]["overall"] == stored["curves"]["overall"]
+
+    response = client.get('/survival-curve?date=2999-03-01')
+    assert response.get_json()["customers"] == 200
+    assert client.get('/survival-curve?date=2999-03-05').status_code == 404
+    assert client.get('/survival-curve?date=March').status_code == 400
@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+from lifelines import CoxPHFitter
+from survival_model import CoxScorer, RiskIndex, model_summary
+from routes import survival_routes
+# This file tests the NumPy Cox scorer against lifelines
+
+@pytest.fixture(scope="module")
+def fitted(make_customers):
+    """A Cox model fitted on random customers, with a strong effect so some medians aren't reached"""
+    df = make_customers(seed=7, effects={"Contract_Monthly": 1.5, "MonthlyCharges": 0.01})
+    df = df[["Contract_Monthly", "MonthlyCharges", "SeniorCitizen", "tenure", "event"]]
+    cph = CoxPHFitter().fit(df, duration_col="tenure", event_col="event")
+    return cph, df.drop(columns=["tenure", "event"])
+
+def test_survival_matches_lifelines(fitted):
+    cph, X = fitted
+    scorer = CoxScorer.from_fitter(cph)
+    expected = cph.predict_survival_function(X)
+    np.testing.assert_allclose(scorer.timeline, expected.index.values)
+    np.testing.assert_allclose(scorer.survival(X), expected.values.T, rtol=1e-10, atol=1e-12)
+
+def test_median_matches_lifelines(fitted):
+    """Medians agree, including customers whose survival never drops to 0.5."""
+    cph, X = fitted
+    medians = CoxScorer.from_fitter(cph).median(X)
+    expected = cph.predict_median(X).values
+    assert np.isinf(medians).any() and np.isfinite(medians).any()
+    np.testing.assert_array_equal(medians, expected)
+
+def test_input_forms_and_round_trip(fitted):
+    """DataFrames, feature dicts and arrays score the same, also after to_dict."""
+    cph, X = fitted
+    scorer = CoxScorer.from_fitter(cph)
+    restored = CoxScorer.from_dict(scorer.to_dict())
+    rows = X.head(3)
+    expected = scorer.survival(rows)
+    np.testing.assert_allclose(restored.survival(rows.to_dict("records")), expected)
+    np.testing.assert_allclose(restored.survival(rows[scorer.features].values), expected)
+
+    clv = scorer.clv(X, X["MonthlyCharges"])
+    medians = scorer.median(X)
+    assert np.isnan(clv[np.isinf(medians)]).all()
+    np.testing.assert_allclose(clv[np.isfinite(medians)], (X["MonthlyCharges"] * medians)[np.isfinite(medians)])
+
+def test_model_summary_matches_lifelines(fitted):
+    cph, X = fitted
+    summary = CoxScorer.from_dict(CoxScorer.from_fitter(cph, summary=True).to_dict()).summary
+    assert summary == model_summary(cph)
+    for feature, row in cph.summary.iterrows():
+        assert summary["coefficients"][feature] == {"coef": row["coef"], "se": row["se(coef)"], "p": row["p"]}
+    assert summary["concordance_index"] == cph.concordance_index_
+    assert summary["observations"] == len(X)
+    assert CoxScorer.from_fitter(cph).summary is None
+
+def test_no_fit_until_a_model_is_published(client, monkeypatch, fitted):
+    """Without a published model the survival endpoints answer 503 instead of fitting in the request."""
+    monkeypatch.setattr(survival_routes.model_registry, "published_model_id", lambda db: None)
+    monkeypatch.setitem(survival_routes._scorer_cache, "scorer", None)
+    monkeypatch.setitem(survival_routes._scorer_cache, "model_id", None)
+    response = client.post('/survival-prediction', json={"gender": "Male", "MonthlyCharges": 50})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(survival_routes.MODEL_RETRY_AFTER_SECONDS)
+    assert client.get('/risk-factors/stream').status_code == 503
+    assert client.get('/survival/risk-distribution').status_code == 503
+
+    # The published model is picked up on the next request, without waiting for the check interval
+    scorer = CoxScorer.from_fitter(fitted[0])
+    monkeypatch.setattr(survival_routes.model_registry, "published_model_id", lambda db: "published")
+    monkeypatch.setattr(survival_routes.model_registry, "load_scorer", lambda db, model_id: scorer)
+    assert survival_routes.get_cox_scorer() is scorer
+    assert survival_routes.get_cox_scorer() is scorer
+
+def test_survival_at_is_a_step_function(fitted):
+    """Between timeline points survival stays at the last point, before the first it is 1."""
+    scorer = CoxScorer.from_fitter(fitted[0])
+    rows = fitted[1].head(5)
+    curves = scorer.survival(rows)
+    np.testing.assert_allclose(scorer.survival_at(rows, scorer.timeline), curves)
+    np.testing.assert_allclose(scorer.survival_at(rows, scorer.timeline[:3] + 0.5), curves[:, :3])
+    np.testing.assert_array_equal(scorer.survival_at(rows, [scorer.timeline[0] - 0.5]), 1.0)
+
+def test_batch_prediction(client, db_with_test_data, monkeypatch, fitted):
+    """Posted customers and looked up customerIDs share one timeline, in request order."""
+    scorer = CoxScorer.from_fitter(fitted[0])
+    monkeypatch.setattr(survival_routes, "get_cox_scorer", lambda: scorer)
+    customers = [{"Contract": "Month-to-month", "MonthlyCharges": 90}, {"Contract": "Two year", "MonthlyCharges": 20}]
+
+    response = client.post('/survival-prediction/batch', json={"customers": customers})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert len(data["timeline"]) == len(scorer.timeline)
+    expected = scorer.survival([survival_routes.customer_features(customer) for customer in customers])
+    np.testing.assert_allclose([p["survival_probabilities"] for p in data["predictions"]], expected)
+
+    response = client.post('/survival-prediction/batch',
+                           json={"customerIDs": ["TEST-1001", "TEST-MISSING"], "summary_only": True})
+    data = response.get_json()
+    assert data["not_found"] == ["TEST-MISSING"]
+    assert [p["customerID"] for p in data["predictions"]] == ["TEST-1001"]
+    assert "timeline" not in data and len(data["predictions"][0]["survival_at"]) == len(data["horizons"])
+
+def test_batch_prediction_validation(client, monkeypatch):
+    monkeypatch.setattr(survival_routes, "BATCH_LIMIT", 2)
+    assert client.post('/survival-prediction/batch', json={"customers": [{}, {}, {}]}).status_code == 400
+    assert client.post('/survival-prediction/batch', json={"customers": [{}], "customerIDs": ["A"]}).status_code == 400
+    assert client.post('/survival-prediction/batch', json={"customers": [{"MonthlyCharges": "lots"}]}).status_code == 400
+
+def test_risk_index():
+    """Percentiles, histogram and quantiles agree with a scan of the values."""
+    values = np.random.default_rng(3).lognormal(0, 1, 1000)
+    index = RiskIndex(values)
+    probes = np.array([values[0], values.min() / 2, values.max(), np.median(values)])
+    expected = [(values <= probe).mean() * 100 for probe in probes]
+    np.testing.assert_allclose(index.percentile(probes), expected)
+
+    edges, counts = index.histogram(10)
+    assert counts.sum() == len(values)
+    np.testing.assert_array_equal(counts, np.histogram(values, edges)[0])
+    np.testing.assert_allclose(index.quantiles([0.1, 0.5]), np.quantile(values, [0.1, 0.5]))
+
+def test_risk_distribution_endpoints(client, monkeypatch, fitted):
+    """The risk index of the fit powers percentiles, the histogram and quantiles."""
+    cph, X = fitted
+    scorer = CoxScorer.from_dict(CoxScorer.from_fitter(cph, training_data=X).to_dict())
+    assert len(scorer.risk_index) == len(X)
+    monkeypatch.setattr(survival_routes, "get_cox_scorer", lambda: scorer)
+
+    histogram = client.get('/survival/risk-distribution?bins=8').get_json()
+    assert len(histogram["bins"]) == 8
+    assert sum(row["count"] for row in histogram["bins"]) == len(X)
+    assert histogram["bins"][-1]["cumulative_percent"] == 100
+
+    quantiles = client.get('/survival/risk-distribution/quantiles?q=0.5').get_json()
+    median_hazard = quantiles["quantiles"][0]["partial_hazard"]
+    assert median_hazard == pytest.approx(np.median(scorer.partial_hazard(X)))
+    assert client.get('/survival/risk-distribution/quantiles?q=2').status_code == 400
+
+    customers = [{"Contract": "Month-to-month", "MonthlyCharges": 110}, {"Contract": "Two year", "MonthlyCharges": 20}]
+    response = client.post('/survival-prediction/batch', json={"customers": customers})
+    percentiles = [p["risk_percentile"] for p in response.get_json()["predictions"]]
+    rows = [survival_routes.customer_features(customer) for customer in customers]
+    np.testing.assert_allclose(percentiles, np.round(scorer.risk_percentile(rows), 1))
+    assert percentiles[0] > percentiles[1]
@@ -0,0 +1,57 @@
+import os
+from datetime import date
+import numpy as np
+import pandas as pd
+import pytest
+from customer_schema import validate_customer
+from synthetic_customers import CustomerModel, DEFAULT_CSV_PATH, customer_ids, generate_batch, iter_customers
+# This file tests the synthetic customer generator used for scale testing
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), '..', DEFAULT_CSV_PATH)
+
+@pytest.fixture(scope="module")
+def model():
+    return CustomerModel.from_csv(CSV_PATH)
+
+def test_customer_ids_are_unique():
+    """Consecutive indexes and the ID space boundaries give distinct IDs in the CSV format."""
+    ids = customer_ids(np.arange(0, 300000))
+    assert len(set(ids)) == len(ids)
+    assert ids[0] == "0000-AAAAA"
+    assert customer_ids([10000])[0] == "0000-AAAAB"
+    with pytest.raises(ValueError):
+        customer_ids([-1])
+
+def test_generated_customers_match_the_schema(model):
+    """Every generated customer passes the API validation."""
+    batch = generate_batch(model, seed=1, number=0, first_index=0, size=500, as_of=date(2025, 1, 1))
+    for customer in batch.to_dict('records'):
+        validate_customer(customer)
+        joined = date.fromisoformat(customer["join_date"])
+        assert (date(2025, 1, 1) - joined).days // 30 == customer["tenure"]
+
+def test_generation_is_reproducible(model):
+    """The same seed and batch size give the same customers, and batches never reuse an ID."""
+    whole = generate_batch(model, seed=7, number=0, first_index=0, size=1000, as_of=date(2025, 1, 1))
+    again = generate_batch(model, seed=7, number=0, first_index=0, size=1000, as_of=date(2025, 1, 1))
+    pd.testing.assert_frame_equal(whole, again)
+
+    batches = list(iter_customers(model, 1000, batch_size=300, seed=7, as_of=date(2025, 1, 1)))
+    assert [len(batch) for batch in batches] == [300, 300, 300, 100]
+    combined = pd.concat(batches, ignore_index=True)
+    assert combined["customerID"].is_unique
+
+def test_distributions_follow_the_csv(model):
+    """Churn rates per contract and the tenure distribution stay close to the source data."""
+    real = pd.read_csv(CSV_PATH)
+    synthetic = generate_batch(model, seed=3, number=0, first_index=0, size=50000)
+
+    real_churn = real.groupby("Contract")["Churn"].apply(lambda churn: (churn == "Yes").mean())
+    synthetic_churn = synthetic.groupby("Contract")["Churn"].apply(lambda churn: (churn == "Yes").mean())
+    assert np.allclose(real_churn.sort_index(), synthetic_churn.sort_index(), atol=0.02)
+
+    # Churned customers have much shorter tenure, the generator has to keep that
+    real_tenure = real.groupby("Churn")["tenure"].mean()
+    synthetic_tenure = synthetic.groupby("Churn")["tenure"].mean()
+    assert np.allclose(real_tenure.sort_index(), synthetic_tenure.sort_index(), atol=1.5)
+    assert abs(real["MonthlyCharges"].mean() - synthetic["MonthlyCharges"].mean()) < 1.5
@@ -0,0 +1,66 @@
+import json
+import pytest
+import tracing
+from routes import survival_routes
+from tracing import Trace, span, record_span, current_trace, current_span
+# This file tests request tracing and the JSON lines exporter
+
+@pytest.fixture
+def exported(tmp_path, monkeypatch):
+    """Export every trace to a temporary file"""
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "exporter", tracing.JsonLinesExporter(str(path)))
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 1.0)
+
+    def read():
+        return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+    return read
+
+def test_spans_nest():
+    """Spans record their parent, spans outside a trace are ignored."""
+    with span("outside") as outside:
+        assert outside is None
+
+    trace = Trace("trace-1")
+    trace_token = current_trace.set(trace)
+    try:
+        with span("outer", rows=3):
+            with span("inner"):
+                record_span("mongo.find", 0.002, collection="users")
+    finally:
+        current_trace.reset(trace_token)
+
+    spans = {span["name"]: span for span in trace.to_dict()["spans"]}
+    assert spans["outer"]["parent_id"] is None
+    assert spans["outer"]["attributes"] == {"rows": 3}
+    assert spans["inner"]["parent_id"] == spans["outer"]["span_id"]
+    assert spans["mongo.find"]["parent_id"] == spans["inner"]["span_id"]
+    assert spans["mongo.find"]["duration_ms"] == pytest.approx(2, abs=0.5)
+
+def test_request_trace_is_exported(client, exported, monkeypatch):
+    """The trace id is the request id and the survival stages are spans."""
+    # Computed from the current customers instead of the stored curves
+    monkeypatch.setitem(survival_routes._curve_cache, "response", None)
+    response = client.get('/survival-curve?live=true')
+    assert response.headers['X-Trace-Sampled'] == '1'
+
+    trace = exported()[-1]
+    assert trace["trace_id"] == response.headers['X-Request-ID']
+    assert trace["endpoint"] == "survival_bp.get_survival_curve"
+    names = [span["name"] for span in trace["spans"]]
+    assert names[0] == "request"
+    assert "load_customers" in names
+    assert "encode_features" in names
+
+def test_unsampled_fast_requests_are_not_exported(client, exported, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 0.0)
+    response = client.get('/analytics')
+    assert 'X-Trace-Sampled' not in response.headers
+    assert exported() == []
+
+def test_export_is_off_without_a_path(client, monkeypatch):
+    monkeypatch.setattr(tracing, "exporter", None)
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_RATE", 1.0)
+    response = client.get('/analytics')
+    assert 'X-Trace-Sampled' not in response.headers
+    assert response.headers['X-Request-ID']
@@ -0,0 +1,202 @@
+"""
+Lightweight request tracing.
+Every request is a trace identified by its request id (see request_context,
+returned in the X-Request-ID header). Code marks its stages with nested spans:
+
+    with span("cox.fit", rows=len(df)):
+        cph.fit(...)
+
+and every MongoDB command becomes a span of its own through TracingCommandListener.
+Spans are cheap (two perf_counter calls and a list append), so every request
+is traced and the decision to keep it is taken at the end: a fraction
+TRACE_SAMPLE_RATE of the requests, and every request slower than TRACE_SLOW_MS,
+is appended as one JSON line to TRACE_EXPORT_PATH. Export is off until
+TRACE_EXPORT_PATH is set. The file is opened for every trace, so it can be
+rotated by renaming it (e.g. logrotate) without restarting the workers.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from flask import request
+from pymongo import monitoring
+from request_context import current_request_id
+
+logger = logging.getLogger(__name__)
+
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 0.1))
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", 1000))
+# No default, an unset path keeps traces from piling up in the working directory
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH")
+
+current_trace = ContextVar('current_trace', default=None)
+current_span = ContextVar('current_span', default=None)
+
+class Span:
+    __slots__ = ("span_id", "parent_id", "name", "start", "end", "attributes")
+
+    def __init__(self, span_id, parent_id, name, start, attributes):
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.start = start
+        self.end = None
+        self.attributes = attributes
+
+class Trace:
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.next_id = 0
+        # Mongo commands of threads started by the request end up here too
+        self.lock = threading.Lock()
+
+    def new_span(self, name, start, attributes):
+        parent = current_span.get()
+        with self.lock:
+            self.next_id += 1
+            span_id = self.next_id
+        return Span(span_id, parent.span_id if parent else None, name, start, attributes)
+
+    def add(self, span):
+        with self.lock:
+            self.spans.append(span)
+
+    def to_dict(self, **fields):
+        duration = time.perf_counter() - self.start
+        return {
+            "trace_id": self.trace_id,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(duration * 1000, 3),
+            **fields,
+            "spans": [
+                {
+                    "span_id": span.span_id,
+                    "parent_id": span.parent_id,
+                    "name": span.name,
+                    "start_ms": round((span.start - self.start) * 1000, 3),
+                    "duration_ms": round(((span.end or time.perf_counter()) - span.start) * 1000, 3),
+                    **({"attributes": span.attributes} if span.attributes else {})
+                }
+                for span in sorted(self.spans, key=lambda span: span.start)
+            ]
+        }
+
+@contextmanager
+def span(name, **attributes):
+    """Time the block as a child of the current span, does nothing outside a trace"""
+    trace = current_trace.get()
+    if trace is None:
+        yield None
+        return
+    new_span = trace.new_span(name, time.perf_counter(), attributes)
+    token = current_span.set(new_span)
+    try:
+        yield new_span
+    finally:
+        new_span.end = time.perf_counter()
+        current_span.reset(token)
+        trace.add(new_span)
+
+def record_span(name, duration, **attributes):
+    """Add a span that already finished, e.g. from a pymongo event with its duration"""
+    trace = current_trace.get()
+    if trace is None:
+        return
+    end = time.perf_counter()
+    finished = trace.new_span(name, end - duration, attributes)
+    finished.end = end
+    trace.add(finished)
+
+class TracingCommandListener(monitoring.CommandListener):
+    """Adds every MongoDB command of a traced request as a span"""
+
+    IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions"}
+
+    def __init__(self):
+        self.collections = {}
+        self.lock = threading.Lock()
+
+    def started(self, event):
+        if event.command_name in self.IGNORED_COMMANDS or current_trace.get() is None:
+            return
+        collection = event.command.get(event.command_name)
+        with self.lock:
+            self.collections[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else None
+
+    def finish(self, event, outcome):
+        with self.lock:
+            key = (event.connection_id, event.request_id)
+            if key not in self.collections:
+                return
+            collection = self.collections.pop(key)
+        record_span(f"mongo.{event.command_name}", event.duration_micros / 1e6, collection=collection, outcome=outcome)
+
+    def succeeded(self, event):
+        self.finish(event, "success")
+
+    def failed(self, event):
+        self.finish(event, "failure")
+
+class JsonLinesExporter:
+    """Appends one JSON document per trace to a file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, document):
+        line = json.dumps(document, default=str) + "\n"
+        with self.lock:
+            # One write per trace in append mode, so the workers of a deployment can share the file
+            with open(self.path, "a") as f:
+                f.write(line)
+
+exporter = JsonLinesExporter(TRACE_EXPORT_PATH) if TRACE_EXPORT_PATH else None
+
+def should_export(duration_ms):
+    return duration_ms >= TRACE_SLOW_MS or random.random() < TRACE_SAMPLE_RATE
+
+def init_app(app):
+    """Trace every request and export the sampled and the slow ones"""
+
+    @app.before_request
+    def start_trace():
+        trace = Trace(current_request_id())
+        current_trace.set(trace)
+        current_span.set(trace.new_span("request", trace.start, {}))
+
+    @app.after_request
+    def finish_trace(response):
+        trace = current_trace.get()
+        if trace is None:
+            return response
+        current_trace.set(None)
+        root = current_span.get()
+        current_span.set(None)
+
+        root.end = time.perf_counter()
+        root.attributes = {"endpoint": request.endpoint, "status": response.status_code}
+        trace.add(root)
+
+        document = trace.to_dict(method=request.method, path=request.path,
+                                 endpoint=request.endpoint, status=response.status_code)
+        if exporter is not None and should_export(document["duration_ms"]):
+            try:
+                exporter.export(document)
+                response.headers['X-Trace-Sampled'] = '1'
+            except OSError as e:
+                logger.warning(f"Could not export trace {trace.trace_id}: {e}")
+        return response
+
+    @app.teardown_request
+    def clear_trace(error=None):
+        current_trace.set(None)
+        current_span.set(None)
@@ -1,5 +1,5 @@
 import React, { useEffect, useState, useCallback } from 'react';
-import { getSurvivalCurves, getRiskFactors} from '../../services/api.js';
+import { streamSurvivalEvents } from '../../services/api.js';
 import { Line } from 'react-chartjs-2';
 import { BarChart, Bar, XAxis, YAxis, Tooltip, Legend, ResponsiveContainer, Cell } from 'recharts';
 import LoadingSpinner from '../../components/LoadingSpinner/LoadingSpinner.jsx';
@@ -58,28 +58,43 @@ const SurvivalAnalysis = () => {
     setLoadingMessage("Preparing survival analysis...");
     setLoadingProgress(10);
     
-    // Use separate promises to catch individual failures
-    const fetchSurvivalCurves = getSurvivalCurves(forceRefresh)
-      .then(response => {
-        setSurvivalCurves(response.curves);
-        setLoadingProgress(prev => prev + 40);
-        return response;
-      })
+    // Start from empty charts, every streamed curve and factor is added as it arrives
+    setSurvivalCurves(null);
+    setRiskFactors(null);
+    
+    // Show the page with the first chart, the remaining curves and factors fill in as they stream
+    const showFirstChart = () => setLoading(false);
+    
+    // Use separate streams to catch individual failures
+    // A refresh asks for curves of the current customers instead of the latest daily snapshot
+    const fetchSurvivalCurves = streamSurvivalEvents('/survival-curve/stream', (event, data) => {
+      if (event === 'meta') {
+        setLoadingMessage(`Fitting survival curves for ${data.customers} customers...`);
+      } else if (event === 'curve') {
+        const { segment, ...curve } = data;
+        setSurvivalCurves(prev => ({ ...(prev || {}), [segment]: curve }));
+        setLoadingProgress(prev => Math.min(prev + 5, 95));
+        showFirstChart();
+      }
+    }, forceRefresh ? { live: 'true' } : {})
       .catch(err => {
         console.error('Error fetching survival curves:', err);
-        setLoadingProgress(prev => prev + 20);
         return Promise.reject(err);
       });
     
-    const fetchRiskFactors = getRiskFactors(forceRefresh)
-      .then(response => {
-        setRiskFactors(response);
-        setLoadingProgress(prev => prev + 40);
-        return response;
-      })
+    const fetchRiskFactors = streamSurvivalEvents('/risk-factors/stream', (event, data) => {
+      if (event === 'factor') {
+        setRiskFactors(prev => ({ ...(prev || {}), risk_factors: [...(prev?.risk_factors || []), data] }));
+        showFirstChart();
+      } else if (event === 'confidence_intervals') {
+        setRiskFactors(prev => ({ ...(prev || {}), confidence_intervals: data }));
+      } else if (event === 'model') {
+        // model_metrics and model_summary
+        setRiskFactors(prev => ({ ...(prev || {}), ...data }));
+      }
+    })
       .catch(err => {
         console.error('Error fetching risk factors:', err);
-        setLoadingProgress(prev => prev + 20);
         return Promise.reject(err);
       });
     
@@ -289,8 +289,9 @@ export const getAnalytics = async (year = null, forceRefresh = false) => {
 };
 
 // Improved survival analysis API functions with caching
-export const getSurvivalCurves = async (forceRefresh = false) => {
-  const cacheKey = 'survival_curves';
+// date - 'YYYY-MM-DD' for the curves stored that day, latest stored curves otherwise
+export const getSurvivalCurves = async (forceRefresh = false, date = null) => {
+  const cacheKey = `survival_curves${date ? `-${date}` : ''}`;
   
   // Return cached data if available and not forcing refresh
   if (!forceRefresh) {
@@ -316,7 +317,7 @@ export const getSurvivalCurves = async (forceRefresh = false) => {
           }
         });
         
-        const response = await customApi.get('/survival-curve');
+        const response = await customApi.get('/survival-curve', { params: date ? { date } : {} });
         return apiCache.set(cacheKey, response.data);
       } catch (error) {
         attempts++;
@@ -332,8 +333,31 @@ export const getSurvivalCurves = async (forceRefresh = false) => {
   }
 };
 
-export const getRiskFactors = async (forceRefresh = false) => {
-  const cacheKey = 'risk_factors';
+// Days with stored survival curves, newest first
+export const getSurvivalCurveDates = async () => {
+  try {
+    const response = await api.get('/survival-curve/dates');
+    return response.data.dates;
+  } catch (error) {
+    console.error('Error fetching survival curve dates:', error);
+    throw error;
+  }
+};
+
+// Pairwise log-rank tests between the segments of a column, e.g. 'Contract' or 'PaymentMethod'
+export const getLogrankMatrix = async (by = 'Contract', correction = 'holm') => {
+  try {
+    const response = await api.get('/survival/logrank-matrix', { params: { by, correction } });
+    return response.data;
+  } catch (error) {
+    console.error('Error fetching log-rank matrix:', error);
+    throw error;
+  }
+};
+
+// ciMethod - 'bootstrap' for bootstrap intervals once the backend has computed them
+export const getRiskFactors = async (forceRefresh = false, ciMethod = 'asymptotic') => {
+  const cacheKey = `risk_factors_${ciMethod}`;
   
   // Return cached data if available and not forcing refresh
   if (!forceRefresh) {
@@ -342,7 +366,7 @@ export const getRiskFactors = async (forceRefresh = false) => {
   }
   
   try {
-    const response = await longRunningApi.get('/risk-factors');
+    const response = await longRunningApi.get('/risk-factors', { params: { ci: ciMethod } });
     return apiCache.set(cacheKey, response.data);
   } catch (error) {
     console.error('Error fetching risk factors:', error);
@@ -350,6 +374,48 @@ export const getRiskFactors = async (forceRefresh = false) => {
   }
 };
 
+// Stream the Server-Sent Events of '/survival-curve/stream' or '/risk-factors/stream',
+// calling onEvent(event, data) for each curve, test or model row as soon as it arrives.
+// Uses fetch rather than EventSource, which cannot send the Authorization header
+export const streamSurvivalEvents = async (path, onEvent, params = {}) => {
+  const query = new URLSearchParams(params).toString();
+  const token = localStorage.getItem('authToken');
+  const response = await fetch(`${apiBaseURL}${path}${query ? `?${query}` : ''}`, {
+    headers: token ? { Authorization: `Bearer ${token}` } : {}
+  });
+  if (!response.ok) {
+    throw new Error(`Streaming ${path} failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) return;
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events end with a blank line
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = 'message';
+      const data = [];
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data.push(line.slice(5).trim());
+      }
+      // Comment lines carry no data
+      if (!data.length) continue;
+      const payload = JSON.parse(data.join('\n'));
+      if (event === 'error') throw new Error(payload.error);
+      if (event === 'done') return;
+      onEvent(event, payload);
+    }
+  }
+};
+
 // Fumction to predict customer survival
 export const predictCustomerSurvival = async (customerData) => {
   try {
@@ -361,6 +427,20 @@ export const predictCustomerSurvival = async (customerData) => {
   }
 };
 
+// Function to predict survival for many customers (or scenarios) in one request
+// Pass customer objects, or { customerIDs } to predict stored customers
+export const predictSurvivalBatch = async (customers, summaryOnly = false) => {
+  try {
+    const body = Array.isArray(customers) ? { customers } : { ...customers };
+    body.summary_only = summaryOnly;
+    const response = await longRunningApi.post('/survival-prediction/batch', body);
+    return response.data;
+  } catch (error) {
+    console.error('Error predicting survival batch:', error);
+    throw error;
+  }
+};
+
 // Function to clear cache when data changes
 export const clearCache = (key = null) => {
   apiCache.clear(key);
@@ -386,6 +466,22 @@ export const getHistoricalAnalytics = async (startDate, endDate, page = 1, perPa
   }
 };
 
+// Fetch selected historical metrics as columnar arrays for charting
+// metrics - array of dotted paths, e.g. ['churn_by_contract.Month-to-month', 'revenue.monthly']
+export const getHistoricalSeries = async (metrics, startDate, endDate) => {
+  try {
+    const params = { metrics: metrics.join(',') };
+    if (startDate) params.start = startDate;
+    if (endDate) params.end = endDate;
+
+    const response = await api.get('/historical-analytics/series', { params });
+    return response.data;
+  } catch (error) {
+    console.error('Error fetching historical series:', error);
+    throw error;
+  }
+};
+
 // Function to download historical analytics as CSV file
 export const downloadHistoricalAnalyticsCSV = async (startDate, endDate) => {
   try {
@@ -1,32 +1,61 @@
 // Web Worker for survival prediction calculations
 
+const apiBaseURL = import.meta.env.VITE_API_URL || 'http://localhost:5001';
+
 /**
- * Make API request to get survival prediction
- * @param {Object} data - Customer data for prediction
- * @return {Promise} - API response with prediction results
+ * Customer fields the backend expects, from the form fields of a scenario
+ * @param {Object} scenario - Scenario form data (contract, monthlyCharges, internetService)
+ * @return {Object} - Customer in the backend's field names
+ */
+function toCustomer(scenario) {
+  return {
+    ...scenario,
+    Contract: scenario.Contract || scenario.contract,
+    MonthlyCharges: parseFloat(scenario.MonthlyCharges ?? scenario.monthlyCharges) || 0,
+    InternetService: scenario.InternetService || scenario.internetService
+  };
+}
+
+/**
+ * Make one API request for the survival predictions of every scenario
+ * @param {Array} scenarios - Customer data of each scenario
+ * @return {Promise} - Prediction results, in the order of the scenarios
  */
 
-// API-based prediction function
-async function getSurvivalPrediction(data) {
+// API-based prediction function, all scenarios in one batch request
+async function getSurvivalPredictions(scenarios) {
   try {
-    const apiUrl = 'http://localhost:5001/survival-prediction';
-    const response = await fetch(apiUrl, {
+    const response = await fetch(`${apiBaseURL}/survival-prediction/batch`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json'
       },
-      body: JSON.stringify(data)
+      // Survival at the summary horizons is enough for the churn risks
+      body: JSON.stringify({ customers: scenarios.map(toCustomer), summary_only: true })
     });
     
     if (!response.ok) {
       throw new Error(`API error: ${response.status}`);
     }
     
-    return await response.json();
+    const { predictions, horizons } = await response.json();
+    const churnBy = (prediction, months) => {
+      const index = horizons.indexOf(months);
+      return index === -1 ? null : 1 - prediction.survival_at[index];
+    };
+    return predictions.map(prediction => ({
+      medianSurvival: prediction.median_survival_time === null ? null : Math.round(prediction.median_survival_time),
+      lifetimeValue: prediction.customer_lifetime_value === null ? null : Math.round(prediction.customer_lifetime_value),
+      riskPercentile: prediction.risk_percentile,
+      churnRisk: {
+        sixMonth: churnBy(prediction, 6),
+        oneYear: churnBy(prediction, 12)
+      }
+    }));
   } catch (error) {
     console.error('API request failed:', error);
     // Fall back to simplified model
-    return simplifiedPredictionModel(data);
+    return scenarios.map(simplifiedPredictionModel);
   }
 }
 
@@ -91,23 +120,25 @@ function simplifiedPredictionModel(data) {
 }
 
 // Handle incoming messages from main thread
+// A message is one scenario or an array of scenarios, the reply has the same shape
 self.onmessage = async (event) => {
   try {
     console.log('Worker received message:', event.data);
-    const customerData = event.data;
+    const single = !Array.isArray(event.data);
+    const scenarios = single ? [event.data] : event.data;
     
-    // First try the API for predictions
+    // First try the API for predictions, one request for every scenario
     let results;
     try {
-      results = await getSurvivalPrediction(customerData);
+      results = await getSurvivalPredictions(scenarios);
     } catch {
       // If API call fails, use the simplified model
       console.log('Using simplified model due to API failure');
-      results = simplifiedPredictionModel(customerData);
+      results = scenarios.map(simplifiedPredictionModel);
     }
     
     // Send result back to main thread
-    self.postMessage(results);
+    self.postMessage(single ? results[0] : results);
   } catch (error) {
     // Handle errors
     console.error('Worker processing error:', error);